@@ -21,6 +21,62 @@ class Config:
     PROCESSED_FOLDER = os.path.join(UPLOAD_FOLDER, 'processed')
     THUMBNAILS_FOLDER = os.path.join(UPLOAD_FOLDER, 'thumbnails')
     COLLAGES_FOLDER = os.path.join(UPLOAD_FOLDER, 'collages')
+    DERIVATIVES_FOLDER = os.path.join(UPLOAD_FOLDER, 'derivatives')  # resized /api/images variants
+    PREVIEWS_FOLDER = os.path.join(UPLOAD_FOLDER, 'previews')  # short-lived sticker/face-debug previews
+
+    # Collage rendering
+    # Optional PNG disk tier for pre-rendered template backgrounds ('' = memory only)
+    TEMPLATE_BACKGROUND_CACHE_DIR = os.getenv('TEMPLATE_BACKGROUND_CACHE_DIR', '')
+    # Default collage encoding (requests may override): png | jpeg | webp
+    COLLAGE_FORMAT = os.getenv('COLLAGE_FORMAT', 'png')
+    COLLAGE_QUALITY = int(os.getenv('COLLAGE_QUALITY', 90))  # JPEG / lossy WebP
+    COLLAGE_JPEG_PROGRESSIVE = os.getenv('COLLAGE_JPEG_PROGRESSIVE', 'true').lower() == 'true'
+    COLLAGE_WEBP_LOSSLESS = os.getenv('COLLAGE_WEBP_LOSSLESS', 'false').lower() == 'true'
+    COLLAGE_PNG_COMPRESS_LEVEL = int(os.getenv('COLLAGE_PNG_COMPRESS_LEVEL', 6))  # 0 fastest .. 9 smallest
+    # Print rendering (output dpi/scale): rows per band and largest accepted output
+    COLLAGE_PRINT_BAND_HEIGHT = int(os.getenv('COLLAGE_PRINT_BAND_HEIGHT', 256))
+    COLLAGE_PRINT_MAX_PIXELS = int(os.getenv('COLLAGE_PRINT_MAX_PIXELS', 150_000_000))
+    # Rendered collages are reused for identical inputs; limits for the collages folder
+    COLLAGE_CACHE_MAX_FILES = int(os.getenv('COLLAGE_CACHE_MAX_FILES', 500))
+    COLLAGE_CACHE_TTL_SECONDS = int(os.getenv('COLLAGE_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    # Background collage jobs (/api/collage/jobs)
+    COLLAGE_WORKERS = int(os.getenv('COLLAGE_WORKERS', 2))
+    COLLAGE_QUEUE_SIZE = int(os.getenv('COLLAGE_QUEUE_SIZE', 8))  # waiting jobs before 429
+    COLLAGE_JOB_TTL_SECONDS = int(os.getenv('COLLAGE_JOB_TTL_SECONDS', 3600))
+    COLLAGE_JOBS_FOLDER = os.path.join(COLLAGES_FOLDER, 'jobs')  # job records shared by all worker processes
+    COLLAGE_RETRY_AFTER = int(os.getenv('COLLAGE_RETRY_AFTER', 2))
+
+    # Capture derivatives (processed/thumbnail/slot) are generated in the background
+    CAPTURE_WORKERS = int(os.getenv('CAPTURE_WORKERS', 2))
+    CAPTURE_QUEUE_SIZE = int(os.getenv('CAPTURE_QUEUE_SIZE', 16))  # beyond this, captures render inline
+    CAPTURE_WAIT_SECONDS = float(os.getenv('CAPTURE_WAIT_SECONDS', 10))  # max wait for a pending derivative
+    CAPTURE_DETECT_FACES = os.getenv('CAPTURE_DETECT_FACES', 'false').lower() == 'true'
+    UPLOAD_MAX_DIMENSION = int(os.getenv('UPLOAD_MAX_DIMENSION', 8192))  # longest side of a capture/upload
+    UPLOAD_MAX_PIXELS = int(os.getenv('UPLOAD_MAX_PIXELS', 40_000_000))  # decompression bomb guard
+    JPEGTRAN_PATH = os.getenv('JPEGTRAN_PATH')  # lossless flip; default: jpegtran on PATH
+    STICKER_BATCH_WORKERS = int(os.getenv('STICKER_BATCH_WORKERS', 4))  # decode/encode threads of apply-sticker-session
+
+    # Preview images (/api/previews): lifetime and cleanup period
+    PREVIEW_TTL_SECONDS = int(os.getenv('PREVIEW_TTL_SECONDS', 300))
+    PREVIEW_GC_INTERVAL = int(os.getenv('PREVIEW_GC_INTERVAL', 60))
+
+    # /api/images caching and proxy offload
+    IMAGE_CACHE_MAX_AGE = int(os.getenv('IMAGE_CACHE_MAX_AGE', 365 * 24 * 3600))  # immutable responses
+    USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'  # Apache/lighttpd X-Sendfile
+    IMAGE_ACCEL_REDIRECT_PREFIX = os.getenv('IMAGE_ACCEL_REDIRECT_PREFIX')  # nginx internal location, e.g. /protected-uploads
+    IMAGE_DERIVATIVE_SIZES = [int(s) for s in os.getenv('IMAGE_DERIVATIVE_SIZES', '64,128,200,320,480,640,960,1280').split(',')]
+    IMAGE_DERIVATIVE_CACHE_BYTES = int(os.getenv('IMAGE_DERIVATIVE_CACHE_BYTES', 256 * 1024 * 1024))
+    IMAGE_NEGOTIATED_FORMATS = [f for f in os.getenv('IMAGE_NEGOTIATED_FORMATS', 'avif,webp').split(',') if f]  # Accept preference order
+    # Encoder quality per format, optionally per folder: "webp=80,avif=60,thumbnails.webp=70"
+    IMAGE_VARIANT_QUALITY = {k.strip(): int(v) for k, v in
+                             (item.split('=') for item in os.getenv('IMAGE_VARIANT_QUALITY', '').split(',') if item)}
+
+    # Face embeddings
+    EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 32))  # faces per FaceNet call
+    EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'auto')  # auto (ONNX if exported) | onnx | tensorflow
+    ONNX_INTRA_OP_THREADS = int(os.getenv('ONNX_INTRA_OP_THREADS', 0))  # 0 = ONNX Runtime default
+    ONNX_INTER_OP_THREADS = int(os.getenv('ONNX_INTER_OP_THREADS', 0))
+    ONNX_GRAPH_OPTIMIZATION = os.getenv('ONNX_GRAPH_OPTIMIZATION', 'all')  # disable | basic | extended | all
 
 
 class DevelopmentConfig(Config):
@@ -0,0 +1,272 @@
+"""
+Sticker background removal with numpy/OpenCV mask operations.
+
+Shared by TemplateEngine (collage stickers) and the scripts in scripts/ so the
+algorithms only exist once. Every function works on whole arrays - there are
+no per-pixel Python loops.
+"""
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Dải xám (avg của R, G, B) của checkered background mà TemplateEngine dùng
+# Photoshop/GIMP checkered: ~128 (dark) và ~192-204 (light)
+CHECKERED_RANGES = [
+    (120, 170),  # Dark gray squares
+    (185, 215),  # Light gray squares
+    (100, 135),  # Very dark gray
+    (215, 250),  # Very light gray (near white)
+]
+
+# Dải rộng hơn dùng cho script xử lý file (xóa cả nền gần trắng)
+CHECKERED_RANGES_WIDE = [
+    (120, 170),  # Dark gray (typical checkered dark)
+    (180, 220),  # Light gray (typical checkered light)
+    (100, 140),  # Very dark gray
+    (210, 255),  # Very light (near white)
+]
+
+# Dải dùng để phát hiện checkered ở các góc ảnh
+DETECTION_RANGES = [
+    (125, 165),  # Dark gray range
+    (185, 215),  # Light gray range
+    (95, 135),   # Very dark gray
+    (215, 255),  # Very light gray (near white)
+]
+
+# Dải dùng cho flood fill từ các góc
+FLOOD_FILL_RANGES = [
+    (120, 170),
+    (180, 220),
+]
+
+
+def _to_rgba_array(image):
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    return np.array(image)
+
+
+def gray_checkered_mask(rgb, ranges, tolerance, inclusive=False):
+    """
+    Mask of gray pixels (R ≈ G ≈ B) whose average falls in one of the ranges.
+
+    Args:
+        rgb: HxWx3 (or HxWx4) uint8 array
+        ranges: list of (low, high) inclusive ranges for the channel average
+        tolerance: max channel difference for a pixel to count as gray
+        inclusive: if True, max difference == tolerance still counts as gray
+
+    Returns:
+        HxW bool array
+    """
+    channels = rgb[..., :3].astype(np.int16)
+    r, g, b = channels[..., 0], channels[..., 1], channels[..., 2]
+    max_diff = np.maximum(np.maximum(np.abs(r - g), np.abs(g - b)), np.abs(r - b))
+    is_gray = max_diff <= tolerance if inclusive else max_diff < tolerance
+
+    avg = (r + g + b) // 3
+    in_range = np.zeros(avg.shape, dtype=bool)
+    for low, high in ranges:
+        in_range |= (avg >= low) & (avg <= high)
+    return is_gray & in_range
+
+
+def remove_checkered_background(image, tolerance=20, ranges=CHECKERED_RANGES):
+    """
+    Xóa checkered background (ô vuông đen xám xen kẽ) khỏi ảnh.
+
+    Args:
+        image: PIL Image object
+        tolerance: Độ chênh lệch cho phép khi xác định màu xám
+        ranges: Các dải màu checkered
+
+    Returns:
+        PIL Image (RGBA): Ảnh với checkered background trong suốt
+    """
+    arr = _to_rgba_array(image)
+    arr[..., 3][gray_checkered_mask(arr, ranges, tolerance)] = 0
+    return Image.fromarray(arr, mode='RGBA')
+
+
+def clean_alpha_channel(image, alpha_threshold=10):
+    """
+    Loại bỏ các pixel có alpha thấp (nền mờ còn sót lại).
+
+    Args:
+        image: PIL Image object (RGBA)
+        alpha_threshold: Pixel có alpha < threshold sẽ thành trong suốt
+
+    Returns:
+        PIL Image: Ảnh đã được làm sạch
+    """
+    if image.mode != 'RGBA':
+        return image
+    arr = np.array(image)
+    alpha = arr[..., 3]
+    alpha[alpha < alpha_threshold] = 0
+    return Image.fromarray(arr, mode='RGBA')
+
+
+def remove_background_pillow(image):
+    """
+    Tách nền dựa trên màu sắc, phù hợp cho sticker có nền đồng nhất.
+
+    Pixel nền (thành (0, 0, 0, 0)):
+    1. Trong suốt hoặc gần trong suốt (a < 50)
+    2. Trắng/xám nhạt (R, G, B > 230)
+    3. Nâu/đỏ đặc trưng của nền sticker pixel art
+    4. Tối (R, G, B < 30) và bán trong suốt (a < 200)
+
+    Returns:
+        PIL Image (RGBA)
+    """
+    arr = _to_rgba_array(image)
+    r, g, b, a = arr[..., 0], arr[..., 1], arr[..., 2], arr[..., 3]
+
+    background = a < 50
+    background |= (r > 230) & (g > 230) & (b > 230)
+    background |= (r > 150) & (r < 220) & (g > 100) & (g < 180) & (b > 80) & (b < 150)
+    background |= (r < 30) & (g < 30) & (b < 30) & (a < 200)
+
+    arr[background] = 0
+    return Image.fromarray(arr, mode='RGBA')
+
+
+def detect_checkered_pattern(image, sample_size=20, threshold=0.6):
+    """
+    Phát hiện checkered background bằng cách phân tích 4 góc ảnh.
+
+    Returns:
+        bool: True nếu > threshold pixel không trong suốt ở các góc là checkered
+    """
+    arr = _to_rgba_array(image)
+    height, width = arr.shape[:2]
+
+    corners = np.concatenate([
+        arr[0:sample_size, 0:sample_size].reshape(-1, 4),                        # Top-left
+        arr[0:sample_size, max(0, width - sample_size):width].reshape(-1, 4),    # Top-right
+        arr[max(0, height - sample_size):height, 0:sample_size].reshape(-1, 4),  # Bottom-left
+        arr[max(0, height - sample_size):height,
+            max(0, width - sample_size):width].reshape(-1, 4),                   # Bottom-right
+    ])
+
+    opaque = corners[:, 3] > 200
+    total = int(opaque.sum())
+    if total == 0:
+        return False
+
+    checkered = gray_checkered_mask(corners[opaque], DETECTION_RANGES, 15, inclusive=True)
+    return checkered.sum() / total > threshold
+
+
+def remove_checkered_with_edge_detection(image, tolerance=15):
+    """
+    Xóa checkered background nhưng giữ lại pixel ở gần cạnh của object
+    (gradient Sobel cao).
+    """
+    arr = _to_rgba_array(image)
+    rgb = arr[..., :3].astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    gray = (r + g + b) / 3
+
+    sobel_x = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3, borderType=cv2.BORDER_REFLECT)
+    sobel_y = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3, borderType=cv2.BORDER_REFLECT)
+    gradient = cv2.magnitude(sobel_x, sobel_y)
+    gradient /= gradient.max() + 1e-6
+    non_edge = gradient < 0.1
+
+    is_gray = np.maximum(np.maximum(np.abs(r - g), np.abs(g - b)), np.abs(r - b)) < tolerance
+    is_checkered_color = ((gray >= 120) & (gray <= 170)) | ((gray >= 180) & (gray <= 220))
+
+    remove = is_gray & is_checkered_color & non_edge
+    arr[..., 3][remove] = 0
+    return Image.fromarray(arr, mode='RGBA')
+
+
+def flood_fill_background(image, tolerance=30):
+    """
+    Xóa vùng checkered nối liền với các góc ảnh (4-connectivity).
+
+    Dùng connected components của mask checkered thay cho BFS từng pixel:
+    mọi component chứa một góc ảnh là background.
+    """
+    arr = _to_rgba_array(image)
+    height, width = arr.shape[:2]
+
+    candidates = gray_checkered_mask(arr, FLOOD_FILL_RANGES, 20, inclusive=True)
+    _, labels = cv2.connectedComponents(candidates.astype(np.uint8), connectivity=4)
+
+    corners = [(0, 0), (0, width - 1), (height - 1, 0), (height - 1, width - 1)]
+    background_labels = {labels[y, x] for y, x in corners if candidates[y, x]}
+    if background_labels:
+        background = np.isin(labels, list(background_labels))
+        arr[..., 3][background] = 0
+    return Image.fromarray(arr, mode='RGBA')
+
+
+def remove_checkered_combined(image):
+    """Checkered mask (dải rộng) rồi flood fill để xử lý các vùng còn sót"""
+    result = remove_checkered_background(image, tolerance=20, ranges=CHECKERED_RANGES_WIDE)
+    return flood_fill_background(result, tolerance=25)
+
+
+def remove_background_rembg(image, alpha_threshold=10):
+    """Tách nền bằng rembg (neural network). Raises ImportError nếu không có rembg."""
+    import rembg
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    output_bytes = rembg.remove(buffer.getvalue())
+    result = Image.open(io.BytesIO(output_bytes))
+    if result.mode != 'RGBA':
+        result = result.convert('RGBA')
+    return clean_alpha_channel(result, alpha_threshold)
+
+
+def remove_sticker_background(image):
+    """
+    Tách nền khỏi sticker - hỗ trợ cả checkered background và nền thông thường.
+
+    Thử xóa checkered background trước; nếu không xóa được > 10% pixel thì
+    dùng rembg, cuối cùng là phương pháp dựa trên màu sắc.
+
+    Returns:
+        PIL Image: RGBA với nền trong suốt
+    """
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    original_alpha = np.asarray(image)[..., 3]
+    result = remove_checkered_background(image)
+    result_alpha = np.asarray(result)[..., 3]
+
+    original_opaque = np.count_nonzero(original_alpha > 128)
+    result_opaque = np.count_nonzero(result_alpha > 128)
+
+    # Nếu đã xóa được > 10% pixel, coi như thành công
+    if original_opaque > 0 and (original_opaque - result_opaque) / original_opaque > 0.1:
+        return clean_alpha_channel(result)
+
+    try:
+        return remove_background_rembg(image)
+    except ImportError:
+        return remove_background_pillow(image)
+    except Exception:
+        try:
+            return remove_background_pillow(image)
+        except Exception:
+            return image
+
+
+# Phương pháp cho script xử lý file
+METHODS = {
+    'simple': lambda image: remove_checkered_background(image, ranges=CHECKERED_RANGES_WIDE),
+    'edge': remove_checkered_with_edge_detection,
+    'flood': flood_fill_background,
+    'combined': remove_checkered_combined,
+    'sticker': remove_sticker_background,
+    'rembg': remove_background_rembg,
+}
@@ -0,0 +1,500 @@
+"""
+CapturePipeline: single-decode processing of a captured photo.
+
+/api/capture stores four files per photo: the original, the flipped (front
+camera) processed copy, a thumbnail and a template-slot sized preview. The
+upload is decoded once; every other image is derived from that buffer, and
+each stage is timed so slow captures can be diagnosed.
+
+The capture request only persists the upload (persist()); the derivatives are
+generated on a bounded worker pool (submit()). Requests that need a derivative
+before it exists call wait() with the file name.
+
+JPEG uploads are validated from their header only and stored byte for byte as
+the original (no decode/re-encode, no generation loss). When jpegtran is
+installed the mirrored processed copy is produced with a lossless DCT transform
+as well, and the thumbnail/slot previews are decoded at reduced scale.
+"""
+import io
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from utils.async_worker import BoundedWorkerPool, QueueFullError
+from utils.cache import LRUCache
+from .image_processor import ImageProcessor
+from .template_engine import TemplateEngine
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+# Formats accepted as a capture/upload (config ALLOWED_EXTENSIONS)
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF'}
+
+# Upload limits: longest side and total pixels (decompression bomb guard)
+MAX_DIMENSION = 8192
+MAX_PIXELS = 40_000_000
+
+# Read size for streamed request bodies (persist_stream)
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Lossless JPEG transforms (libjpeg-turbo); None = fall back to decode + re-encode
+JPEGTRAN = shutil.which('jpegtran')
+
+
+class InvalidImageError(ValueError):
+    """Raised when uploaded bytes are not an acceptable image"""
+
+# Derivative job states (see status())
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# wait() poll period for captures whose job runs in another worker process
+DISK_POLL_INTERVAL = 0.05
+
+# Slot preview size used when the template catalog has no photo sizes
+DEFAULT_SLOT_SIZE = (540, 400)
+
+
+class CapturePipeline:
+    """Decode a capture once and write its original/processed/thumbnail/slot files"""
+
+    def __init__(self, originals_dir: str, processed_dir: str, thumbnails_dir: str,
+                 catalog_path: Optional[str] = None, template_engine: Optional[TemplateEngine] = None,
+                 quality: int = 90, thumbnail_size: Tuple[int, int] = (200, 200),
+                 max_workers: int = 2, max_queue: int = 16, detect_faces: bool = False,
+                 max_dimension: int = MAX_DIMENSION, max_pixels: int = MAX_PIXELS,
+                 jpegtran: Optional[str] = JPEGTRAN):
+        self.originals_dir = originals_dir
+        self.processed_dir = processed_dir
+        self.thumbnails_dir = thumbnails_dir
+        self.catalog_path = catalog_path or TemplateEngine.DEFAULT_CATALOG_PATH
+        self.template_engine = template_engine or TemplateEngine()
+        self.quality = quality
+        self.thumbnail_size = tuple(thumbnail_size)
+        self.max_dimension = max_dimension
+        self.max_pixels = max_pixels
+        self.jpegtran = jpegtran
+        # (catalog dict, slot size): the catalog is re-parsed only when templates.json changes
+        self._slot_size_memo = (None, DEFAULT_SLOT_SIZE)
+        self._lock = threading.Lock()
+        for folder in (originals_dir, processed_dir, thumbnails_dir):
+            os.makedirs(folder, exist_ok=True)
+
+        # Background derivative generation
+        self.detect_faces = detect_faces
+        self.pool = BoundedWorkerPool(max_workers=max_workers, max_queue=max_queue,
+                                      thread_name_prefix='capture')
+        self._pending: Dict[str, Future] = {}  # base filename -> derivative job
+        self._results = LRUCache(max_entries=256)  # base filename -> finished job result
+
+    def slot_size(self) -> Tuple[int, int]:
+        """Largest photo_size among the catalog templates (cached until templates.json changes)"""
+        catalog = TemplateEngine.load_template_catalog(self.catalog_path)
+        with self._lock:
+            memo_catalog, size = self._slot_size_memo
+            if memo_catalog is catalog:
+                return size
+
+        max_w = max((t["photo_size"][0] for t in catalog.values()), default=0)
+        max_h = max((t["photo_size"][1] for t in catalog.values()), default=0)
+        size = (max_w, max_h) if max_w and max_h else DEFAULT_SLOT_SIZE
+        with self._lock:
+            self._slot_size_memo = (catalog, size)
+        return size
+
+    def process(self, image_data: bytes, base_filename: str, flip: bool = True) -> Dict:
+        """
+        Persist image_data and generate all derivatives synchronously.
+
+        Args:
+            image_data: uploaded image bytes
+            base_filename: file name (.jpg) used in every folder
+            flip: mirror the processed copy (front camera)
+
+        Returns:
+            dict with original_path, processed_path, thumbnail_path, slot_filename
+            (None if the slot preview failed), size, faces (None unless
+            detect_faces) and timings (ms per stage + total_ms)
+        """
+        persist_timings = {}
+        self.persist(image_data, base_filename, persist_timings)
+        result = self._generate(base_filename, flip)
+        result['timings'] = {**persist_timings, **result['timings']}
+        result['timings']['total_ms'] = round(sum(
+            v for k, v in result['timings'].items() if k != 'total_ms'), 2)
+        return result
+
+    def validate(self, image_data: bytes) -> Tuple[str, Tuple[int, int]]:
+        """
+        Check an upload without decoding its pixels.
+
+        Only the header is parsed: the format must be allowed and the
+        dimensions within max_dimension/max_pixels, so a small file that
+        would decompress to a huge bitmap is rejected before any decode.
+
+        Returns:
+            (format, (width, height))
+
+        Raises:
+            InvalidImageError: empty, unreadable, unsupported or oversized image
+        """
+        if not image_data:
+            raise InvalidImageError('Empty image')
+        return self._validate_source(io.BytesIO(image_data), image_data[:3])
+
+    def _validate_source(self, source, magic: bytes) -> Tuple[str, Tuple[int, int]]:
+        # source: file path or file object; magic: its first 3 bytes
+        try:
+            with Image.open(source) as img:
+                image_format, size = img.format, img.size
+        except Image.DecompressionBombError:
+            raise InvalidImageError('Image dimensions exceed the allowed pixel count')
+        except Exception:
+            raise InvalidImageError('Unrecognized image data')
+
+        if image_format not in ALLOWED_FORMATS:
+            raise InvalidImageError(f'Unsupported image format: {image_format}')
+        if image_format == 'JPEG' and magic != JPEG_MAGIC:
+            raise InvalidImageError('Invalid JPEG header')
+        width, height = size
+        if width < 1 or height < 1 or max(width, height) > self.max_dimension:
+            raise InvalidImageError(f'Image dimensions {width}x{height} exceed {self.max_dimension}px')
+        if width * height > self.max_pixels:
+            raise InvalidImageError(f'Image has {width * height} pixels (max {self.max_pixels})')
+        return image_format, size
+
+    def persist(self, image_data: bytes, base_filename: str, timings: Optional[Dict] = None) -> str:
+        """
+        Validate the upload and write it to the originals folder (the only work done in the request).
+
+        JPEG bytes are written verbatim; other formats are decoded and
+        re-encoded so the .jpg file really is a JPEG.
+
+        Returns:
+            str: original path
+
+        Raises:
+            InvalidImageError: see validate()
+        """
+        start = time.perf_counter()
+        image_format, _ = self.validate(image_data)
+        original_path = os.path.join(self.originals_dir, base_filename)
+        tmp_path = f"{original_path}.{threading.get_ident()}.tmp"
+        if image_format == 'JPEG':
+            with open(tmp_path, 'wb') as f:
+                f.write(image_data)
+        else:
+            with Image.open(io.BytesIO(image_data)) as img:
+                self._save_jpeg(img.convert('RGB'), tmp_path)
+        os.replace(tmp_path, original_path)
+        if timings is not None:
+            timings['persist'] = round((time.perf_counter() - start) * 1000, 2)
+        return original_path
+
+    def persist_stream(self, stream, base_filename: str, timings: Optional[Dict] = None,
+                       chunk_size: int = STREAM_CHUNK_SIZE) -> str:
+        """
+        Copy a raw JPEG request body to the originals folder chunk by chunk.
+
+        The body is never held in memory as a whole: it goes straight to a
+        temp file, whose header is validated (see validate()) before it is
+        renamed into place.
+
+        Args:
+            stream: readable binary stream (e.g. request.stream)
+            base_filename: file name (.jpg)
+            timings: optional dict receiving the 'persist' time in ms
+            chunk_size: bytes read per chunk
+
+        Returns:
+            str: original path
+
+        Raises:
+            InvalidImageError: not a JPEG, or rejected by validate()
+        """
+        start = time.perf_counter()
+        original_path = os.path.join(self.originals_dir, base_filename)
+        tmp_path = f"{original_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                chunk = stream.read(chunk_size)
+                if chunk[:3] != JPEG_MAGIC:
+                    raise InvalidImageError('Body is not a JPEG image')
+                while chunk:
+                    f.write(chunk)
+                    chunk = stream.read(chunk_size)
+            self._validate_source(tmp_path, JPEG_MAGIC)
+            os.replace(tmp_path, original_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if timings is not None:
+            timings['persist'] = round((time.perf_counter() - start) * 1000, 2)
+        return original_path
+
+    def submit(self, base_filename: str, flip: bool = True) -> Optional[Future]:
+        """
+        Generate the derivatives of a persisted capture on the worker pool.
+
+        When the pool queue is full the work runs in the calling thread instead
+        (backpressure on the client rather than an unbounded backlog).
+
+        Returns:
+            Future of the _generate() result, or None if it already ran inline
+        """
+        with self._lock:
+            try:
+                future = self.pool.submit(self._generate, base_filename, flip)
+            except QueueFullError:
+                future = None
+            else:
+                self._pending[base_filename] = future
+        if future is None:
+            self._results.put(base_filename, self._run_job(base_filename, flip))
+            return None
+        future.add_done_callback(lambda f: self._finish(base_filename, f))
+        return future
+
+    def _run_job(self, base_filename: str, flip: bool) -> Dict:
+        try:
+            return {'status': DONE, **self._generate(base_filename, flip)}
+        except Exception as e:
+            return {'status': FAILED, 'error': str(e)}
+
+    @staticmethod
+    def _job_result(future: Future) -> Dict:
+        error = future.exception()
+        return {'status': FAILED, 'error': str(error)} if error else {'status': DONE, **future.result()}
+
+    def _finish(self, base_filename: str, future: Future) -> None:
+        self._results.put(base_filename, self._job_result(future))
+        with self._lock:
+            if self._pending.get(base_filename) is future:
+                del self._pending[base_filename]
+
+    @staticmethod
+    def base_filename(filename: str) -> str:
+        """Capture file name a derivative belongs to ('x_slot.jpg' -> 'x.jpg')"""
+        root, ext = os.path.splitext(os.path.basename(filename))
+        if root.endswith('_slot'):
+            root = root[:-len('_slot')]
+        return root + ext
+
+    def _on_disk(self, base_filename: str) -> Optional[bool]:
+        """
+        Derivative state from the file system, for captures submitted by another
+        worker process: None if there is no such capture, else whether the
+        thumbnail (written last by _generate) and the processed copy exist.
+        """
+        if not os.path.exists(os.path.join(self.originals_dir, base_filename)):
+            return None
+        return (os.path.exists(os.path.join(self.thumbnails_dir, base_filename))
+                and os.path.exists(os.path.join(self.processed_dir, base_filename)))
+
+    def wait(self, filename: str, timeout: Optional[float] = 10.0,
+             poll_interval: float = DISK_POLL_INTERVAL) -> bool:
+        """
+        Block until the derivatives of filename's capture are written.
+
+        Captures submitted by another worker process have no future here: their
+        derivative files are polled on disk until timeout instead.
+
+        Returns:
+            bool: False if they are still pending after timeout (or failed)
+        """
+        base = self.base_filename(filename)
+        with self._lock:
+            future = self._pending.get(base)
+        if future is None:
+            if self._results.get(base) is not None:
+                return True
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self._on_disk(base) is False:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(poll_interval)
+            return True
+        try:
+            future.result(timeout=timeout)
+            return True
+        except FutureTimeoutError:
+            return False
+        except Exception:
+            return False
+
+    def status(self, filename: str) -> Optional[Dict]:
+        """
+        pending/done/failed state (with timings and faces when done) or None if unknown.
+        Captures submitted by another worker process report pending/done only.
+        """
+        base = self.base_filename(filename)
+        with self._lock:
+            future = self._pending.get(base)
+        if future is not None:
+            # Done but _finish() may not have run yet
+            return self._job_result(future) if future.done() else {'status': PENDING}
+        result = self._results.get(base)
+        if result:
+            return dict(result)
+        # Submitted by another worker process: only pending/done is known
+        on_disk = self._on_disk(base)
+        if on_disk is None:
+            return None
+        return {'status': DONE if on_disk else PENDING}
+
+    def _generate(self, base_filename: str, flip: bool = True) -> Dict:
+        """Decode the persisted original once and write processed, thumbnail and slot files"""
+        timings = {}
+        start = time.perf_counter()
+
+        def mark(stage, since):
+            now = time.perf_counter()
+            timings[stage] = round((now - since) * 1000, 2)
+            return now
+
+        t = start
+        original_path = os.path.join(self.originals_dir, base_filename)
+        processed_path = os.path.join(self.processed_dir, base_filename)
+
+        # Mirror losslessly when possible; the previews then only need a reduced-scale decode
+        lossless = flip and self._lossless_flip(original_path, processed_path)
+        if lossless:
+            t = mark('flip', t)
+
+        with Image.open(original_path) as img:
+            size = img.size
+            if lossless and not self.detect_faces:
+                slot_w, slot_h = self.slot_size()
+                img.draft('RGB', (max(slot_w, self.thumbnail_size[0]), max(slot_h, self.thumbnail_size[1])))
+            original = img.convert('RGB') if img.mode != 'RGB' else img.copy()
+        t = mark('decode', t)
+
+        if lossless:
+            processed = ImageProcessor.flip_horizontal(original)
+        else:
+            processed = ImageProcessor.flip_horizontal(original) if flip else original
+            t = mark('flip', t)
+            self._save_jpeg_atomic(processed, processed_path)
+            t = mark('save_processed', t)
+
+        # Template-slot sized preview for faster client preview and collage rendering
+        slot_filename = None
+        try:
+            # Same crop as collage slots
+            slot_image = self.template_engine._resize_and_crop(processed, self.slot_size())
+            name_root = base_filename.rsplit('.', 1)[0]
+            slot_filename = f"{name_root}_slot.jpg"
+            self._save_jpeg_atomic(slot_image, os.path.join(self.processed_dir, slot_filename))
+        except Exception:
+            slot_filename = None
+        t = mark('slot', t)
+
+        # Written last: other workers treat an existing thumbnail as "derivatives done"
+        thumbnail_path = os.path.join(self.thumbnails_dir, base_filename)
+        self._save_jpeg_atomic(ImageProcessor.create_thumbnail(processed.copy(), self.thumbnail_size),
+                               thumbnail_path)
+        t = mark('thumbnail', t)
+
+        faces = None
+        if self.detect_faces:
+            try:
+                from .face_detector import get_detector
+                faces = [{'bbox': list(f['bbox']), 'confidence': f['confidence']}
+                         for f in get_detector().detect_faces(processed)]
+            except Exception:
+                faces = None
+            t = mark('face_detection', t)
+
+        timings['total_ms'] = round((t - start) * 1000, 2)
+        return {
+            'original_path': original_path,
+            'processed_path': processed_path,
+            'thumbnail_path': thumbnail_path,
+            'slot_filename': slot_filename,
+            'size': size,
+            'lossless_flip': lossless,
+            'faces': faces,
+            'timings': timings
+        }
+
+    def _lossless_flip(self, source: str, destination: str) -> bool:
+        """
+        Mirror a JPEG with jpegtran (DCT-domain, no re-encode).
+
+        -perfect makes jpegtran fail instead of trimming edge blocks when the
+        width is not a multiple of the MCU size; the caller then re-encodes.
+
+        Returns:
+            bool: True if destination was written
+        """
+        if not self.jpegtran:
+            return False
+        with open(source, 'rb') as f:
+            if f.read(3) != JPEG_MAGIC:
+                return False
+        tmp_path = f"{destination}.{threading.get_ident()}.tmp"
+        try:
+            subprocess.run([self.jpegtran, '-flip', 'horizontal', '-perfect', '-copy', 'all',
+                            '-outfile', tmp_path, source],
+                           check=True, capture_output=True, timeout=30)
+            os.replace(tmp_path, destination)
+            return True
+        except (OSError, subprocess.SubprocessError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def _save_jpeg_atomic(self, image: Image.Image, path: str) -> None:
+        # Readers never see a partially written derivative
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        self._save_jpeg(image, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _save_jpeg(self, image: Image.Image, path: str) -> None:
+        # Folders are created once in __init__ (ImageProcessor.save_image runs makedirs per file)
+        image.save(path, 'JPEG', quality=self.quality)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'queued_or_running': self.pool.pending,
+            'max_workers': self.pool.max_workers,
+            'max_queue': self.pool.max_queue
+        }
+
+
+# Singleton instance
+_capture_pipeline: Optional[CapturePipeline] = None
+_capture_pipeline_lock = threading.Lock()
+
+def get_capture_pipeline(config=None, catalog_path: Optional[str] = None,
+                         template_engine: Optional[TemplateEngine] = None) -> CapturePipeline:
+    """Get singleton CapturePipeline instance (folders from config on first use)"""
+    global _capture_pipeline
+    with _capture_pipeline_lock:
+        if _capture_pipeline is None:
+            config = config or {}
+            upload_folder = config.get('UPLOAD_FOLDER', os.path.join('static', 'uploads'))
+            _capture_pipeline = CapturePipeline(
+                originals_dir=config.get('ORIGINALS_FOLDER', os.path.join(upload_folder, 'originals')),
+                processed_dir=config.get('PROCESSED_FOLDER', os.path.join(upload_folder, 'processed')),
+                thumbnails_dir=config.get('THUMBNAILS_FOLDER', os.path.join(upload_folder, 'thumbnails')),
+                catalog_path=catalog_path,
+                template_engine=template_engine,
+                max_workers=int(config.get('CAPTURE_WORKERS', 2)),
+                max_queue=int(config.get('CAPTURE_QUEUE_SIZE', 16)),
+                detect_faces=bool(config.get('CAPTURE_DETECT_FACES', False)),
+                max_dimension=int(config.get('UPLOAD_MAX_DIMENSION', MAX_DIMENSION)),
+                max_pixels=int(config.get('UPLOAD_MAX_PIXELS', MAX_PIXELS)),
+                jpegtran=config.get('JPEGTRAN_PATH') or JPEGTRAN
+            )
+    return _capture_pipeline
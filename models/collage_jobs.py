@@ -0,0 +1,199 @@
+"""
+CollageJobQueue: asynchronous collage rendering with status polling.
+
+Jobs run on a BoundedWorkerPool (utils/async_worker.py). Identical in-flight
+jobs (same TemplateEngine render key) share one job, and finished jobs are
+kept for a while so clients can poll their status.
+
+With records_dir set, every job state change is also written to
+<records_dir>/<job id>.json (atomic replace), so a status request served by
+another worker process can still read the job.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.async_worker import BoundedWorkerPool, QueueFullError
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class CollageJobQueue:
+    """Registry of collage render jobs backed by a bounded worker pool"""
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, job_ttl_seconds: int = 3600,
+                 records_dir: Optional[str] = None):
+        self.pool = BoundedWorkerPool(max_workers=max_workers, max_queue=max_queue,
+                                      thread_name_prefix='collage')
+        self.job_ttl_seconds = job_ttl_seconds
+        # Shared job records for multi-process deployments (None = memory only)
+        self.records_dir = records_dir
+        if records_dir:
+            os.makedirs(records_dir, exist_ok=True)
+        self._jobs: Dict[str, dict] = {}
+        self._in_flight: Dict[str, str] = {}  # render key -> job id
+        self._lock = threading.Lock()
+
+    def submit(self, render_key: str, render: Callable[[], dict]) -> Tuple[dict, bool]:
+        """
+        Queue a render unless an identical one is already queued or running.
+
+        Args:
+            render_key: deterministic key of the render (dedup key)
+            render: callable doing the render, returns the build_collage() result
+
+        Returns:
+            (job snapshot, deduplicated)
+
+        Raises:
+            QueueFullError: if the worker pool queue is full
+        """
+        with self._lock:
+            self._prune()
+            job_id = self._in_flight.get(render_key)
+            if job_id is not None:
+                return dict(self._jobs[job_id]), True
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'status': QUEUED,
+                'render_key': render_key,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            self._jobs[job['id']] = job
+            self._in_flight[render_key] = job['id']
+
+            try:
+                self.pool.submit(self._run, job['id'], render)
+            except QueueFullError:
+                del self._jobs[job['id']]
+                del self._in_flight[render_key]
+                raise
+            snapshot = dict(job)
+        self._write_record(snapshot)
+        return snapshot, False
+
+    def _run(self, job_id: str, render: Callable[[], dict]) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = RUNNING
+            job['started_at'] = time.time()
+            snapshot = dict(job)
+        self._write_record(snapshot)
+
+        try:
+            result = render()
+            update = {'status': DONE, 'result': result}
+        except Exception as e:
+            update = {'status': FAILED, 'error': str(e)}
+
+        with self._lock:
+            job.update(update)
+            job['finished_at'] = time.time()
+            if self._in_flight.get(job['render_key']) == job_id:
+                del self._in_flight[job['render_key']]
+            snapshot = dict(job)
+        self._write_record(snapshot)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Snapshot of a job (from this process or the shared records), or None if unknown/expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        job = self._read_record(job_id)
+        if job and self._expired(job):
+            return None
+        return job
+
+    def _record_path(self, job_id: str) -> Optional[str]:
+        # Job ids are uuid4 hex; anything else cannot name a record
+        if not self.records_dir or not job_id.isalnum():
+            return None
+        return os.path.join(self.records_dir, f"{job_id}.json")
+
+    def _write_record(self, job: dict) -> None:
+        path = self._record_path(job['id'])
+        if path is None:
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(job, f, default=str)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Best effort: this process still answers from memory
+            pass
+
+    def _read_record(self, job_id: str) -> Optional[dict]:
+        path = self._record_path(job_id)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _expired(self, job: dict, cutoff: Optional[float] = None) -> bool:
+        cutoff = time.time() - self.job_ttl_seconds if cutoff is None else cutoff
+        return job.get('finished_at') is not None and job['finished_at'] < cutoff
+
+    def _prune(self) -> None:
+        """Drop finished jobs older than job_ttl_seconds (caller holds the lock)"""
+        cutoff = time.time() - self.job_ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if self._expired(job, cutoff)]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+        if self.records_dir:
+            # Records of every worker: a record is rewritten on each state change, so one
+            # untouched for job_ttl_seconds is expired (or left by a worker that died)
+            for entry in os.scandir(self.records_dir):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+        return {
+            'jobs': counts,
+            'pending': self.pool.pending,
+            'max_workers': self.pool.max_workers,
+            'max_queue': self.pool.max_queue
+        }
+
+
+# Singleton instance
+_job_queue: Optional[CollageJobQueue] = None
+_job_queue_lock = threading.Lock()
+
+def get_collage_job_queue(config=None) -> CollageJobQueue:
+    """Get singleton CollageJobQueue instance (sized from config on first use)"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            config = config or {}
+            _job_queue = CollageJobQueue(
+                max_workers=int(config.get('COLLAGE_WORKERS', 2)),
+                max_queue=int(config.get('COLLAGE_QUEUE_SIZE', 8)),
+                job_ttl_seconds=int(config.get('COLLAGE_JOB_TTL_SECONDS', 3600)),
+                records_dir=config.get('COLLAGE_JOBS_FOLDER') or os.path.join(
+                    config.get('COLLAGES_FOLDER', os.path.join('static', 'uploads', 'collages')), 'jobs')
+            )
+    return _job_queue
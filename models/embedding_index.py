@@ -1,8 +1,12 @@
 """
-EmbeddingIndex: Annoy-based approximate nearest neighbor search for face embeddings
+EmbeddingIndex: two-stage (per-user centroid + exact re-rank) search for face embeddings
 """
 
 import os
+import json
+import math
+import threading
+from contextlib import contextmanager
 import numpy as np
 from typing import List, Tuple, Dict, Optional
 
@@ -12,21 +16,285 @@ try:
 except ImportError:
     _HAS_ANNOY = False
 
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except ImportError:
+    _HAS_FCNTL = False
+
+
+def _angular_distance(similarity: float) -> float:
+    """Convert cosine similarity to angular distance sqrt(2 * (1 - cos)) (Annoy's metric)"""
+    return math.sqrt(max(0.0, 2.0 - 2.0 * similarity))
+
+
+class UserCentroidIndex:
+    """
+    Small in-memory index of one normalized centroid per user.
+
+    Centroids are kept as running sums so enrolling or deleting an embedding
+    only touches that user's row. The dense matrix used for search is rebuilt
+    lazily (O(users)) the first time it is needed after a change.
+    """
+
+    def __init__(self, embedding_dim: int = 128):
+        self.embedding_dim = embedding_dim
+        self._sums: Dict[int, np.ndarray] = {}
+        self._counts: Dict[int, int] = {}
+
+        # Search matrix cache
+        self._user_ids: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._dirty = True
+
+    def clear(self):
+        self._sums = {}
+        self._counts = {}
+        self._dirty = True
+
+    def add(self, user_id: int, embedding: np.ndarray):
+        """Add one (normalized) embedding to the user's centroid"""
+        vec = np.asarray(embedding, dtype=np.float32)
+        if user_id in self._sums:
+            # Not in-place: loaded sums may be read-only memory-mapped rows
+            self._sums[user_id] = self._sums[user_id] + vec
+            self._counts[user_id] += 1
+        else:
+            self._sums[user_id] = vec.copy()
+            self._counts[user_id] = 1
+        self._dirty = True
+
+    def remove_user(self, user_id: int):
+        """Drop a user's centroid"""
+        if self._sums.pop(user_id, None) is not None:
+            self._counts.pop(user_id, None)
+            self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._sums)
+
+    def copy(self) -> 'UserCentroidIndex':
+        """Independent copy (rows are shared; add() never modifies a row in place)"""
+        other = UserCentroidIndex(self.embedding_dim)
+        other._sums = dict(self._sums)
+        other._counts = dict(self._counts)
+        return other
+
+    def prepare(self):
+        """Build the search matrix now, so candidates() only reads afterwards"""
+        if self._dirty:
+            self._rebuild_matrix()
+
+    def load_arrays(self, user_ids: List[int], sums: np.ndarray, counts: List[int]):
+        """Adopt persisted centroid sums (rows may be memory-mapped views)"""
+        self._sums = {int(uid): sums[i] for i, uid in enumerate(user_ids)}
+        self._counts = {int(uid): int(c) for uid, c in zip(user_ids, counts)}
+        self._dirty = True
+
+    def to_arrays(self) -> Tuple[List[int], np.ndarray, List[int]]:
+        """Export (user_ids, sums matrix, counts) for persistence"""
+        user_ids = list(self._sums.keys())
+        if user_ids:
+            sums = np.stack([self._sums[uid] for uid in user_ids]).astype(np.float32)
+        else:
+            sums = np.zeros((0, self.embedding_dim), dtype=np.float32)
+        return user_ids, sums, [self._counts[uid] for uid in user_ids]
+
+    def _rebuild_matrix(self):
+        self._user_ids = list(self._sums.keys())
+        if self._user_ids:
+            matrix = np.stack([self._sums[uid] for uid in self._user_ids]).astype(np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self._matrix = matrix / norms
+        else:
+            self._matrix = np.zeros((0, self.embedding_dim), dtype=np.float32)
+        self._dirty = False
+
+    def candidates(self, query: np.ndarray, num_candidates: int) -> List[Tuple[int, float]]:
+        """
+        Return the users whose centroid is most similar to the query
+
+        Args:
+            query: L2-normalized query embedding
+            num_candidates: Number of users to return
+
+        Returns:
+            List of (user_id, cosine_similarity) tuples, best first
+        """
+        if self._dirty:
+            self._rebuild_matrix()
+        if not self._user_ids or num_candidates <= 0:
+            return []
+
+        sims = self._matrix @ np.asarray(query, dtype=np.float32)
+        n = min(num_candidates, len(self._user_ids))
+        if n < len(self._user_ids):
+            top = np.argpartition(-sims, n - 1)[:n]
+        else:
+            top = np.arange(len(self._user_ids))
+        top = top[np.argsort(-sims[top])]
+        return [(self._user_ids[i], float(sims[i])) for i in top]
+
+
+class _IndexState:
+    """
+    One loaded generation of the index.
+
+    Never modified once published: writers build a new state and swap it in
+    with a single assignment, so a search that read EmbeddingIndex._state once
+    sees consistent mappings, vectors and centroids.
+    """
+
+    __slots__ = ('generation', 'id_to_user_id', 'user_id_to_ids', 'vectors', 'centroids')
+
+    def __init__(self, generation: int, id_to_user_id: Dict[int, int],
+                 user_id_to_ids: Dict[int, List[int]], vectors: np.ndarray,
+                 centroids: UserCentroidIndex):
+        self.generation = generation
+        self.id_to_user_id = id_to_user_id
+        self.user_id_to_ids = user_id_to_ids
+        self.vectors = vectors
+        self.centroids = centroids
+        centroids.prepare()
+
 
 class EmbeddingIndex:
-    """Annoy-based index for fast face embedding search"""
+    """
+    Index for fast face embedding search.
 
-    def __init__(self, embedding_dim: int = 128, index_path: str = None):
-        if not _HAS_ANNOY:
-            raise ImportError("Annoy not available. Install with: pip install annoy")
+    The index files are shared by every worker process on the host: the .npy
+    arrays are memory-mapped read-only, so the OS page cache holds a single copy
+    no matter how many workers there are. Writers take an exclusive file lock,
+    save new files atomically and bump a generation counter; readers compare the
+    counter before searching and reload lazily.
+
+    Search is exact over the candidate users' vectors (see search()), so no ANN
+    structure is kept up to date on writes. A legacy Annoy file at index_path is
+    only read to recover vectors when the .vectors.npy sidecar is missing.
+    """
 
+    # How many candidate users the centroid stage returns per requested result
+    CANDIDATE_MULTIPLIER = 4
+    MIN_CANDIDATES = 10
+
+    def __init__(self, embedding_dim: int = 128, index_path: str = None):
         self.embedding_dim = embedding_dim
+        # Base path of the index files (sidecars are '<index_path>.<suffix>')
         self.index_path = index_path or os.path.join(os.path.dirname(__file__), 'embeddings.ann')
 
-        # Index will be loaded/created lazily
-        self.index = None
-        self.id_to_user_id = {}  # Maps annoy_id to user_id
-        self.user_id_to_ids = {}  # Maps user_id to list of annoy_ids
+        # Current generation, loaded/created lazily (None = not loaded)
+        self._state: Optional[_IndexState] = None
+        self._generation_stamp = None
+        self._thread_lock = threading.RLock()
+
+    # Read-only views of the current state
+    @property
+    def loaded(self) -> bool:
+        return self._state is not None
+
+    @property
+    def generation(self) -> int:
+        """Generation of the files currently loaded (-1 = nothing loaded from disk)"""
+        state = self._state
+        return state.generation if state else -1
+
+    @property
+    def id_to_user_id(self) -> Dict[int, int]:
+        state = self._state
+        return state.id_to_user_id if state else {}
+
+    @property
+    def user_id_to_ids(self) -> Dict[int, List[int]]:
+        state = self._state
+        return state.user_id_to_ids if state else {}
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Normalized vectors by row id (rows of removed users stay until rebuild())"""
+        state = self._state
+        return state.vectors if state else np.zeros((0, self.embedding_dim), dtype=np.float32)
+
+    @property
+    def centroids(self) -> UserCentroidIndex:
+        state = self._state
+        return state.centroids if state else UserCentroidIndex(self.embedding_dim)
+
+    @property
+    def mapping_path(self) -> str:
+        return self.index_path + '.mapping'
+
+    @property
+    def vectors_path(self) -> str:
+        return self.index_path + '.vectors.npy'
+
+    @property
+    def centroids_path(self) -> str:
+        return self.index_path + '.centroids.npy'
+
+    @property
+    def generation_path(self) -> str:
+        return self.index_path + '.gen'
+
+    @property
+    def lock_path(self) -> str:
+        return self.index_path + '.lock'
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True):
+        """
+        Serialize access to the index files across threads and processes.
+        Readers take a shared lock while loading so they never see a half-written set.
+        """
+        with self._thread_lock:
+            if not _HAS_FCNTL:
+                # No flock (e.g. Windows dev server): single-process locking only
+                yield
+                return
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _exists(self) -> bool:
+        """Whether index files were published (the mapping is written by every format)"""
+        return os.path.exists(self.mapping_path)
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self.generation_path, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _generation_changed(self) -> bool:
+        """Cheap staleness check: stat the counter file, read it only if it changed"""
+        try:
+            st = os.stat(self.generation_path)
+            stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            stamp = None
+        if stamp == self._generation_stamp:
+            return False
+        self._generation_stamp = stamp
+        return self._read_generation() != self.generation
+
+    def refresh(self) -> bool:
+        """
+        Reload the index if another process published a newer generation.
+
+        Returns:
+            True if the index was reloaded
+        """
+        if not self._generation_changed() or not self._exists():
+            return False
+        with self._file_lock(exclusive=False):
+            self._load_index()
+        return True
 
     def load_or_create_index(self, embeddings_data: List[Dict] = None):
         """
@@ -35,136 +303,273 @@ class EmbeddingIndex:
         Args:
             embeddings_data: List of dicts with 'user_id' and 'embedding_vector'
         """
-        if os.path.exists(self.index_path):
-            self._load_index()
-        elif embeddings_data:
+        if self._exists():
+            with self._file_lock(exclusive=False):
+                self._load_index()
+            return
+
+        with self._file_lock(exclusive=True):
+            # Another worker may have built it while we waited for the lock
+            if self._exists():
+                self._load_index()
+            elif embeddings_data:
+                self._build_index(embeddings_data)
+            else:
+                self._reset()
+
+    def rebuild(self, embeddings_data: List[Dict] = None):
+        """
+        Replace the index contents and publish them to all workers.
+
+        Row ids are renumbered densely, which drops the rows that remove_user()
+        left behind.
+
+        Args:
+            embeddings_data: List of dicts with 'user_id' and 'embedding_vector';
+                             None compacts the current contents
+        """
+        with self._file_lock(exclusive=True):
+            if embeddings_data is None:
+                self._refresh_for_write()
+                state = self._state
+                embeddings_data = [{'user_id': user_id, 'embedding_vector': state.vectors[row_id]}
+                                   for row_id, user_id in sorted(state.id_to_user_id.items())]
             self._build_index(embeddings_data)
-        else:
-            # Create empty index
-            self.index = AnnoyIndex(self.embedding_dim, 'angular')
-            self.id_to_user_id = {}
-            self.user_id_to_ids = {}
+
+    def _reset(self):
+        """Start an empty index (nothing is written until the first enrollment)"""
+        self._state = _IndexState(-1, {}, {}, np.zeros((0, self.embedding_dim), dtype=np.float32),
+                                  UserCentroidIndex(self.embedding_dim))
 
     def _load_index(self):
-        """Load existing Annoy index and mappings"""
-        self.index = AnnoyIndex(self.embedding_dim, 'angular')
-        self.index.load(self.index_path)
-
-        # Load mappings (you might want to store these separately in a JSON file)
-        mapping_path = self.index_path + '.mapping'
-        if os.path.exists(mapping_path):
-            import json
-            with open(mapping_path, 'r') as f:
+        """Load the published files into a new state and swap it in (caller holds the file lock)"""
+        generation = self._read_generation()
+
+        mapping = {}
+        if os.path.exists(self.mapping_path):
+            with open(self.mapping_path, 'r') as f:
                 mapping = json.load(f)
-                self.id_to_user_id = mapping.get('id_to_user_id', {})
-                self.user_id_to_ids = mapping.get('user_id_to_ids', {})
+        # JSON object keys are always strings
+        id_to_user_id = {int(k): int(v) for k, v in mapping.get('id_to_user_id', {}).items()}
+        user_id_to_ids = {int(k): [int(i) for i in v]
+                          for k, v in mapping.get('user_id_to_ids', {}).items()}
+
+        if os.path.exists(self.vectors_path):
+            # Memory-mapped, so all workers share its pages
+            vectors = np.load(self.vectors_path, mmap_mode='r')
+        else:
+            vectors = self._recover_legacy_vectors()
+
+        centroids = UserCentroidIndex(self.embedding_dim)
+        if os.path.exists(self.centroids_path) and 'centroid_user_ids' in mapping:
+            centroids.load_arrays(mapping['centroid_user_ids'],
+                                  np.load(self.centroids_path, mmap_mode='r'),
+                                  mapping.get('centroid_counts', []))
+        else:
+            centroids = self._compute_centroids(id_to_user_id, vectors)
+
+        self._state = _IndexState(generation, id_to_user_id, user_id_to_ids, vectors, centroids)
+
+    def _recover_legacy_vectors(self) -> np.ndarray:
+        """Vectors of an index written before the .vectors.npy sidecar, read from its Annoy file"""
+        rows = []
+        if _HAS_ANNOY and os.path.exists(self.index_path):
+            legacy = AnnoyIndex(self.embedding_dim, 'angular')
+            legacy.load(self.index_path)
+            rows = [self._normalize(legacy.get_item_vector(i)) for i in range(legacy.get_n_items())]
+            legacy.unload()
+        return np.stack(rows) if rows else np.zeros((0, self.embedding_dim), dtype=np.float32)
 
     def _build_index(self, embeddings_data: List[Dict]):
-        """Build new index from embeddings data"""
-        self.index = AnnoyIndex(self.embedding_dim, 'angular')
-        self.id_to_user_id = {}
-        self.user_id_to_ids = {}
+        """Build new index from embeddings data (caller holds the exclusive lock)"""
+        id_to_user_id = {}
+        user_id_to_ids = {}
 
+        rows = []
         for i, data in enumerate(embeddings_data):
             user_id = data['user_id']
-            embedding = data['embedding_vector']
-
-            # Add to index
-            self.index.add_item(i, embedding)
-            self.id_to_user_id[i] = user_id
-
-            # Update reverse mapping
-            if user_id not in self.user_id_to_ids:
-                self.user_id_to_ids[user_id] = []
-            self.user_id_to_ids[user_id].append(i)
-
-        # Build index with 10 trees (balance between speed and accuracy)
-        self.index.build(10)
-        self._save_index()
-
-    def _save_index(self):
-        """Save index and mappings"""
-        if self.index:
-            self.index.save(self.index_path)
-
-            # Save mappings
-            mapping_path = self.index_path + '.mapping'
-            import json
-            mapping = {
-                'id_to_user_id': self.id_to_user_id,
-                'user_id_to_ids': self.user_id_to_ids
-            }
-            with open(mapping_path, 'w') as f:
+            rows.append(self._normalize(data['embedding_vector']))
+            id_to_user_id[i] = user_id
+            user_id_to_ids.setdefault(user_id, []).append(i)
+
+        vectors = (np.stack(rows) if rows
+                   else np.zeros((0, self.embedding_dim), dtype=np.float32))
+        centroids = self._compute_centroids(id_to_user_id, vectors)
+        self._save_index(_IndexState(self.generation, id_to_user_id, user_id_to_ids, vectors, centroids))
+
+    def _compute_centroids(self, id_to_user_id: Dict[int, int], vectors: np.ndarray) -> UserCentroidIndex:
+        """Every user centroid recomputed from the stored vectors"""
+        centroids = UserCentroidIndex(self.embedding_dim)
+        for row_id, user_id in id_to_user_id.items():
+            if row_id < len(vectors):
+                centroids.add(user_id, vectors[row_id])
+        return centroids
+
+    @staticmethod
+    def _replace_file(path: str, write):
+        """Write via a temp file and atomically swap it in"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _save_index(self, state: _IndexState):
+        """
+        Save a state's vectors, centroids and mappings, then publish a new
+        generation (caller holds the exclusive lock).
+        """
+        centroid_user_ids, centroid_sums, centroid_counts = state.centroids.to_arrays()
+        generation = self._read_generation() + 1
+
+        def save_npy(array):
+            def write(path):
+                with open(path, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(array, dtype=np.float32))
+            return write
+
+        self._replace_file(self.vectors_path, save_npy(state.vectors))
+        self._replace_file(self.centroids_path, save_npy(centroid_sums))
+
+        # Save mappings
+        mapping = {
+            'generation': generation,
+            'id_to_user_id': state.id_to_user_id,
+            'user_id_to_ids': state.user_id_to_ids,
+            'centroid_user_ids': centroid_user_ids,
+            'centroid_counts': centroid_counts
+        }
+
+        def write_mapping(path):
+            with open(path, 'w') as f:
                 json.dump(mapping, f)
 
+        self._replace_file(self.mapping_path, write_mapping)
+
+        # Publish last, once every file above is in place
+        def write_generation(path):
+            with open(path, 'w') as f:
+                f.write(str(generation))
+
+        self._replace_file(self.generation_path, write_generation)
+
+        # Swap our private copies for shared memory-mapped views
+        self._load_index()
+
+    def _normalize(self, embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _refresh_for_write(self):
+        """Make sure a writer starts from the latest published index (caller holds the lock)"""
+        if self._exists():
+            if self._state is None or self._read_generation() != self.generation:
+                self._load_index()
+        elif self._state is None:
+            self._reset()
+
     def add_embedding(self, user_id: int, embedding: np.ndarray):
         """Add new embedding to index"""
-        if self.index is None:
-            self.index = AnnoyIndex(self.embedding_dim, 'angular')
+        with self._file_lock(exclusive=True):
+            self._refresh_for_write()
+            state = self._state
 
-        # Find next available ID
-        next_id = len(self.id_to_user_id)
+            # Row ids are never reused, so the next id is the vector count
+            next_id = len(state.vectors)
+            vec = self._normalize(embedding)
+            vectors = np.vstack([state.vectors, vec[np.newaxis, :]])
 
-        self.index.add_item(next_id, embedding)
-        self.id_to_user_id[next_id] = user_id
+            id_to_user_id = {**state.id_to_user_id, next_id: user_id}
+            user_id_to_ids = {**state.user_id_to_ids,
+                              user_id: state.user_id_to_ids.get(user_id, []) + [next_id]}
 
-        if user_id not in self.user_id_to_ids:
-            self.user_id_to_ids[user_id] = []
-        self.user_id_to_ids[user_id].append(next_id)
+            centroids = state.centroids.copy()
+            centroids.add(user_id, vec)
 
-        # Rebuild index incrementally (in production, you might want to rebuild periodically)
-        self.index.build(10)
-        self._save_index()
+            self._save_index(_IndexState(state.generation, id_to_user_id, user_id_to_ids,
+                                         vectors, centroids))
 
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[int, float]]:
+    def search(self, query_embedding: np.ndarray, top_k: int = 5,
+               num_candidates: int = None) -> List[Tuple[int, float]]:
         """
-        Search for similar embeddings
+        Search for the most similar users.
+
+        Two-stage search: the per-user centroid index picks candidate users,
+        then only those users' embeddings are compared exactly. Each user
+        appears at most once, scored by their best matching embedding.
 
         Args:
             query_embedding: Query embedding vector
-            top_k: Number of results to return
+            top_k: Number of users to return
+            num_candidates: Users kept by the centroid stage
+                            (default: max(MIN_CANDIDATES, top_k * CANDIDATE_MULTIPLIER))
 
         Returns:
-            List of (user_id, distance) tuples
+            List of (user_id, distance) tuples, using angular distance
+            sqrt(2 * (1 - cos)) as Annoy did
         """
-        if self.index is None:
+        if self._state is None:
             return []
 
-        # Get nearest neighbors
-        annoy_ids, distances = self.index.get_nns_by_vector(query_embedding, top_k, include_distances=True)
+        # Pick up enrollments/deletions published by other workers
+        self.refresh()
+        # One snapshot for the whole search; writers/refreshes swap in a new one
+        state = self._state
+
+        query = self._normalize(query_embedding)
+
+        if num_candidates is None:
+            num_candidates = max(self.MIN_CANDIDATES, top_k * self.CANDIDATE_MULTIPLIER)
+        candidates = state.centroids.candidates(query, num_candidates)
 
-        results = []
-        for annoy_id, distance in zip(annoy_ids, distances):
-            user_id = self.id_to_user_id.get(annoy_id)
-            if user_id is not None:
-                results.append((user_id, distance))
+        # Exact re-rank over the candidate users' own embeddings
+        best = []
+        for user_id, _ in candidates:
+            ids = state.user_id_to_ids.get(user_id)
+            if not ids:
+                continue
+            sims = state.vectors[ids] @ query
+            best.append((user_id, float(sims.max())))
 
-        return results
+        best.sort(key=lambda item: item[1], reverse=True)
+        return [(user_id, _angular_distance(sim))
+                for user_id, sim in best[:top_k]]
 
     def remove_user(self, user_id: int):
-        """Remove all embeddings for a user (requires full rebuild)"""
-        if user_id in self.user_id_to_ids:
-            # Remove from mappings
-            annoy_ids = self.user_id_to_ids[user_id]
-            for annoy_id in annoy_ids:
-                if annoy_id in self.id_to_user_id:
-                    del self.id_to_user_id[annoy_id]
-            del self.user_id_to_ids[user_id]
-
-            # Note: Annoy doesn't support item removal, so we'd need to rebuild
-            # For now, just update mappings and rebuild when needed
-            self._save_index()
+        """
+        Remove all embeddings for a user.
+
+        Only the mappings are updated; the user's rows stay in the vectors
+        file until rebuild() compacts it.
+        """
+        with self._file_lock(exclusive=True):
+            self._refresh_for_write()
+            state = self._state
+
+            if user_id in state.user_id_to_ids:
+                removed = set(state.user_id_to_ids[user_id])
+                id_to_user_id = {row_id: uid for row_id, uid in state.id_to_user_id.items()
+                                 if row_id not in removed}
+                user_id_to_ids = {uid: ids for uid, ids in state.user_id_to_ids.items()
+                                  if uid != user_id}
+
+                centroids = state.centroids.copy()
+                centroids.remove_user(user_id)
+
+                self._save_index(_IndexState(state.generation, id_to_user_id, user_id_to_ids,
+                                             state.vectors, centroids))
 
     def get_user_count(self) -> int:
         """Get number of unique users in index"""
+        self.refresh()
         return len(self.user_id_to_ids)
 
     def get_embedding_count(self) -> int:
         """Get total number of embeddings in index"""
+        self.refresh()
         return len(self.id_to_user_id)
 
 
-# Singleton instance
+# Singleton instance (per process; the files behind it are shared between workers)
 _embedding_index = None
 
 def get_embedding_index() -> EmbeddingIndex:
@@ -172,4 +577,4 @@ def get_embedding_index() -> EmbeddingIndex:
     global _embedding_index
     if _embedding_index is None:
         _embedding_index = EmbeddingIndex()
-    return _embedding_index
\ No newline at end of file
+    return _embedding_index
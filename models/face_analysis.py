@@ -0,0 +1,154 @@
+"""
+FaceAnalysisPipeline: single-pass face analysis.
+
+Decodes the image once, detects faces once, crops the largest face once and then
+runs any combination of analyzers (embedding, emotion, age/gender, landmarks) on
+those shared intermediates.
+"""
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from PIL import Image
+
+from .model_manager import get_model_manager, LandmarkDetector
+
+
+class FaceAnalysisPipeline:
+    """Run several face analyzers over one decode/detect/crop pass"""
+
+    # Analyzer names accepted by analyze()
+    ANALYZERS = ('embedding', 'emotion', 'age_gender', 'landmarks', 'key_landmarks')
+
+    def __init__(self, model_manager=None):
+        self.model_manager = model_manager or get_model_manager()
+
+    @staticmethod
+    def _to_rgb(image: Image.Image) -> Image.Image:
+        """Flatten alpha onto white and make sure the image is RGB"""
+        if image.mode == 'RGBA':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])  # Use alpha as mask
+            return background
+        if image.mode != 'RGB':
+            return image.convert('RGB')
+        return image
+
+    @classmethod
+    def parse_analyzers(cls, value) -> list:
+        """
+        Normalize a caller-supplied analyzer list ('emotion,age_gender' or a list).
+
+        Raises:
+            ValueError: if an unknown analyzer is requested
+        """
+        if value is None:
+            return ['emotion', 'age_gender']
+        if isinstance(value, str):
+            value = value.split(',')
+        names = []
+        for name in value:
+            name = str(name).strip()
+            if not name:
+                continue
+            if name not in cls.ANALYZERS:
+                raise ValueError(f"Unknown analyzer '{name}'. Available: {', '.join(cls.ANALYZERS)}")
+            if name not in names:
+                names.append(name)
+        return names
+
+    def analyze(self, image: Image.Image, analyzers: Iterable[str] = ('emotion',),
+                confidence_threshold: float = 0.5, raise_errors: bool = False) -> Dict[str, Any]:
+        """
+        Analyze the largest face in an image.
+
+        Args:
+            image: PIL Image (may still be lazily decoded)
+            analyzers: names from ANALYZERS to run on the face crop
+            confidence_threshold: face detection threshold
+            raise_errors: if True, analyzer exceptions propagate; otherwise they
+                          are collected in 'errors' and the other analyzers still run
+
+        Returns:
+            Dict with:
+            - image: decoded RGB image
+            - faces: all detected faces
+            - face: largest face (None if no face was found)
+            - face_region: RGB crop of the largest face (None if no face)
+            - results: analyzer name -> result
+            - errors: analyzer name -> error message
+            - timings: stage name -> milliseconds
+        """
+        timings = {}
+
+        def timed(stage, func, *args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                timings[stage] = round((time.perf_counter() - start) * 1000, 2)
+
+        # Decode once
+        rgb = timed('decode', self._to_rgb, image)
+
+        # Detect once
+        faces = timed('detect', self.model_manager.detect_faces, rgb, confidence_threshold)
+
+        analysis = {
+            'image': rgb,
+            'faces': faces,
+            'face': None,
+            'face_region': None,
+            'results': {},
+            'errors': {},
+            'timings': timings
+        }
+        if not faces:
+            return analysis
+
+        # Crop once (largest face)
+        largest_face = max(faces, key=lambda f: f['bbox'][2] * f['bbox'][3])
+        face_region = timed('crop', self.model_manager.detector.get_face_region, rgb, largest_face)
+        analysis['face'] = largest_face
+        analysis['face_region'] = face_region
+
+        runners = {
+            'embedding': self.model_manager.extract_embedding,
+            'emotion': self.model_manager.detect_emotion,
+            'age_gender': self.model_manager.estimate_age_gender,
+            'landmarks': self.model_manager.detect_landmarks,
+        }
+
+        results = analysis['results']
+        for name in analyzers:
+            try:
+                if name == 'key_landmarks':
+                    # Reuse the full landmark set if it was (or will be) computed anyway
+                    if 'landmarks' not in results:
+                        results['landmarks'] = timed('landmarks', runners['landmarks'], face_region)
+                    results['key_landmarks'] = LandmarkDetector.select_key_landmarks(results['landmarks'])
+                elif name == 'landmarks':
+                    if 'landmarks' not in results:
+                        results['landmarks'] = timed('landmarks', runners['landmarks'], face_region)
+                else:
+                    results[name] = timed(name, runners[name], face_region)
+            except Exception as e:
+                if raise_errors:
+                    raise
+                analysis['errors'][name] = str(e)
+
+        # Only report what the caller asked for
+        if 'landmarks' in results and 'landmarks' not in analyzers:
+            del results['landmarks']
+
+        return analysis
+
+
+# Singleton instance
+_pipeline: Optional[FaceAnalysisPipeline] = None
+
+def get_face_analysis_pipeline(model_manager=None) -> FaceAnalysisPipeline:
+    """Get singleton FaceAnalysisPipeline instance"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = FaceAnalysisPipeline(model_manager)
+    return _pipeline
@@ -3,6 +3,7 @@ import cv2
 import numpy as np
 from PIL import Image
 import os
+import threading
 
 # Path to DNN model files
 MODEL_DIR = os.path.join(os.path.dirname(__file__), 'dnn_models')
@@ -15,6 +16,9 @@ class FaceDetector:
 
     _instance = None
     _net = None
+    # cv2.dnn.Net is not thread-safe: setInput() and forward() share its input
+    # blob, so request threads and capture workers must not interleave them
+    _forward_lock = threading.Lock()
 
     def __new__(cls):
         """Singleton pattern để tránh load model nhiều lần"""
@@ -37,19 +41,7 @@ class FaceDetector:
 
     def detect_faces(self, image, confidence_threshold=0.5):
 
-        # Convert PIL to numpy if needed
-        if isinstance(image, Image.Image):
-            img_array = np.array(image)
-            # PIL is RGB, convert to BGR for OpenCV
-            if len(img_array.shape) == 3:
-                # Handle RGBA by converting to RGB first
-                if img_array.shape[2] == 4:
-                    img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-                if img_array.shape[2] == 3:
-                    img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-        else:
-            img_array = image.copy()
-
+        img_array = self._to_bgr(image)
         h, w = img_array.shape[:2]
 
         # Create blob from image
@@ -64,16 +56,67 @@ class FaceDetector:
         )
 
         # Forward pass
-        self._net.setInput(blob)
-        detections = self._net.forward()
+        detections = self._forward(blob)
 
+        return self._parse_detections(detections[0, 0], w, h, confidence_threshold)
+
+    def detect_faces_batch(self, images, confidence_threshold=0.5):
+        """
+        Detect faces in several images with one forward pass (blobFromImages).
+
+        Returns:
+            list: faces for each image, same format and order as detect_faces()
+        """
+        if not images:
+            return []
+        arrays = [self._to_bgr(image) for image in images]
+        blob = cv2.dnn.blobFromImages(
+            arrays,
+            scalefactor=1.0,
+            size=(300, 300),
+            mean=(104.0, 177.0, 123.0),
+            swapRB=False,
+            crop=False
+        )
+        rows = self._forward(blob)[0, 0]
+
+        # Column 0 of every detection row is the index of its image in the batch
+        results = []
+        for index, img_array in enumerate(arrays):
+            h, w = img_array.shape[:2]
+            results.append(self._parse_detections(rows[rows[:, 0] == index], w, h, confidence_threshold))
+        return results
+
+    def _forward(self, blob):
+        with self._forward_lock:
+            self._net.setInput(blob)
+            return self._net.forward()
+
+    @staticmethod
+    def _to_bgr(image):
+        # Convert PIL to numpy if needed
+        if isinstance(image, Image.Image):
+            img_array = np.array(image)
+            # PIL is RGB, convert to BGR for OpenCV
+            if len(img_array.shape) == 3:
+                # Handle RGBA by converting to RGB first
+                if img_array.shape[2] == 4:
+                    img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
+                if img_array.shape[2] == 3:
+                    img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
+            return img_array
+        return image.copy()
+
+    @staticmethod
+    def _parse_detections(rows, w, h, confidence_threshold):
+        """Face dicts from SSD detection rows [image_id, label, confidence, x1, y1, x2, y2]"""
         faces = []
-        for i in range(detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
+        for row in rows:
+            confidence = row[2]
 
             if confidence > confidence_threshold:
                 # Get bounding box coordinates (normalized 0-1)
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
+                box = row[3:7] * np.array([w, h, w, h])
                 x1, y1, x2, y2 = box.astype(int)
 
                 # Ensure coordinates are within image bounds
@@ -234,7 +277,7 @@ class FaceDetector:
         img_rgb = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
         return Image.fromarray(img_rgb)
 
-    def get_face_positions_for_stickers(self, image, sticker_type='hat'):
+    def get_face_positions_for_stickers(self, image, sticker_type='hat', faces=None):
         """
         Get optimal positions for placing stickers on detected faces.
 
@@ -245,13 +288,16 @@ class FaceDetector:
         - mustache: Râu - đặt dưới mũi
         - noel_hat: Nón Noel - đặt trên đầu, nghiêng
         - bow: Nơ - đặt trên đầu, bên phải
+
+        faces: khuôn mặt đã detect sẵn (dict có 'bbox') - bỏ qua bước detect lại
         """
-        faces = self.detect_faces(image)
+        if faces is None:
+            faces = self.detect_faces(image)
         positions = []
 
         for face in faces:
             x, y, w, h = face['bbox']
-            cx, cy = face['center']
+            cx, cy = face.get('center') or (x + w // 2, y + h // 2)
 
             if sticker_type == 'hat':
                 # Mũ - đặt trên đầu, căn giữa
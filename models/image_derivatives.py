@@ -0,0 +1,290 @@
+"""
+DerivativeCache: resized variants of served images, generated on demand.
+
+/api/images/<folder>/<filename>?w=&h=&fit=&format= returns a resized copy of
+the image. Sizes are restricted to an allow-list so clients cannot fill the
+disk with arbitrary variants. Each variant is rendered once (JPEG sources are
+decoded at reduced scale with Image.draft) into a cache directory that is
+bounded by total bytes; least recently served files are deleted first.
+
+File names contain the source content hash (utils/http_cache.file_etag), so a
+source rewritten in place gets new variants and stale ones age out.
+
+Without an explicit format the served format is negotiated from the Accept
+header (AVIF when Pillow can encode it, then WebP). Encode time and bytes
+saved are recorded per source kind (folder) and format for /api/images/stats.
+"""
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+from utils.cache import LRUCache
+from utils.http_cache import file_etag
+
+# Allowed values of w and h (px)
+ALLOWED_SIZES = (64, 128, 200, 320, 480, 640, 960, 1280)
+
+FITS = ('contain', 'cover')
+
+# format param -> (Pillow format, file extension, save options)
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 85}),
+    'png': ('PNG', 'png', {}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+if features.check('avif'):
+    FORMATS['avif'] = ('AVIF', 'avif', {'quality': 60, 'speed': 8})
+
+# Formats offered through Accept negotiation, most preferred first
+NEGOTIATED_FORMATS = ('avif', 'webp')
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class DerivativeCache:
+    """Byte-budgeted disk cache of resized images"""
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 allowed_sizes: Tuple[int, ...] = ALLOWED_SIZES,
+                 negotiated_formats: Tuple[str, ...] = NEGOTIATED_FORMATS,
+                 quality: Optional[Dict[str, int]] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.allowed_sizes = tuple(sorted(allowed_sizes))
+        self.negotiated_formats = tuple(f for f in negotiated_formats if f in FORMATS)
+        # 'webp' or '<kind>.webp' (e.g. 'thumbnails.webp') -> encoder quality
+        self.quality = dict(quality or {})
+        # (kind, format) -> encode counters
+        self._encode_stats: Dict[Tuple[str, str], Dict] = {}
+        self._stats_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # file name -> size in bytes; eviction deletes the file
+        self._index = LRUCache(max_entries=None, max_bytes=max_bytes,
+                               size_of=lambda nbytes: nbytes, on_evict=self._delete)
+        self.generated = 0
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Index files left by a previous run, oldest first so they are evicted first"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                st = entry.stat()
+                entries.append((st.st_mtime_ns, entry.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._index.put(name, size)
+
+    def _delete(self, name: str, _size: int) -> None:
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+    def parse_params(self, args) -> Optional[Dict]:
+        """
+        Read w/h/fit/format from request args.
+
+        Args:
+            args: mapping of query parameters
+
+        Returns:
+            dict(w, h, fit, format) or None when no resize parameter is present;
+            format is None when not given
+
+        Raises:
+            ValueError: size not in the allow-list, unknown fit/format, or
+                fit=cover without both w and h
+        """
+        if not any(args.get(k) for k in ('w', 'h', 'fit', 'format')):
+            return None
+
+        # format None = not requested (JPEG unless negotiate() picks one)
+        params = {'fit': args.get('fit') or 'contain', 'format': (args.get('format') or '').lower() or None}
+        for key in ('w', 'h'):
+            value = args.get(key)
+            if value in (None, ''):
+                params[key] = None
+                continue
+            try:
+                params[key] = int(value)
+            except ValueError:
+                raise ValueError(f"{key} must be an integer")
+            if params[key] not in self.allowed_sizes:
+                raise ValueError(f"{key} must be one of {list(self.allowed_sizes)}")
+
+        if params['fit'] not in FITS:
+            raise ValueError(f"fit must be one of {list(FITS)}")
+        if params['format'] is not None and params['format'] not in FORMATS:
+            raise ValueError(f"format must be one of {list(FORMATS)}")
+        if params['fit'] == 'cover' and not (params['w'] and params['h']):
+            raise ValueError("fit=cover requires both w and h")
+        return params
+
+    def negotiate(self, accept, params: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Pick a modern format the client explicitly accepts.
+
+        Only formats listed by name count: a bare */* (curl, fetch defaults)
+        keeps the source format.
+
+        Args:
+            accept: request.accept_mimetypes (iterable of (mimetype, quality))
+            params: parse_params() result, or None for a full-size transcode
+
+        Returns:
+            params with the negotiated format, or params unchanged (None if
+            nothing to do) when no format applies or one was requested explicitly
+        """
+        if params and params['format']:
+            return params
+        offered = {value for value, q in accept if q > 0}
+        for fmt in self.negotiated_formats:
+            if f'image/{fmt}' in offered:
+                base = params or {'w': None, 'h': None, 'fit': 'contain'}
+                return {**base, 'format': fmt}
+        return params
+
+    def get(self, src_path: str, params: Dict, etag: Optional[str] = None, kind: str = 'image') -> str:
+        """
+        Path of the variant of src_path described by params, rendering it if needed.
+
+        Args:
+            src_path: source image
+            params: parse_params() result
+            etag: file_etag(src_path) if the caller already has it
+            kind: source folder, used for per-kind quality and stats
+
+        Returns:
+            str: path inside cache_dir
+        """
+        params = {**params, 'format': params['format'] or 'jpeg'}
+        name = self.derivative_name(src_path, params, etag, kind)
+        path = os.path.join(self.cache_dir, name)
+        if self._index.get(name) is not None and os.path.exists(path):
+            return path
+        if not os.path.exists(path):
+            self._render(src_path, params, path, kind)
+        nbytes = os.path.getsize(path)
+        # A file larger than the whole budget would be deleted before it is served;
+        # leave it unindexed (it is dropped when the index is rebuilt)
+        if nbytes <= self.max_bytes:
+            self._index.put(name, nbytes)
+        return path
+
+    def derivative_name(self, src_path: str, params: Dict, etag: Optional[str] = None,
+                        kind: str = 'image') -> str:
+        stem = os.path.splitext(os.path.basename(src_path))[0]
+        etag = etag or file_etag(src_path)
+        ext = FORMATS[params['format']][1]
+        quality = self._save_options(params['format'], kind).get('quality', 0)
+        return f"{stem}_{etag}_{params['w'] or 0}x{params['h'] or 0}_{params['fit']}_q{quality}.{ext}"
+
+    def _save_options(self, fmt: str, kind: str) -> Dict:
+        options = dict(FORMATS[fmt][2])
+        quality = self.quality.get(f'{kind}.{fmt}', self.quality.get(fmt))
+        if quality is not None and 'quality' in options:
+            options['quality'] = int(quality)
+        return options
+
+    def _render(self, src_path: str, params: Dict, path: str, kind: str = 'image') -> None:
+        start = time.perf_counter()
+        pil_format = FORMATS[params['format']][0]
+        save_options = self._save_options(params['format'], kind)
+        with Image.open(src_path) as img:
+            out_size, decode_size = self._target_sizes(img.size, params)
+            if img.format == 'JPEG':
+                # DCT scaling: decode at 1/2, 1/4 or 1/8 when the target allows it
+                img.draft('RGB', decode_size)
+            keep_alpha = pil_format != 'JPEG' and 'A' in img.getbands()
+            image = img.convert('RGBA' if keep_alpha else 'RGB')
+
+        if params['fit'] == 'cover':
+            image = ImageOps.fit(image, out_size, Image.LANCZOS)
+        elif image.size != out_size:
+            image = image.resize(out_size, Image.LANCZOS)
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, pil_format, **save_options)
+        os.replace(tmp_path, path)
+        self.generated += 1
+        self._record_encode(kind, params['format'], (time.perf_counter() - start) * 1000,
+                            os.path.getsize(src_path), os.path.getsize(path))
+
+    def _record_encode(self, kind: str, fmt: str, elapsed_ms: float, source_bytes: int,
+                       output_bytes: int) -> None:
+        with self._stats_lock:
+            entry = self._encode_stats.setdefault(
+                (kind, fmt), {'count': 0, 'encode_ms': 0.0, 'source_bytes': 0, 'bytes': 0})
+            entry['count'] += 1
+            entry['encode_ms'] += elapsed_ms
+            entry['source_bytes'] += source_bytes
+            entry['bytes'] += output_bytes
+
+    def encode_stats(self) -> Dict:
+        """{kind: {format: count, avg_encode_ms, source_bytes, bytes, savings_pct}}"""
+        result = {}
+        with self._stats_lock:
+            items = [(key, dict(entry)) for key, entry in self._encode_stats.items()]
+        for (kind, fmt), entry in items:
+            result.setdefault(kind, {})[fmt] = {
+                'count': entry['count'],
+                'avg_encode_ms': round(entry['encode_ms'] / entry['count'], 2),
+                'source_bytes': entry['source_bytes'],
+                'bytes': entry['bytes'],
+                'savings_pct': round(100.0 * (1 - entry['bytes'] / entry['source_bytes']), 1)
+                if entry['source_bytes'] else 0.0,
+                'quality': self._save_options(fmt, kind).get('quality')
+            }
+        return result
+
+    @staticmethod
+    def _target_sizes(src_size: Tuple[int, int], params: Dict):
+        """(output size, minimum decode size); images are never upscaled"""
+        src_w, src_h = src_size
+        w, h = params['w'], params['h']
+        if params['fit'] == 'cover':
+            # Largest w:h box that fits in the source, capped at w x h
+            shrink = min(1.0, src_w / w, src_h / h)
+            out_size = (max(1, round(w * shrink)), max(1, round(h * shrink)))
+            scale = max(out_size[0] / src_w, out_size[1] / src_h)
+            decode_size = (math.ceil(src_w * scale), math.ceil(src_h * scale))
+            return out_size, decode_size
+
+        scale = min(1.0, (w or src_w) / src_w, (h or src_h) / src_h)
+        out_size = (max(1, round(src_w * scale)), max(1, round(src_h * scale)))
+        return out_size, out_size
+
+    def stats(self) -> Dict:
+        return {
+            'cache_dir': self.cache_dir,
+            'generated': self.generated,
+            'negotiated_formats': list(self.negotiated_formats),
+            'index': self._index.stats(),
+            'encode': self.encode_stats()
+        }
+
+
+# Singleton instance
+_derivative_cache: Optional[DerivativeCache] = None
+_derivative_cache_lock = threading.Lock()
+
+def get_derivative_cache(config=None) -> DerivativeCache:
+    """Get singleton DerivativeCache instance (directory and budget from config on first use)"""
+    global _derivative_cache
+    with _derivative_cache_lock:
+        if _derivative_cache is None:
+            config = config or {}
+            upload_folder = config.get('UPLOAD_FOLDER', os.path.join('static', 'uploads'))
+            sizes = config.get('IMAGE_DERIVATIVE_SIZES') or ALLOWED_SIZES
+            _derivative_cache = DerivativeCache(
+                cache_dir=config.get('DERIVATIVES_FOLDER', os.path.join(upload_folder, 'derivatives')),
+                max_bytes=int(config.get('IMAGE_DERIVATIVE_CACHE_BYTES', DEFAULT_MAX_BYTES)),
+                allowed_sizes=tuple(int(s) for s in sizes),
+                negotiated_formats=tuple(config.get('IMAGE_NEGOTIATED_FORMATS') or NEGOTIATED_FORMATS),
+                quality=config.get('IMAGE_VARIANT_QUALITY')
+            )
+    return _derivative_cache
@@ -4,15 +4,16 @@ in the project. Phase 0 provides skeleton methods and delegates face detection t
 the existing FaceDetector -- later phases will implement embeddings, emotion,
 landmark and age/gender models.
 """
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Mapping, Optional
 import numpy as np
 import cv2
 from PIL import Image
 import os
 import hashlib
+import threading
+import time
 
 from .face_detector import get_detector
-from .embeddings import l2_normalize
 
 try:
     import tensorflow as tf
@@ -35,36 +36,90 @@ except ImportError:
     _HAS_OPENCV = False
 
 try:
-    import tf2onnx
     import onnxruntime as ort
-    _HAS_ONNX = True
+    _HAS_ONNXRUNTIME = True
+except ImportError:
+    _HAS_ONNXRUNTIME = False
+
+try:
+    import tf2onnx
+    _HAS_ONNX = _HAS_ONNXRUNTIME  # export needs both
 except ImportError:
     _HAS_ONNX = False
 
 
+class LatencyStats:
+    """Rolling latency samples per backend (milliseconds per face)"""
+
+    def __init__(self, window: int = 512):
+        self.window = window
+        self._samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, backend: str, elapsed_ms: float, count: int = 1):
+        per_face = elapsed_ms / max(1, count)
+        with self._lock:
+            samples = self._samples.setdefault(backend, [])
+            samples.append(per_face)
+            if len(samples) > self.window:
+                del samples[:len(samples) - self.window]
+
+    @staticmethod
+    def describe(samples: List[float]) -> Dict[str, Any]:
+        return {
+            'samples': len(samples),
+            'p50_ms': round(float(np.percentile(samples, 50)), 3),
+            'p95_ms': round(float(np.percentile(samples, 95)), 3)
+        }
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {backend: self.describe(samples)
+                    for backend, samples in self._samples.items() if samples}
+
+
 class FaceNetEmbedder:
-    """FaceNet embedding extractor using TensorFlow/Keras"""
+    """FaceNet embedding extractor using TensorFlow/Keras (or its ONNX export)"""
+
+    # ONNX Runtime graph optimization levels by config name
+    ONNX_OPTIMIZATION_LEVELS = {
+        'disable': 'ORT_DISABLE_ALL',
+        'basic': 'ORT_ENABLE_BASIC',
+        'extended': 'ORT_ENABLE_EXTENDED',
+        'all': 'ORT_ENABLE_ALL'
+    }
 
     def __init__(self):
-        if not _HAS_TENSORFLOW:
+        if not _HAS_TENSORFLOW and not _HAS_ONNXRUNTIME:
             raise ImportError("TensorFlow not available. Install with: pip install tensorflow")
 
         # FaceNet model path (will be downloaded if not exists)
         self.model_path = os.path.join(os.path.dirname(__file__), 'facenet_model.h5')
+        self.onnx_path = self.model_path.replace('.h5', '.onnx')
 
-        # Model will be loaded lazily
+        # Models will be loaded lazily
         self.model = None
+        self.onnx_session = None
+        self.use_onnx = False
+        self._load_lock = threading.Lock()
 
     def load_model(self):
         """Load FaceNet model"""
         if self.model is not None:
             return
 
-        if not os.path.exists(self.model_path):
-            print("Downloading FaceNet model...")
-            self._download_facenet_model()
+        if not _HAS_TENSORFLOW:
+            raise ImportError("TensorFlow not available. Install with: pip install tensorflow")
+
+        with self._load_lock:
+            if self.model is not None:
+                return
 
-        self.model = load_model(self.model_path, compile=False)
+            if not os.path.exists(self.model_path):
+                print("Downloading FaceNet model...")
+                self._download_facenet_model()
+
+            self.model = load_model(self.model_path, compile=False)
 
     def _download_facenet_model(self):
         """Download pre-trained FaceNet model"""
@@ -95,35 +150,77 @@ class FaceNetEmbedder:
 
     def preprocess_face(self, face_image):
         """Preprocess face image for FaceNet input"""
-        # Convert to RGB if needed
-        if isinstance(face_image, Image.Image):
-            face_array = np.array(face_image.convert('RGB'))
-        else:
-            face_array = face_image
+        # Batch of one, kept for callers that work face by face
+        return self.preprocess_faces([face_image])
+
+    def preprocess_faces(self, face_images) -> np.ndarray:
+        """
+        Preprocess several face crops into one FaceNet input tensor.
 
-        # Resize to 160x160 (FaceNet input size)
-        face_resized = cv2.resize(face_array, (160, 160))
+        Each crop is resized straight into a preallocated uint8 batch, then the
+        whole batch is normalized to [-1, 1] in a single vectorized step.
+
+        Args:
+            face_images: list of PIL Images or RGB numpy arrays (any size)
+
+        Returns:
+            np.ndarray of shape (N, 160, 160, 3), float32
+        """
+        batch = np.empty((len(face_images), 160, 160, 3), dtype=np.uint8)
+
+        for i, face_image in enumerate(face_images):
+            # Convert to RGB if needed
+            if isinstance(face_image, Image.Image):
+                face_array = np.asarray(face_image.convert('RGB'))
+            else:
+                face_array = np.asarray(face_image)
+                if face_array.ndim == 2:
+                    face_array = cv2.cvtColor(face_array, cv2.COLOR_GRAY2RGB)
+                elif face_array.shape[2] == 4:
+                    face_array = face_array[:, :, :3]
+
+            # Resize to 160x160 (FaceNet input size)
+            batch[i] = cv2.resize(np.ascontiguousarray(face_array, dtype=np.uint8), (160, 160))
 
         # Normalize to [-1, 1]
-        face_normalized = (face_resized - 127.5) / 127.5
+        return (batch.astype(np.float32) - 127.5) / 127.5
 
-        # Add batch dimension
-        return np.expand_dims(face_normalized, axis=0)
+    @staticmethod
+    def _normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+        """L2 normalize each embedding row"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
 
     def extract_embedding(self, face_image):
         """Extract 128-dimensional embedding from face image"""
-        self.load_model()
+        return self.extract_embeddings([face_image])[0]
 
-        # Preprocess
-        processed_face = self.preprocess_face(face_image)
+    def extract_embeddings(self, face_images, batch_size: int = 32) -> np.ndarray:
+        """
+        Extract embeddings for many face crops with one inference per chunk.
 
-        # Extract embedding
-        embedding = self.model.predict(processed_face, verbose=0)
+        Args:
+            face_images: list of PIL Images or RGB numpy arrays
+            batch_size: maximum number of faces per model call
 
-        # L2 normalize
-        embedding = l2_normalize(embedding[0])
+        Returns:
+            np.ndarray of shape (N, 128), each row L2-normalized
+        """
+        self.load_model()
 
-        return embedding
+        if len(face_images) == 0:
+            return np.zeros((0, 128), dtype=np.float32)
+
+        batch_size = max(1, int(batch_size))
+        chunks = []
+        for start in range(0, len(face_images), batch_size):
+            processed = self.preprocess_faces(face_images[start:start + batch_size])
+            # predict_on_batch skips the per-call data pipeline setup of predict()
+            chunks.append(np.asarray(self.model.predict_on_batch(processed)))
+
+        return self._normalize_rows(np.concatenate(chunks, axis=0))
 
     def export_to_onnx(self, onnx_path: str = None) -> str:
         """
@@ -141,16 +238,13 @@ class FaceNetEmbedder:
         self.load_model()
 
         if onnx_path is None:
-            onnx_path = self.model_path.replace('.h5', '.onnx')
-
-        # Create sample input for ONNX export
-        sample_input = np.random.rand(1, 160, 160, 3).astype(np.float32)
+            onnx_path = self.onnx_path
 
-        # Export to ONNX
+        # Export to ONNX with a dynamic batch dimension so whole batches run at once
         import tf2onnx
         tf2onnx.convert.from_keras(
             self.model,
-            input_signature=[tf.TensorSpec(sample_input.shape, tf.float32, name='input')],
+            input_signature=[tf.TensorSpec((None, 160, 160, 3), tf.float32, name='input')],
             opset=13,
             output_path=onnx_path
         )
@@ -158,42 +252,70 @@ class FaceNetEmbedder:
         print(f"Model exported to ONNX: {onnx_path}")
         return onnx_path
 
-    def load_onnx_model(self, onnx_path: str = None):
+    def load_onnx_model(self, onnx_path: str = None, intra_op_threads: int = 0,
+                        inter_op_threads: int = 0, graph_optimization: str = 'all'):
         """
         Load ONNX version of the model for faster inference.
 
+        The session is created once and shared by all request threads
+        (InferenceSession.run is thread-safe).
+
         Args:
             onnx_path: Path to ONNX model file
+            intra_op_threads: threads used inside one operator (0 = ONNX Runtime default)
+            inter_op_threads: threads used across independent operators (0 = default)
+            graph_optimization: 'disable', 'basic', 'extended' or 'all'
         """
-        if not _HAS_ONNX:
+        if not _HAS_ONNXRUNTIME:
             raise ImportError("ONNX runtime not available")
 
         if onnx_path is None:
-            onnx_path = self.model_path.replace('.h5', '.onnx')
+            onnx_path = self.onnx_path
 
         if not os.path.exists(onnx_path):
             # Export model first
             onnx_path = self.export_to_onnx(onnx_path)
 
-        self.onnx_session = ort.InferenceSession(onnx_path)
-        self.use_onnx = True
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+        if inter_op_threads:
+            options.inter_op_num_threads = int(inter_op_threads)
+            if int(inter_op_threads) > 1:
+                options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        level = self.ONNX_OPTIMIZATION_LEVELS.get(str(graph_optimization).lower(), 'ORT_ENABLE_ALL')
+        options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, level)
+
+        with self._load_lock:
+            self.onnx_session = ort.InferenceSession(
+                onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+            self.use_onnx = True
 
     def extract_embedding_onnx(self, face_image):
         """Extract embedding using ONNX model (faster inference)"""
-        if not hasattr(self, 'onnx_session'):
+        return self.extract_embeddings_onnx([face_image])[0]
+
+    def extract_embeddings_onnx(self, face_images, batch_size: int = 32) -> np.ndarray:
+        """Batched variant of extract_embedding_onnx"""
+        if self.onnx_session is None:
             raise RuntimeError("ONNX model not loaded. Call load_onnx_model() first")
 
-        # Preprocess
-        processed_face = self.preprocess_face(face_image)
+        if len(face_images) == 0:
+            return np.zeros((0, 128), dtype=np.float32)
 
-        # Run inference
-        outputs = self.onnx_session.run(None, {'input': processed_face})
-        embedding = outputs[0]
+        # Models exported before the dynamic-batch signature only accept batches of one
+        input_batch = self.onnx_session.get_inputs()[0].shape[0]
+        if isinstance(input_batch, int):
+            batch_size = input_batch
+        batch_size = max(1, int(batch_size))
 
-        # L2 normalize
-        embedding = l2_normalize(embedding[0])
+        chunks = []
+        for start in range(0, len(face_images), batch_size):
+            processed = self.preprocess_faces(face_images[start:start + batch_size])
+            outputs = self.onnx_session.run(None, {'input': processed})
+            chunks.append(outputs[0])
 
-        return embedding
+        return self._normalize_rows(np.concatenate(chunks, axis=0))
 
 
 class EmotionDetector:
@@ -373,8 +495,17 @@ class LandmarkDetector:
         Returns:
             Dict with key landmark groups
         """
-        landmarks = self.detect_landmarks(face_image)
+        return self.select_key_landmarks(self.detect_landmarks(face_image))
+
+    @staticmethod
+    def select_key_landmarks(landmarks):
+        """
+        Pick the key landmark groups out of a full landmark list, so callers that
+        already ran detect_landmarks don't run the mesh twice.
 
+        Returns:
+            Dict with key landmark groups
+        """
         if not landmarks:
             return {}
 
@@ -411,10 +542,30 @@ class ModelManager:
     signatures for embedding/emotion/landmarks to be implemented in later phases.
     """
 
-    def __init__(self):
+    # Defaults for settings that can be overridden from the Flask config
+    DEFAULT_SETTINGS = {
+        'EMBEDDING_BATCH_SIZE': 32,
+        'EMBEDDING_BACKEND': 'auto',  # auto | onnx | tensorflow
+        'ONNX_INTRA_OP_THREADS': 0,
+        'ONNX_INTER_OP_THREADS': 0,
+        'ONNX_GRAPH_OPTIMIZATION': 'all',
+    }
+
+    def __init__(self, config: Optional[Mapping] = None):
         # Underlying face detector (SSD DNN)
         self.detector = get_detector()
 
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        self.embedding_batch_size = self.settings['EMBEDDING_BATCH_SIZE']
+        if config is not None:
+            self.configure(config)
+
+        # Embedding backend selection happens once, on first use
+        self._backend_lock = threading.Lock()
+        self._onnx_checked = False
+        self.embedding_latency = LatencyStats()
+        self.last_benchmark = None
+
         # FaceNet embedder (lazy loaded)
         self._embedding_model = None
 
@@ -427,6 +578,12 @@ class ModelManager:
         # Landmark detector (lazy loaded)
         self._landmark_model = None
 
+    def configure(self, config: Mapping):
+        """Apply model settings from a config mapping (e.g. Flask app.config)"""
+        for key, default in self.DEFAULT_SETTINGS.items():
+            self.settings[key] = config.get(key, default)
+        self.embedding_batch_size = int(self.settings['EMBEDDING_BATCH_SIZE'])
+
     @property
     def embedding_model(self):
         """Lazy load FaceNet embedder"""
@@ -463,6 +620,36 @@ class ModelManager:
         return self.detector.detect_largest_face(image, confidence_threshold=confidence_threshold)
 
     # Embedding API
+    def _load_onnx_session(self):
+        """Create the shared ONNX Runtime session with the configured tuning"""
+        self.embedding_model.load_onnx_model(
+            intra_op_threads=int(self.settings['ONNX_INTRA_OP_THREADS']),
+            inter_op_threads=int(self.settings['ONNX_INTER_OP_THREADS']),
+            graph_optimization=self.settings['ONNX_GRAPH_OPTIMIZATION']
+        )
+
+    def select_embedding_backend(self) -> str:
+        """
+        Return 'onnx' or 'tensorflow'. ONNX is picked automatically whenever an
+        exported model exists, unless EMBEDDING_BACKEND forces TensorFlow.
+        """
+        backend = str(self.settings['EMBEDDING_BACKEND']).lower()
+        if backend == 'tensorflow':
+            return 'tensorflow'
+
+        embedder = self.embedding_model
+        if not self._onnx_checked:
+            with self._backend_lock:
+                if not self._onnx_checked:
+                    if _HAS_ONNXRUNTIME and (backend == 'onnx' or os.path.exists(embedder.onnx_path)):
+                        try:
+                            self._load_onnx_session()
+                        except Exception as e:
+                            print(f"ONNX embedding backend unavailable, using TensorFlow: {e}")
+                    self._onnx_checked = True
+
+        return 'onnx' if embedder.use_onnx else 'tensorflow'
+
     def extract_embedding(self, face_image) -> np.ndarray:
         """
         Extract 128-dimensional embedding vector from a cropped face image using FaceNet.
@@ -474,15 +661,76 @@ class ModelManager:
         Returns:
             np.ndarray: 128-dimensional embedding vector
         """
+        return self.extract_embeddings([face_image])[0]
+
+    def extract_embeddings(self, face_images, batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Extract embeddings for many cropped faces, batching model calls.
+
+        Args:
+            face_images: list of PIL Images or numpy arrays of cropped faces
+            batch_size: faces per inference call (default: EMBEDDING_BATCH_SIZE)
+
+        Returns:
+            np.ndarray of shape (N, 128), each row L2-normalized
+        """
+        batch_size = batch_size or self.embedding_batch_size
+
         # Try ONNX model first if available, fallback to TensorFlow
-        if hasattr(self.embedding_model, 'use_onnx') and self.embedding_model.use_onnx:
+        if self.select_embedding_backend() == 'onnx':
+            start = time.perf_counter()
             try:
-                return self.embedding_model.extract_embedding_onnx(face_image)
+                embeddings = self.embedding_model.extract_embeddings_onnx(face_images, batch_size)
+                self.embedding_latency.record('onnx', (time.perf_counter() - start) * 1000, len(face_images))
+                return embeddings
             except Exception:
                 # Fallback to TensorFlow model
                 pass
 
-        return self.embedding_model.extract_embedding(face_image)
+        start = time.perf_counter()
+        embeddings = self.embedding_model.extract_embeddings(face_images, batch_size)
+        self.embedding_latency.record('tensorflow', (time.perf_counter() - start) * 1000, len(face_images))
+        return embeddings
+
+    def benchmark_embedding_backends(self, runs: int = 20) -> Dict[str, Any]:
+        """
+        Time single-face embedding on every available backend.
+
+        Args:
+            runs: timed inferences per backend (after one warm-up call)
+
+        Returns:
+            Dict keyed by backend with p50_ms/p95_ms, or an 'error' entry
+        """
+        embedder = self.embedding_model
+        face = np.random.randint(0, 256, (160, 160, 3), dtype=np.uint8)
+        results = {}
+
+        backends = {
+            'tensorflow': (_HAS_TENSORFLOW and os.path.exists(embedder.model_path),
+                           embedder.extract_embeddings),
+            'onnx': (_HAS_ONNXRUNTIME and os.path.exists(embedder.onnx_path),
+                     embedder.extract_embeddings_onnx)
+        }
+        for name, (available, extract) in backends.items():
+            if not available:
+                results[name] = {'error': 'not available'}
+                continue
+            try:
+                if name == 'onnx' and embedder.onnx_session is None:
+                    self._load_onnx_session()
+                extract([face], 1)  # warm-up
+                samples = []
+                for _ in range(max(1, int(runs))):
+                    start = time.perf_counter()
+                    extract([face], 1)
+                    samples.append((time.perf_counter() - start) * 1000)
+                results[name] = LatencyStats.describe(samples)
+            except Exception as e:
+                results[name] = {'error': str(e)}
+
+        self.last_benchmark = results
+        return results
 
     def compute_image_hash(self, image) -> str:
         """Compute SHA256 hash of image for duplicate detection"""
@@ -548,9 +796,11 @@ class ModelManager:
 # Convenience singleton for code that prefers a single manager instance
 _model_manager: Optional[ModelManager] = None
 
-def get_model_manager() -> ModelManager:
+def get_model_manager(config: Optional[Mapping] = None) -> ModelManager:
     global _model_manager
     if _model_manager is None:
-        _model_manager = ModelManager()
+        _model_manager = ModelManager(config)
+    elif config is not None:
+        _model_manager.configure(config)
     return _model_manager
 
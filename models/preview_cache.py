@@ -0,0 +1,119 @@
+"""
+PreviewCache: short-lived preview images (sticker preview, face debug).
+
+Preview endpoints used to return the JPEG base64-encoded inside JSON. They
+now write it here and return a URL (/api/previews/<name>). Names are random
+tokens, files expire after ttl_seconds and a daemon thread deletes expired
+files every gc_interval seconds.
+"""
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+from PIL import Image
+
+
+class PreviewCache:
+    """Directory of preview JPEGs with time-based expiry"""
+
+    def __init__(self, cache_dir: str, ttl_seconds: int = 300, gc_interval: int = 60, quality: int = 90):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.gc_interval = gc_interval
+        self.quality = quality
+        self.removed = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._stop = threading.Event()
+        self._gc_thread: Optional[threading.Thread] = None
+
+    def put(self, image: Image.Image) -> str:
+        """
+        Encode image as JPEG into the cache.
+
+        Returns:
+            str: preview file name (random token + .jpg)
+        """
+        name = f"{uuid.uuid4().hex}.jpg"
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        image.convert('RGB').save(tmp_path, 'JPEG', quality=self.quality)
+        os.replace(tmp_path, path)
+        return name
+
+    def path(self, name: str) -> Optional[str]:
+        """Path of a live preview, or None if unknown/expired"""
+        if os.path.basename(name) != name or not name.endswith('.jpg'):
+            return None
+        path = os.path.join(self.cache_dir, name)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return None
+        except OSError:
+            return None
+        return path
+
+    def gc(self) -> int:
+        """Delete expired previews (and stale temp files); returns the number removed"""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        self.removed += removed
+        return removed
+
+    def start_gc(self) -> None:
+        """Run gc() every gc_interval seconds on a daemon thread (idempotent)"""
+        if self._gc_thread is not None and self._gc_thread.is_alive():
+            return
+        self._stop.clear()
+        self._gc_thread = threading.Thread(target=self._gc_loop, name='preview-gc', daemon=True)
+        self._gc_thread.start()
+
+    def stop_gc(self) -> None:
+        self._stop.set()
+
+    def _gc_loop(self) -> None:
+        while not self._stop.wait(self.gc_interval):
+            try:
+                self.gc()
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        try:
+            files = sum(1 for entry in os.scandir(self.cache_dir) if entry.is_file())
+        except OSError:
+            files = 0
+        return {
+            'cache_dir': self.cache_dir,
+            'files': files,
+            'removed': self.removed,
+            'ttl_seconds': self.ttl_seconds
+        }
+
+
+# Singleton instance
+_preview_cache: Optional[PreviewCache] = None
+_preview_cache_lock = threading.Lock()
+
+def get_preview_cache(config=None) -> PreviewCache:
+    """Get singleton PreviewCache instance (settings from config on first use, GC thread started)"""
+    global _preview_cache
+    with _preview_cache_lock:
+        if _preview_cache is None:
+            config = config or {}
+            upload_folder = config.get('UPLOAD_FOLDER', os.path.join('static', 'uploads'))
+            _preview_cache = PreviewCache(
+                cache_dir=config.get('PREVIEWS_FOLDER', os.path.join(upload_folder, 'previews')),
+                ttl_seconds=int(config.get('PREVIEW_TTL_SECONDS', 300)),
+                gc_interval=int(config.get('PREVIEW_GC_INTERVAL', 60))
+            )
+            _preview_cache.start_gc()
+    return _preview_cache
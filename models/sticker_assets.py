@@ -0,0 +1,182 @@
+"""
+StickerAssets: face accessory stickers (hat, glasses, ...) kept in memory.
+
+Each accessory PNG is decoded once (reloaded only when the file changes) and
+stored premultiplied ("RGBa") at a ladder of power-of-two widths. A sticker
+of any width is resized from the nearest larger rung, so the resample reads
+at most ~2x the target pixels instead of the full-size PNG, and exact widths
+are kept in an LRU because faces in a session tend to have similar sizes.
+Compositing works on numpy arrays and touches only the sticker's rectangle.
+"""
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utils.cache import LRUCache, image_nbytes
+
+# Loại phụ kiện -> file trong static/templates
+STICKER_MAP = {
+    'hat': 'hat-2.png',
+    'glasses': 'glasses.png',
+    'ears': 'rabbit_ears.png',
+    'mustache': 'mustache.png',
+    'noel_hat': 'noel-hat.png',
+    'bow': 'No.png'
+}
+DEFAULT_STICKER = 'hat'
+
+# Chiều rộng sticker so với chiều rộng khuôn mặt
+SIZE_MULTIPLIERS = {
+    'hat': 1.4,       # Mũ rộng hơn mặt
+    'glasses': 1.1,   # Kính vừa với mặt
+    'ears': 1.6,      # Tai thỏ rộng
+    'mustache': 0.5,  # Râu nhỏ hơn
+    'noel_hat': 1.5,  # Nón Noel rộng
+    'bow': 0.6        # Nơ nhỏ gọn
+}
+
+# Smallest rung of the size ladder (px)
+MIN_BUCKET_WIDTH = 32
+
+DEFAULT_STICKERS_DIR = os.path.join('static', 'templates')
+
+
+class StickerAssets:
+    """Decoded, pre-scaled accessory stickers"""
+
+    def __init__(self, stickers_dir: Optional[str] = None, max_entries: int = 256,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.stickers_dir = stickers_dir or DEFAULT_STICKERS_DIR
+        # abs path -> (mtime_ns, {bucket width: RGBa image}, native size)
+        self._ladders: Dict[str, Tuple[int, Dict[int, Image.Image], Tuple[int, int]]] = {}
+        # (abs path, mtime_ns, width) -> RGBa image
+        self._exact = LRUCache(max_entries=max_entries, max_bytes=max_bytes, size_of=image_nbytes)
+        self._lock = threading.Lock()
+
+    def sticker_path(self, sticker_type: str) -> str:
+        """PNG path of an accessory type (unknown types fall back to the hat)"""
+        name = STICKER_MAP.get(sticker_type, STICKER_MAP[DEFAULT_STICKER])
+        return os.path.join(self.stickers_dir, name)
+
+    def exists(self, sticker_type: str) -> bool:
+        return os.path.exists(self.sticker_path(sticker_type))
+
+    def target_size(self, sticker_type: str, face_width: int) -> Tuple[int, int]:
+        """Sticker size for a face: width from SIZE_MULTIPLIERS, height keeps the aspect ratio"""
+        _, _, (native_w, native_h) = self._ladder(self.sticker_path(sticker_type))
+        width = max(1, int(face_width * SIZE_MULTIPLIERS.get(sticker_type, 1.0)))
+        return width, max(1, int(width * native_h / native_w))
+
+    def get(self, sticker_type: str, width: int) -> Image.Image:
+        """
+        Premultiplied (RGBa) sticker of the given width.
+
+        Shared between callers - treat as read-only.
+        """
+        path = self.sticker_path(sticker_type)
+        mtime, ladder, (native_w, native_h) = self._ladder(path)
+        key = (path, mtime, width)
+        sticker = self._exact.get(key)
+        if sticker is None:
+            height = max(1, int(width * native_h / native_w))
+            # Nearest rung at least as wide as the target (the native image tops the ladder)
+            source = ladder[min((w for w in ladder if w >= width), default=max(ladder))]
+            sticker = source if source.size == (width, height) else source.resize((width, height), Image.LANCZOS)
+            self._exact.put(key, sticker)
+        return sticker
+
+    def place(self, sticker_type: str, pos: Dict, image_size: Tuple[int, int]):
+        """
+        Sticker image and top-left position for one face position.
+
+        Args:
+            sticker_type: accessory type
+            pos: entry of FaceDetector.get_face_positions_for_stickers()
+            image_size: (width, height) of the photo
+
+        Returns:
+            (premultiplied sticker, (x, y))
+        """
+        target_width, target_height = self.target_size(sticker_type, pos['face_bbox'][2])
+        sticker = self.get(sticker_type, target_width)
+
+        # Centered on the anchor point; bottom-center anchors sit on top of it
+        paste_x = pos['x'] - target_width // 2
+        paste_y = pos['y'] - target_height // 2
+        if pos.get('anchor', 'center') == 'bottom-center':
+            paste_y = pos['y'] - target_height
+
+        # Ensure position is within bounds
+        paste_x = max(0, min(paste_x, image_size[0] - target_width))
+        paste_y = max(0, min(paste_y, image_size[1] - target_height))
+        return sticker, (paste_x, paste_y)
+
+    def _ladder(self, path: str):
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._ladders.get(path)
+        if entry and entry[0] == mtime:
+            return entry
+
+        with Image.open(path) as img:
+            native = img.convert('RGBA').convert('RGBa')
+        native_w, native_h = native.size
+        ladder = {native_w: native}
+        width = MIN_BUCKET_WIDTH
+        while width < native_w:
+            height = max(1, round(native_h * width / native_w))
+            ladder[width] = native.resize((width, height), Image.LANCZOS)
+            width *= 2
+
+        entry = (mtime, ladder, native.size)
+        with self._lock:
+            self._ladders[path] = entry
+        return entry
+
+    @staticmethod
+    def composite(canvas: np.ndarray, sticker: Image.Image, position: Tuple[int, int]) -> None:
+        """
+        Draw a premultiplied sticker over an opaque RGB canvas in place.
+
+        Only the rectangle covered by the sticker (clipped to the canvas) is
+        read and written: out = src + dst * (255 - src_alpha) / 255.
+
+        Args:
+            canvas: HxWx3 uint8 array (modified)
+            sticker: RGBa image from get()
+            position: top-left (x, y), may be partly outside the canvas
+        """
+        x, y = position
+        height, width = canvas.shape[:2]
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(width, x + sticker.width), min(height, y + sticker.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        src = np.asarray(sticker)[y0 - y:y1 - y, x0 - x:x1 - x].astype(np.uint16)
+        roi = canvas[y0:y1, x0:x1]
+        out = src[..., :3] + (roi.astype(np.uint16) * (255 - src[..., 3:4]) + 127) // 255
+        roi[...] = np.minimum(out, 255).astype(np.uint8)
+
+    def stats(self) -> dict:
+        with self._lock:
+            ladders = {os.path.basename(p): sorted(entry[1]) for p, entry in self._ladders.items()}
+        return {'ladders': ladders, 'exact': self._exact.stats()}
+
+
+# Singleton instance
+_sticker_assets: Optional[StickerAssets] = None
+_sticker_assets_lock = threading.Lock()
+
+def get_sticker_assets(stickers_dir: Optional[str] = None) -> StickerAssets:
+    """Get singleton StickerAssets instance (optionally pointing it at stickers_dir)"""
+    global _sticker_assets
+    with _sticker_assets_lock:
+        if _sticker_assets is None:
+            _sticker_assets = StickerAssets(stickers_dir)
+        elif stickers_dir and os.path.abspath(stickers_dir) != os.path.abspath(_sticker_assets.stickers_dir):
+            _sticker_assets.stickers_dir = stickers_dir
+    return _sticker_assets
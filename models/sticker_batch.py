@@ -0,0 +1,130 @@
+"""
+Batched sticker application for a whole session (/api/apply-sticker-session).
+
+Instead of decode -> detect -> composite -> encode one photo after another:
+1. all photos are decoded concurrently (Pillow releases the GIL while decoding),
+2. faces come from the capture detection cache when available, the rest are
+   detected in a single batched DNN forward pass,
+3. stickers are composited only inside their rectangles (StickerAssets) and the
+   results are encoded and written atomically, concurrently.
+Every photo reports its own stage timings.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from .sticker_assets import StickerAssets
+
+
+def _ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 2)
+
+
+def apply_stickers_batch(items: List[Dict], sticker_type: str, assets: StickerAssets,
+                         detector, save: bool = True, quality: int = 95,
+                         max_workers: int = 4) -> Dict:
+    """
+    Apply an accessory sticker to several photos.
+
+    Args:
+        items: [{'key': caller id, 'path': JPEG path,
+                 'faces': cached faces or None, 'size': (w, h) the faces were found on}]
+        sticker_type: accessory type (see STICKER_MAP)
+        assets: StickerAssets
+        detector: FaceDetector (batched detection for photos without cached faces)
+        save: write the results over the source files
+        quality: JPEG quality of the written files
+        max_workers: decode/encode threads
+
+    Returns:
+        dict with 'results' (one per item, same order: key, success, faces,
+        detect_source, timings | error) and 'timings' (detect_batch, total_ms)
+    """
+    start = time.perf_counter()
+    results = [{'key': item['key']} for item in items]
+    workers = max(1, min(max_workers, len(items)))
+
+    def decode(index):
+        t = time.perf_counter()
+        with Image.open(items[index]['path']) as img:
+            image = img.convert('RGB')
+        results[index]['timings'] = {'decode': _ms(t)}
+        return image
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sticker') as pool:
+        images: List[Optional[Image.Image]] = [None] * len(items)
+        for index, future in enumerate([pool.submit(decode, i) for i in range(len(items))]):
+            try:
+                images[index] = future.result()
+            except Exception as e:
+                results[index].update({'success': False, 'error': str(e)})
+
+        # Faces: detection cache first, one batched forward pass for the rest
+        faces: List[Optional[list]] = [None] * len(items)
+        pending = []
+        for index, item in enumerate(items):
+            if images[index] is None:
+                continue
+            # Cached boxes are only valid for an image of the size they were found on
+            if item.get('faces') is not None and tuple(item.get('size') or ()) == images[index].size:
+                faces[index] = item['faces']
+                results[index]['detect_source'] = 'cache'
+            else:
+                pending.append(index)
+
+        detect_batch_ms = 0.0
+        if pending:
+            t = time.perf_counter()
+            detected = detector.detect_faces_batch([images[i] for i in pending])
+            detect_batch_ms = _ms(t)
+            for index, found in zip(pending, detected):
+                faces[index] = found
+                results[index]['detect_source'] = 'batch'
+
+        def composite_and_write(index):
+            image = images[index]
+            timings = results[index]['timings']
+            t = time.perf_counter()
+            # Faces are already known: position math only, no detection
+            positions = detector.get_face_positions_for_stickers(None, sticker_type, faces=faces[index])
+            canvas = np.array(image)
+            for pos in positions:
+                sticker, paste_xy = assets.place(sticker_type, pos, image.size)
+                assets.composite(canvas, sticker, paste_xy)
+            timings['composite'] = _ms(t)
+
+            if save and positions:
+                t = time.perf_counter()
+                path = items[index]['path']
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                Image.fromarray(canvas).save(tmp_path, 'JPEG', quality=quality)
+                os.replace(tmp_path, path)
+                # The capture's pre-cropped collage slot no longer matches the photo
+                root, _ = os.path.splitext(path)
+                try:
+                    os.remove(f"{root}_slot.jpg")
+                except OSError:
+                    pass
+                timings['write'] = _ms(t)
+            return len(positions)
+
+        jobs = {index: pool.submit(composite_and_write, index)
+                for index in range(len(items)) if images[index] is not None}
+        for index, future in jobs.items():
+            try:
+                face_count = future.result()
+                results[index].update({'success': True, 'faces': face_count})
+                if not face_count:
+                    results[index]['warning'] = 'No faces detected'
+            except Exception as e:
+                results[index].update({'success': False, 'error': str(e)})
+
+    return {
+        'results': results,
+        'timings': {'detect_batch': detect_batch_ms, 'total_ms': _ms(start)}
+    }
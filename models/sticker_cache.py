@@ -0,0 +1,111 @@
+"""
+ProcessedStickerCache: background-removed stickers, cached on disk and in memory.
+
+Background removal (checkered-pattern analysis, possibly rembg) is far too slow to
+run per collage request, so each sticker is processed once per content version:
+- disk tier: <cache_dir>/<stem>_<hash>.png, shared with /api/stickers/processed
+- memory tier: LRU of decoded RGBA images
+The hash covers the source file content, so an edited sticker is reprocessed;
+(path, mtime, size) only memoizes the hash to avoid rereading unchanged files.
+"""
+import hashlib
+import os
+import threading
+from typing import Optional
+
+from PIL import Image
+
+from utils.cache import LRUCache, image_nbytes
+
+# Bump when the background-removal algorithm changes to invalidate old files
+PROCESSING_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join("static", "templates", "processed")
+
+
+class ProcessedStickerCache:
+    """Cache of background-removed sticker images"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 64,
+                 max_bytes: int = 128 * 1024 * 1024):
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self._images = LRUCache(max_entries=max_entries, max_bytes=max_bytes, size_of=image_nbytes)
+        self._hashes = {}  # abs path -> (mtime_ns, size, digest)
+        self._lock = threading.Lock()
+
+    def content_hash(self, src_path: str) -> str:
+        """Hash of the sticker file content (memoized by path + mtime + size)"""
+        src_path = os.path.abspath(src_path)
+        st = os.stat(src_path)
+        with self._lock:
+            memo = self._hashes.get(src_path)
+            if memo and memo[0] == st.st_mtime_ns and memo[1] == st.st_size:
+                return memo[2]
+
+        hasher = hashlib.sha1(f"v{PROCESSING_VERSION}:".encode("ascii"))
+        with open(src_path, "rb") as f:
+            hasher.update(f.read())
+        digest = hasher.hexdigest()[:16]
+
+        with self._lock:
+            self._hashes[src_path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def processed_path(self, src_path: str) -> str:
+        """Disk location of the processed version of src_path"""
+        stem = os.path.splitext(os.path.basename(src_path))[0]
+        return os.path.join(self.cache_dir, f"{stem}_{self.content_hash(src_path)}.png")
+
+    def get(self, src_path: str) -> Image.Image:
+        """
+        Return the background-removed sticker as RGBA.
+
+        The returned image is shared between callers - treat it as read-only
+        (rotate/resize/copy produce new images and are fine).
+        """
+        path = self.ensure_processed(src_path)
+        image = self._images.get(path)
+        if image is None:
+            with Image.open(path) as img:
+                image = img.convert("RGBA")
+            self._images.put(path, image)
+        return image
+
+    def ensure_processed(self, src_path: str) -> str:
+        """Process src_path if needed and return the processed PNG path"""
+        path = self.processed_path(src_path)
+        if os.path.exists(path):
+            return path
+
+        # Import here: TemplateEngine uses this cache
+        from .template_engine import TemplateEngine
+
+        with Image.open(src_path) as img:
+            processed = TemplateEngine._remove_sticker_background(img.convert("RGBA"))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        processed.save(tmp_path, "PNG")
+        os.replace(tmp_path, path)
+
+        self._images.put(path, processed)
+        return path
+
+    def stats(self) -> dict:
+        return {
+            'cache_dir': self.cache_dir,
+            'memory': self._images.stats()
+        }
+
+
+# Singleton instance
+_sticker_cache: Optional[ProcessedStickerCache] = None
+
+def get_sticker_cache(cache_dir: Optional[str] = None) -> ProcessedStickerCache:
+    """Get singleton ProcessedStickerCache instance (optionally pointing it at cache_dir)"""
+    global _sticker_cache
+    if _sticker_cache is None:
+        _sticker_cache = ProcessedStickerCache(cache_dir)
+    elif cache_dir and os.path.abspath(cache_dir) != os.path.abspath(_sticker_cache.cache_dir):
+        _sticker_cache.cache_dir = cache_dir
+    return _sticker_cache
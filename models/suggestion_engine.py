@@ -202,22 +202,25 @@ class SuggestionEngine:
         return ", ".join(reasons)
 
     @staticmethod
-    def get_personalized_suggestions(image) -> Dict[str, any]:
+    def get_personalized_suggestions(image, analysis: Optional[Dict] = None) -> Dict[str, any]:
         """
         Analyze image and return comprehensive personalized suggestions.
 
         Args:
             image: PIL Image to analyze
+            analysis: result of FaceAnalysisPipeline.analyze() that already ran the
+                      'emotion' analyzer; when given, the image is not analyzed again
 
         Returns:
             Dict with emotion, suggested_filters, suggested_templates
         """
-        model_manager = get_model_manager()
-
         try:
-            # Detect face and emotion
-            faces = model_manager.detect_faces(image)
-            if not faces:
+            if analysis is None or 'emotion' not in analysis['results']:
+                from .face_analysis import get_face_analysis_pipeline
+                analysis = get_face_analysis_pipeline(get_model_manager()).analyze(
+                    image, ['emotion'], raise_errors=True)
+
+            if analysis['face'] is None:
                 return {
                     'emotion': None,
                     'suggested_filters': SuggestionEngine.suggest_filters(),
@@ -225,12 +228,8 @@ class SuggestionEngine:
                     'message': 'No face detected, showing default suggestions'
                 }
 
-            # Use largest face
-            largest_face = max(faces, key=lambda f: f['bbox'][2] * f['bbox'][3])
-            face_region = model_manager.detector.get_face_region(image, largest_face)
-
-            # Detect emotion
-            emotion_result = model_manager.detect_emotion(face_region)
+            # Emotion of the largest face
+            emotion_result = analysis['results']['emotion']
             emotion = emotion_result['dominant']
 
             # For now, age/gender estimation not implemented yet
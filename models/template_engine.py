@@ -2,13 +2,25 @@
 TemplateEngine: dynamic template renderer using Pillow.
 
 Provides:
-- get_available_templates()
+- get_available_templates(): built-in TEMPLATES plus the declarative catalog
+  (static/templates/templates.json, templates with PNG asset layers)
 - create_collage(image_paths, template_name, colors=None, decorations=None, fill_mode='duplicate')
+- build_collage(...): same as create_collage, returns path plus encode/render stats
 """
 from PIL import Image, ImageDraw, ImageFilter
+import numpy as np
+import hashlib
+import json
 import os
+import random
+import threading
 import io
 import math
+import re
+import time
+from utils.cache import LRUCache, image_nbytes
+from utils.png_writer import PNGStreamWriter
+from . import background_removal
 try:
     import cairosvg
     _HAS_CAIROSVG = True
@@ -125,49 +137,333 @@ class TemplateEngine:
         }
     }
 
-    def __init__(self, output_dir=None):
+    # Declarative templates with PNG asset layers (see load_template_catalog)
+    DEFAULT_CATALOG_PATH = os.path.join("static", "templates", "templates.json")
+
+    # Parsed catalogs: abs path -> (mtime_ns, {name: definition})
+    _catalogs = {}
+    _catalogs_lock = threading.Lock()
+
+    # Template assets decoded at canvas size with premultiplied alpha (mode "RGBa"):
+    # (path, mtime, canvas size) -> image
+    _asset_cache = LRUCache(max_entries=32, max_bytes=128 * 1024 * 1024, size_of=image_nbytes)
+
+    # Rendered backgrounds, shared by all engine instances.
+    # Key: ('solid'|'gradient', size, color spec, asset) -> RGBA canvas (never handed out directly, only copies)
+    _background_cache = LRUCache(max_entries=32, max_bytes=64 * 1024 * 1024, size_of=image_nbytes)
+
+    # Output encodings: format -> (Pillow format, file extension)
+    OUTPUT_FORMATS = {
+        "png": ("PNG", "png"),
+        "jpeg": ("JPEG", "jpg"),
+        "webp": ("WEBP", "webp"),
+    }
+
+    # Default output options, overridable per engine (config) and per request
+    DEFAULT_OUTPUT_OPTIONS = {
+        "format": "png",
+        "quality": 90,          # JPEG / lossy WebP (1-100)
+        "progressive": True,    # JPEG
+        "lossless": False,      # WebP
+        "compress_level": 6,    # PNG zlib level (0 = fastest, 9 = smallest)
+        "dpi": None,            # print rendering: output DPI (template size is at PRINT_BASE_DPI)
+        "scale": 1.0,           # print rendering: scale factor (ignored when dpi is set)
+    }
+
+    # Template sizes/positions are CSS pixels, i.e. 96 pixels per inch
+    PRINT_BASE_DPI = 96
+    # Rows rendered per band in print mode (peak memory ~ width * band height * 4 bytes)
+    PRINT_BAND_HEIGHT = 256
+    # Largest print render accepted (pixels)
+    MAX_PRINT_PIXELS = 150_000_000
+
+    # Bump when rendering changes so old cached collages are not reused
+    RENDER_VERSION = 1
+
+    # Minimum seconds between two cleanups of the collages folder
+    CLEANUP_INTERVAL = 60
+
+    # Content hashes of input files: abs path -> (mtime_ns, size, digest)
+    _file_hashes = {}
+    _file_hashes_lock = threading.Lock()
+
+    # Photos resized/cropped to a slot: (path, mtime, size, slot size) -> RGBA image
+    _slot_photo_cache = LRUCache(max_entries=256, max_bytes=128 * 1024 * 1024, size_of=image_nbytes)
+
+    # Max relative aspect-ratio difference for a pre-cropped derivative to stand in
+    # for the source (e.g. a 540x400 slot crop of a 4:3 capture loses < 2% per edge)
+    DERIVATIVE_ASPECT_TOLERANCE = 0.02
+
+    # Max relative aspect-ratio difference between a catalog frame asset and the
+    # canvas; the asset is scaled to the canvas, so a larger gap visibly distorts it
+    ASSET_ASPECT_TOLERANCE = 0.05
+
+    # Rasterized decorations: (path, mtime, scale, color) -> RGBA image
+    _decoration_cache = LRUCache(max_entries=128, max_bytes=64 * 1024 * 1024, size_of=image_nbytes)
+
+    def __init__(self, output_dir=None, background_cache_dir=None, output_options=None,
+                 catalog_path=None):
         # default to static/uploads/collages if not provided
         if output_dir:
             self.output_dir = output_dir
         else:
             self.output_dir = os.path.join("static", "uploads", "collages")
         os.makedirs(self.output_dir, exist_ok=True)
+        # Default encoding for saved collages (see DEFAULT_OUTPUT_OPTIONS)
+        self.output_options = self.normalize_output_options(output_options)
+        # Collage result cache limits (None = unlimited), see cleanup_collages()
+        self.max_cached_collages = None
+        self.collage_ttl_seconds = None
+        self._last_cleanup = 0.0
+        # Print rendering limits (see _build_print)
+        self.print_band_height = self.PRINT_BAND_HEIGHT
+        self.max_print_pixels = self.MAX_PRINT_PIXELS
+        # Optional disk tier for rendered backgrounds (PNG), survives restarts
+        self.background_cache_dir = background_cache_dir
+        # templates.json catalog, parsed now and re-read only when the file changes
+        self.catalog_path = catalog_path or self.DEFAULT_CATALOG_PATH
+        self.load_template_catalog(self.catalog_path)
+
+    @property
+    def templates(self):
+        """Built-in TEMPLATES plus the catalog templates (built-ins win on name clashes)"""
+        return {**self.load_template_catalog(self.catalog_path), **self.TEMPLATES}
+
+    def get_template(self, template_name):
+        """Template definition by name; raises ValueError if unknown or its frame asset is unusable"""
+        template = self.templates.get(template_name)
+        if template is None:
+            raise ValueError(f"Template '{template_name}' not found")
+        if template.get("asset_error"):
+            raise ValueError(template["asset_error"])
+        return template
 
     def get_available_templates(self):
         """Return basic metadata for available templates"""
         return {
             name: {
+                "name": t.get("name", name),
                 "layout": t["layout"],
                 "style": t.get("style"),
-                "size": t["size"]
+                "size": t["size"],
+                "photo_size": t["photo_size"],
+                "positions": t["positions"],
+                "has_asset": bool(t.get("asset"))
             }
-            for name, t in self.TEMPLATES.items()
+            for name, t in self.templates.items()
+            if not t.get("asset_error")
+        }
+
+    @classmethod
+    def load_template_catalog(cls, path):
+        """
+        Parse a templates.json catalog into template definitions (cached by mtime).
+
+        Each entry needs size, photo_size and positions; asset paths are relative
+        to the static folder (the catalog's parent directory). Entries that cannot
+        be used are skipped; entries whose asset cannot be resolved are kept with
+        an "asset_error" (get_template raises it, they are not listed).
+
+        Returns:
+            dict: name -> definition in the same shape as TEMPLATES
+        """
+        path = os.path.abspath(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return {}
+        with cls._catalogs_lock:
+            cached = cls._catalogs.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        static_dir = os.path.dirname(os.path.dirname(path))
+        templates = {}
+        for name, entry in (raw.items() if isinstance(raw, dict) else []):
+            try:
+                template = {
+                    "name": entry.get("name", name),
+                    "layout": entry.get("layout", ""),
+                    "size": tuple(int(v) for v in entry["size"]),
+                    "background": entry.get("background", "#FFFFFF"),
+                    "photo_size": tuple(int(v) for v in entry["photo_size"]),
+                    "positions": [tuple(int(v) for v in pos) for pos in entry["positions"]],
+                    "style": entry.get("style", "asset"),
+                    # 'under': asset is drawn below the photos, 'over': frame on top
+                    "asset_layer": entry.get("asset_layer", "under"),
+                    "supports_color_vars": list(entry.get("supports_color_vars", [])),
+                    "anchor_points": []
+                }
+            except (AttributeError, KeyError, TypeError, ValueError):
+                continue
+            if entry.get("asset"):
+                template["asset"] = cls._resolve_asset(
+                    os.path.join(static_dir, entry["asset"]), name, template["layout"], template["size"])
+                if template["asset"] is None:
+                    template["asset_error"] = (
+                        f"Template '{name}': no frame asset for '{entry['asset']}' matching "
+                        f"layout {template['layout']} and canvas {template['size'][0]}x{template['size'][1]}")
+            templates[name] = template
+
+        with cls._catalogs_lock:
+            cls._catalogs[path] = (mtime, templates)
+        return templates
+
+    @classmethod
+    def _resolve_asset(cls, asset_path, template_name, layout="", size=None):
+        """
+        Absolute asset path, or None if no usable file can be found.
+
+        The catalog names don't always match the files on disk (e.g.
+        "Bling bling.png" vs "Bling_bling_1x4.png", "Notebook - Sao chép.png" vs
+        "Notebook_2x2.png"), so a missing file falls back to the file in the same
+        folder whose normalized name starts with the asset's or template's name.
+        A candidate must suit the template: a layout suffix in its name must be
+        the template's layout (rows x columns "4x1" <-> file "_1x4"), and its
+        aspect ratio must be within ASSET_ASPECT_TOLERANCE of the canvas size.
+        """
+        def usable(path):
+            name = os.path.splitext(os.path.basename(path))[0]
+            suffix = re.search(r"_(\d+)x(\d+)$", name)
+            if suffix and layout and f"{suffix.group(2)}x{suffix.group(1)}" != layout:
+                return False
+            if not size:
+                return True
+            try:
+                with Image.open(path) as img:
+                    width, height = img.size
+            except Exception:
+                return False
+            ratio = (width / height) / (size[0] / size[1])
+            return abs(ratio - 1) <= cls.ASSET_ASPECT_TOLERANCE
+
+        if os.path.isfile(asset_path):
+            return os.path.abspath(asset_path) if usable(asset_path) else None
+
+        def normalize(text):
+            return re.sub(r"[^a-z0-9]", "", text.lower())
+
+        folder = os.path.dirname(asset_path)
+        stem = os.path.splitext(os.path.basename(asset_path))[0].split(" - ")[0]
+        wanted = [key for key in (normalize(stem), normalize(template_name)) if key]
+        try:
+            files = sorted(f for f in os.listdir(folder) if f.lower().endswith(".png"))
+        except OSError:
+            return None
+        for key in wanted:
+            matches = [f for f in files if normalize(os.path.splitext(f)[0]).startswith(key)
+                       and usable(os.path.join(folder, f))]
+            if matches:
+                return os.path.abspath(os.path.join(folder, min(matches, key=len)))
+        return None
+
+    @classmethod
+    def normalize_output_options(cls, options=None, defaults=None):
+        """
+        Merge output options over the defaults and validate them.
+
+        Args:
+            options: dict with any of format, quality, progressive, lossless,
+                     compress_level, dpi, scale
+            defaults: base options (default: DEFAULT_OUTPUT_OPTIONS)
+
+        A scale other than 1 selects print rendering (banded, PNG only); dpi is
+        resolved to scale = dpi / PRINT_BASE_DPI and not kept itself, so equal
+        dpi and scale requests share one render key.
+
+        Raises:
+            ValueError: on unknown format or out-of-range values
+        """
+        merged = dict(defaults or cls.DEFAULT_OUTPUT_OPTIONS)
+        for key, value in (options or {}).items():
+            if key in cls.DEFAULT_OUTPUT_OPTIONS and value is not None:
+                merged[key] = value
+
+        fmt = str(merged["format"]).lower()
+        if fmt == "jpg":
+            fmt = "jpeg"
+        if fmt not in cls.OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format '{merged['format']}'. "
+                             f"Available: {', '.join(cls.OUTPUT_FORMATS)}")
+        quality = int(merged["quality"])
+        compress_level = int(merged["compress_level"])
+        if not 1 <= quality <= 100:
+            raise ValueError("quality must be between 1 and 100")
+        if not 0 <= compress_level <= 9:
+            raise ValueError("compress_level must be between 0 and 9")
+
+        dpi = merged.get("dpi")
+        if dpi is not None:
+            dpi = int(dpi)
+            if not 1 <= dpi <= 2400:
+                raise ValueError("dpi must be between 1 and 2400")
+            scale = round(dpi / cls.PRINT_BASE_DPI, 4)
+        else:
+            scale = round(float(merged.get("scale", 1.0)), 4)
+            if not 0 < scale <= 25:
+                raise ValueError("scale must be between 0 and 25")
+        if scale != 1.0 and fmt != "png":
+            raise ValueError("Print rendering (dpi/scale) only supports png output")
+
+        return {
+            "format": fmt,
+            "quality": quality,
+            "progressive": cls._as_bool(merged["progressive"]),
+            "lossless": cls._as_bool(merged["lossless"]),
+            "compress_level": compress_level,
+            "scale": scale,
         }
 
+    @staticmethod
+    def _as_bool(value):
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
+
+    def _encode_canvas(self, canvas, output_path, options):
+        """
+        Save the canvas with the requested encoding.
+
+        Returns:
+            float: encode time in milliseconds
+        """
+        pil_format = self.OUTPUT_FORMATS[options["format"]][0]
+        start = time.perf_counter()
+        if pil_format == "PNG":
+            canvas.save(output_path, "PNG", compress_level=options["compress_level"])
+        elif pil_format == "JPEG":
+            # JPEG has no alpha: flatten onto white
+            rgb = Image.new("RGB", canvas.size, (255, 255, 255))
+            rgb.paste(canvas, mask=canvas.getchannel("A"))
+            rgb.save(output_path, "JPEG", quality=options["quality"],
+                     progressive=options["progressive"], optimize=options["progressive"])
+        else:
+            canvas.save(output_path, "WEBP", quality=options["quality"],
+                        lossless=options["lossless"], method=4)
+        return round((time.perf_counter() - start) * 1000, 2)
+
     def create_collage(self, image_paths: list, template_name: str, colors: dict=None,
                        decorations: list=None, fill_mode: str='duplicate',
                        sticker_paths: list=None, anchor_mode: bool=False,
-                       sticker_indices: list=None) -> str:
+                       sticker_indices: list=None, output_options: dict=None) -> str:
         """
         Create a collage image from provided image paths according to template.
-        Returns absolute path to saved PNG.
-
-        Args:
-            image_paths: list of image file paths
-            template_name: name of template to use
-            colors: dict with color overrides (bg, accent, border)
-            decorations: list of decoration dicts with path, x, y, scale, color
-            fill_mode: how to handle missing images (duplicate, placeholder, center)
-            sticker_paths: list of sticker file paths for anchor-based placement
-            anchor_mode: if True, place stickers using anchor points with random transforms
-            sticker_indices: list of sticker indices (starting from 1) for anchor point selection
-                           - Indices 1-15: use Option 1 anchor points
-                           - Indices 16-31: use Option 2 anchor points
+        Returns absolute path to the saved file (see build_collage for arguments).
         """
-        if template_name not in self.TEMPLATES:
-            raise ValueError(f"Template '{template_name}' not found")
-
-        template = self.TEMPLATES[template_name]
+        return self.build_collage(
+            image_paths, template_name, colors=colors, decorations=decorations,
+            fill_mode=fill_mode, sticker_paths=sticker_paths, anchor_mode=anchor_mode,
+            sticker_indices=sticker_indices, output_options=output_options
+        )["path"]
+
+    def _fill_slots(self, template, image_paths, fill_mode):
+        """Normalize image_paths to the template's number of photo slots"""
         slots = len(template.get("positions", []))
 
         # Normalize image_paths to required slots
@@ -190,6 +486,92 @@ class TemplateEngine:
                     images.append(images[-1])
         else:
             images = images[:slots]
+        return images
+
+    def build_collage(self, image_paths: list, template_name: str, colors: dict=None,
+                      decorations: list=None, fill_mode: str='duplicate',
+                      sticker_paths: list=None, anchor_mode: bool=False,
+                      sticker_indices: list=None, output_options: dict=None) -> dict:
+        """
+        Create a collage image from provided image paths according to template.
+
+        Args:
+            image_paths: list of image file paths; an entry may also be a list
+                         [source, derivative, ...] of pre-resized/cropped versions,
+                         the smallest one that still covers the slot is used
+            template_name: name of template to use
+            colors: dict with color overrides (bg, accent, border)
+            decorations: list of decoration dicts with path, x, y, scale, color
+            fill_mode: how to handle missing images (duplicate, placeholder, center)
+            sticker_paths: list of sticker file paths for anchor-based placement
+            anchor_mode: if True, place stickers using anchor points with random transforms
+            sticker_indices: list of sticker indices (starting from 1) for anchor point selection
+                           - Indices 1-15: use Option 1 anchor points
+                           - Indices 16-31: use Option 2 anchor points
+            output_options: per-call encoding overrides (format, quality, progressive,
+                            lossless, compress_level) over self.output_options
+
+        Returns:
+            dict with path (absolute), format, extension, bytes, width, height,
+            render_ms, encode_ms, cached (True if an identical earlier render was
+            reused) and render_key
+        """
+        template = self.get_template(template_name)
+        options = self.normalize_output_options(output_options, self.output_options)
+        images = self._fill_slots(template, image_paths, fill_mode)
+
+        # Same inputs -> same key -> same file: reuse it instead of rendering again
+        key = self.render_key(image_paths, template_name, colors=colors, decorations=decorations,
+                              fill_mode=fill_mode, sticker_paths=sticker_paths,
+                              anchor_mode=anchor_mode, sticker_indices=sticker_indices,
+                              output_options=options)
+        extension = self.OUTPUT_FORMATS[options["format"]][1]
+        output_path = os.path.abspath(os.path.join(
+            self.output_dir, f"collage_{template_name}_{key[:20]}.{extension}"))
+        if os.path.exists(output_path):
+            try:
+                os.utime(output_path)  # mark as recently used for LRU cleanup
+                height = self._scaled(template["size"][1], options["scale"])
+                result = {
+                    "path": output_path,
+                    "format": options["format"],
+                    "extension": extension,
+                    "bytes": os.path.getsize(output_path),
+                    "width": self._scaled(template["size"][0], options["scale"]),
+                    "height": height,
+                    "render_ms": 0.0,
+                    "encode_ms": 0.0,
+                    "cached": True,
+                    "render_key": key,
+                }
+                if options["scale"] != 1.0:
+                    # Same fields as a fresh print render
+                    result.update(self._print_info(options["scale"], height))
+                return result
+            except OSError:
+                pass  # removed by a concurrent cleanup: render again
+
+        # Sticker layout seed: independent of the encoding (and print scale), so
+        # every output of the same collage shows the same sticker layout
+        layout_seed = None
+        if anchor_mode and sticker_paths:
+            layout_key = self.render_key(image_paths, template_name, colors=colors,
+                                         decorations=decorations, fill_mode=fill_mode,
+                                         sticker_paths=sticker_paths, anchor_mode=anchor_mode,
+                                         sticker_indices=sticker_indices,
+                                         output_options=self.DEFAULT_OUTPUT_OPTIONS)
+            layout_seed = int(layout_key[:16], 16)
+
+        if options["scale"] != 1.0:
+            result = self._build_print(
+                template, images, output_path, options, key, colors=colors,
+                decorations=decorations, sticker_paths=sticker_paths if anchor_mode else None,
+                template_name=template_name, sticker_indices=sticker_indices,
+                layout_seed=layout_seed)
+            self._maybe_cleanup()
+            return result
+
+        render_start = time.perf_counter()
 
         # Create canvas
         canvas = self._create_background(template, colors)
@@ -197,13 +579,11 @@ class TemplateEngine:
         # Place each photo
         for idx, img_path in enumerate(images):
             try:
-                photo = Image.open(img_path).convert("RGBA")
+                photo = self._load_slot_photo(img_path, template["photo_size"])
             except Exception:
                 # if image cannot be opened, create blank
                 photo = Image.new("RGBA", template["photo_size"], (230,230,230,255))
 
-            photo = self._resize_and_crop(photo, template["photo_size"])
-
             if template.get("rounded_corners"):
                 photo = self._add_rounded_corners(photo, template["rounded_corners"])
 
@@ -215,15 +595,20 @@ class TemplateEngine:
 
             canvas.paste(photo, template["positions"][idx], photo)
 
+        # Frame-style assets go on top of the photos ('under' assets are part of the background)
+        if template.get("asset") and template.get("asset_layer") == "over":
+            canvas = self._composite_layer(canvas, self._load_asset(template["asset"], canvas.size))
+
         # Place stickers using anchor points if anchor_mode is enabled
         if anchor_mode and sticker_paths:
             canvas = self.place_stickers_with_anchors(
                 canvas, sticker_paths, template_name,
                 sticker_indices=sticker_indices,
-                num_stickers=2, rotation_range=(0, 360), scale_range=(3.0, 4.0)
+                num_stickers=2, rotation_range=(0, 360), scale_range=(3.0, 4.0),
+                rng=random.Random(layout_seed)  # same inputs -> same sticker layout
             )
 
-        # Decorations (simple: paste PNGs; SVG rasterization handled externally)
+        # Decorations (SVG rasterized at the requested scale, cached per path/mtime/scale/color)
         if decorations:
             for deco in decorations:
                 deco_path = deco.get("path")
@@ -232,16 +617,7 @@ class TemplateEngine:
                 scale = float(deco.get("scale", 1.0))
                 color = deco.get("color")
                 try:
-                    if deco_path and deco_path.lower().endswith('.svg') and _HAS_CAIROSVG:
-                        # rasterize SVG to PNG bytes
-                        png_bytes = cairosvg.svg2png(url=deco_path)
-                        dimg = Image.open(io.BytesIO(png_bytes)).convert("RGBA")
-                    else:
-                        dimg = Image.open(deco_path).convert("RGBA")
-                    if scale != 1.0:
-                        new_w = int(dimg.width * scale)
-                        new_h = int(dimg.height * scale)
-                        dimg = dimg.resize((new_w, new_h), Image.LANCZOS)
+                    dimg = self._load_decoration(deco_path, scale, color)
                     canvas.paste(dimg, (x, y), dimg)
                 except Exception:
                     continue
@@ -250,39 +626,606 @@ class TemplateEngine:
         if template.get("film_holes"):
             canvas = self._add_film_holes(canvas)
 
-        # Save
-        filename = f"collage_{template_name}_{os.urandom(4).hex()}.png"
-        output_path = os.path.join(self.output_dir, filename)
-        # Ensure canvas is RGBA -> convert to RGB for smaller files with white background if desired
-        canvas.save(output_path, "PNG", quality=95)
-        return os.path.abspath(output_path)
+        render_ms = round((time.perf_counter() - render_start) * 1000, 2)
+
+        # Save (temp file + rename so concurrent identical requests never see a partial file)
+        tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            encode_ms = self._encode_canvas(canvas, tmp_path, options)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        result = {
+            "path": output_path,
+            "format": options["format"],
+            "extension": extension,
+            "bytes": os.path.getsize(output_path),
+            "width": canvas.width,
+            "height": canvas.height,
+            "render_ms": render_ms,
+            "encode_ms": encode_ms,
+            "cached": False,
+            "render_key": key,
+        }
+        self._maybe_cleanup()
+        return result
+
+    @staticmethod
+    def _scaled(value, scale):
+        """Template coordinate -> output pixel coordinate"""
+        return int(round(value * scale))
+
+    def _scaled_rect(self, x, y, w, h, scale):
+        """(x, y, w, h) in template coordinates -> output pixels; shared edges stay shared"""
+        x0, y0 = self._scaled(x, scale), self._scaled(y, scale)
+        return (x0, y0, self._scaled(x + w, scale) - x0, self._scaled(y + h, scale) - y0)
+
+    def _build_print(self, template, images, output_path, options, key, colors=None,
+                     decorations=None, sticker_paths=None, template_name=None,
+                     sticker_indices=None, layout_seed=None):
+        """
+        Render the collage at options['scale'] in horizontal bands, streaming the PNG.
+
+        Every layer (background, asset, photos, stickers, decorations, film holes)
+        is placed at its template rectangle times the scale and drawn band by band;
+        sources are resampled per band with Image.resize(box=...). No full-size
+        canvas or per-photo copy is held, so peak memory is about one band plus
+        the decoded inputs, whatever the output size.
+        """
+        scale = options["scale"]
+        size = (self._scaled(template["size"][0], scale), self._scaled(template["size"][1], scale))
+        if size[0] * size[1] > self.max_print_pixels:
+            raise ValueError(f"Print size {size[0]}x{size[1]} exceeds {self.max_print_pixels} pixels")
+
+        start = time.perf_counter()
+        layers = self._print_layers(template, images, scale, size, colors=colors,
+                                    decorations=decorations, sticker_paths=sticker_paths,
+                                    template_name=template_name, sticker_indices=sticker_indices,
+                                    layout_seed=layout_seed)
+        band_height = max(1, int(self.print_band_height))
+        dpi = scale * self.PRINT_BASE_DPI
+
+        encode_ms = 0.0
+        tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                png = PNGStreamWriter(f, size[0], size[1], mode="RGB", dpi=dpi,
+                                      compress_level=options["compress_level"])
+                for top in range(0, size[1], band_height):
+                    band = self._render_print_band(template, colors, size, top,
+                                                   min(band_height, size[1] - top), layers)
+                    encode_start = time.perf_counter()
+                    png.write_rows(band.convert("RGB"))
+                    encode_ms += (time.perf_counter() - encode_start) * 1000
+                encode_start = time.perf_counter()
+                png.close()
+                encode_ms += (time.perf_counter() - encode_start) * 1000
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        total_ms = (time.perf_counter() - start) * 1000
+        return {
+            "path": output_path,
+            "format": options["format"],
+            "extension": self.OUTPUT_FORMATS[options["format"]][1],
+            "bytes": os.path.getsize(output_path),
+            "width": size[0],
+            "height": size[1],
+            "render_ms": round(total_ms - encode_ms, 2),
+            "encode_ms": round(encode_ms, 2),
+            "cached": False,
+            "render_key": key,
+            **self._print_info(scale, size[1]),
+        }
+
+    def _print_info(self, scale, height):
+        """scale/dpi/bands fields of a print render result"""
+        return {
+            "scale": scale,
+            "dpi": round(scale * self.PRINT_BASE_DPI, 2),
+            "bands": math.ceil(height / max(1, int(self.print_band_height))),
+        }
+
+    def _render_print_band(self, template, colors, size, top, rows, layers):
+        """Background rows [top, top + rows) with every intersecting layer drawn on top"""
+        kind, _, spec, _ = self._background_key(template, colors)
+        if kind == "gradient":
+            band = self._create_gradient(size, spec, top=top, rows=rows)
+        else:
+            band = Image.new("RGBA", (size[0], rows), spec)
+        for y0, y1, draw in layers:
+            if y0 < y1 and y0 < top + rows and y1 > top:
+                band = draw(band, top)
+        return band
+
+    def _print_layers(self, template, images, scale, size, colors=None, decorations=None,
+                      sticker_paths=None, template_name=None, sticker_indices=None,
+                      layout_seed=None):
+        """
+        Layers of a print render, bottom to top, in the same order as build_collage.
+
+        Returns:
+            list of (y0, y1, draw) where draw(band, top) returns the band with the
+            layer drawn on it and [y0, y1) are the output rows the layer touches
+        """
+        layers = []
+        full = (0, 0, size[0], size[1])
+
+        asset = template.get("asset")
+        if asset and template.get("asset_layer", "under") == "under":
+            layers.append(self._print_image_layer(self._load_asset(asset), full))
+
+        pw, ph = template["photo_size"]
+        bw = template.get("border_width", 2) if template.get("border_color") else 0
+        radius = self._scaled(template.get("rounded_corners") or 0, scale)
+        for idx, entry in enumerate(images):
+            x, y = template["positions"][idx]
+            if template.get("shadow"):
+                layers.append(self._print_fill_layer(
+                    self._scaled_rect(x + 8, y + 8, pw, ph, scale), (0, 0, 0, 60)))
+            if bw:
+                # Border ring around the photo (the photo itself is drawn next)
+                for rect in ((x, y, pw + 2 * bw, bw), (x, y + bw + ph, pw + 2 * bw, bw),
+                             (x, y + bw, bw, ph), (x + bw + pw, y + bw, bw, ph)):
+                    layers.append(self._print_fill_layer(
+                        self._scaled_rect(*rect, scale), template["border_color"]))
+            rect = self._scaled_rect(x + bw, y + bw, pw, ph, scale)
+            layers.append(self._print_photo_layer(entry, rect, radius))
+
+        if asset and template.get("asset_layer") == "over":
+            layers.append(self._print_image_layer(self._load_asset(asset), full))
+
+        if sticker_paths:
+            placements = self._sticker_placements(
+                sticker_paths, template_name, sticker_indices=sticker_indices,
+                num_stickers=2, rotation_range=(0, 360), scale_range=(3.0, 4.0),
+                rng=random.Random(layout_seed))
+            for sticker, sticker_scale, (x, y) in placements:
+                new_w = int(sticker.width * sticker_scale)
+                new_h = int(sticker.height * sticker_scale)
+                rect = self._scaled_rect(x - new_w // 2, y - new_h // 2, new_w, new_h, scale)
+                layers.append(self._print_image_layer(sticker, rect, resample=Image.BICUBIC))
+
+        for deco in decorations or []:
+            try:
+                dimg = self._load_decoration(deco.get("path"), float(deco.get("scale", 1.0)) * scale,
+                                             deco.get("color"))
+            except Exception:
+                continue
+            rect = (self._scaled(int(deco.get("x", 0)), scale),
+                    self._scaled(int(deco.get("y", 0)), scale), dimg.width, dimg.height)
+            layers.append(self._print_image_layer(dimg, rect))
+
+        if template.get("film_holes"):
+            layers.append((0, size[1], lambda band, top: self._draw_film_holes(
+                band, template["size"][1], scale, top)))
+        return layers
+
+    def _print_fill_layer(self, rect, color):
+        x0, y0, w, h = rect
+        if w <= 0 or h <= 0:
+            return (0, 0, None)
+        rgba = Image.new("RGBA", (1, 1), color).getpixel((0, 0))
+
+        def draw(band, top):
+            start, end = max(y0, top), min(y0 + h, top + band.height)
+            mask = Image.new("L", (w, end - start), rgba[3])
+            band.paste(rgba[:3] + (255,), (x0, start - top, x0 + w, end - top), mask)
+            return band
+        return (y0, y0 + h, draw)
+
+    def _print_image_layer(self, image, rect, box=None, resample=Image.LANCZOS, radius=0):
+        """Layer drawing image (RGBA, RGBa or RGB) resampled into rect (output pixels)"""
+        x0, y0, w, h = rect
+        if w <= 0 or h <= 0:
+            return (0, 0, None)
+        bx0, by0, bx1, by1 = box or (0, 0, image.width, image.height)
+
+        def draw(band, top):
+            start, end = max(y0, top), min(y0 + h, top + band.height)
+            if (bx1 - bx0, by1 - by0) == (w, h):
+                piece = image.crop((bx0, by0 + start - y0, bx1, by0 + end - y0))
+            else:
+                fy = (by1 - by0) / h
+                piece = image.resize((w, end - start), resample,
+                                     box=(bx0, by0 + (start - y0) * fy, bx1, by0 + (end - y0) * fy))
+            if piece.mode == "RGBa":
+                if (x0, w) == (0, band.width):
+                    layer = piece
+                else:
+                    layer = Image.new("RGBa", (band.width, piece.height), (0, 0, 0, 0))
+                    layer.paste(piece, (x0, 0))
+                strip = band.crop((0, start - top, band.width, end - top))
+                band.paste(self._composite_layer(strip, layer), (0, start - top))
+                return band
+            mask = None
+            if radius:
+                mask = Image.new("L", piece.size, 0)
+                ImageDraw.Draw(mask).rounded_rectangle(
+                    [(0, y0 - start), (w, y0 - start + h)], radius, fill=255)
+            elif piece.mode == "RGBA":
+                mask = piece
+            band.paste(piece, (x0, start - top), mask)
+            return band
+        return (y0, y0 + h, draw)
+
+    def _print_photo_layer(self, entry, rect, radius=0):
+        """Photo cover-cropped into rect: decoded once, resampled per band"""
+        slot_size = (rect[2], rect[3])
+        try:
+            path = self._pick_derivative(entry, slot_size)
+            with Image.open(path) as img:
+                scale = max(slot_size[0] / img.width, slot_size[1] / img.height)
+                if scale < 1:
+                    img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+                photo = img.convert("RGB")
+        except Exception:
+            # if image cannot be opened, use a blank slot
+            photo = Image.new("RGB", slot_size, (230, 230, 230))
+
+        # Center crop with the slot's aspect ratio (same as _resize_and_crop)
+        slot_ratio = slot_size[0] / slot_size[1]
+        if photo.width / photo.height > slot_ratio:
+            crop_w = photo.height * slot_ratio
+            box = ((photo.width - crop_w) / 2, 0, (photo.width + crop_w) / 2, photo.height)
+        else:
+            crop_h = photo.width / slot_ratio
+            box = (0, (photo.height - crop_h) / 2, photo.width, (photo.height + crop_h) / 2)
+        return self._print_image_layer(photo, rect, box=box, radius=radius)
+
+    def _draw_film_holes(self, band, template_height, scale, top):
+        """_add_film_holes at print scale, for the rows of one band"""
+        draw = ImageDraw.Draw(band)
+        radius = 8 * scale
+        left = 10 * scale
+        right = band.width - 30 * scale
+        for y in range(30, template_height, 60):
+            cy = y * scale - top
+            if cy + radius < 0 or cy - radius > band.height:
+                continue
+            draw.ellipse([(left, cy - radius), (left + radius * 2, cy + radius)], fill="#333333")
+            draw.ellipse([(right, cy - radius), (right + radius * 2, cy + radius)], fill="#333333")
+        return band
+
+    @classmethod
+    def _file_digest(cls, path):
+        """Content hash of an input file (memoized by path + mtime + size)"""
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return f"missing:{path}"
+        with cls._file_hashes_lock:
+            memo = cls._file_hashes.get(path)
+            if memo and memo[0] == st.st_mtime_ns and memo[1] == st.st_size:
+                return memo[2]
+        hasher = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with cls._file_hashes_lock:
+            cls._file_hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def render_key(self, image_paths, template_name, colors=None, decorations=None,
+                   fill_mode='duplicate', sticker_paths=None, anchor_mode=False,
+                   sticker_indices=None, output_options=None):
+        """
+        Deterministic key of a collage render.
+
+        Built from the content hashes of all input files (photos, decorations,
+        stickers), the template definition and the normalized options, so it
+        only changes when the output would change.
+        """
+        template = self.get_template(template_name)
+        options = self.normalize_output_options(output_options, self.output_options)
+        images = self._fill_slots(template, image_paths, fill_mode)
+
+        spec = {
+            "version": self.RENDER_VERSION,
+            "template": template_name,
+            "definition": template,
+            "asset": self._file_digest(template["asset"]) if template.get("asset") else None,
+            "images": [self._file_digest(self._source_path(p)) for p in images],
+            "colors": {k: str(v).lower() for k, v in sorted((colors or {}).items()) if v},
+            "decorations": [
+                [self._file_digest(d.get("path")) if d.get("path") else None,
+                 int(d.get("x", 0)), int(d.get("y", 0)),
+                 round(float(d.get("scale", 1.0)), 3), d.get("color")]
+                for d in (decorations or [])
+            ],
+            "stickers": ([self._file_digest(p) for p in sticker_paths or []]
+                         if anchor_mode else []),
+            "sticker_indices": list(sticker_indices or []) if anchor_mode else [],
+            "output": options,
+        }
+        encoded = json.dumps(spec, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _maybe_cleanup(self):
+        if self.max_cached_collages is None and self.collage_ttl_seconds is None:
+            return
+        now = time.time()
+        if now - self._last_cleanup < self.CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        self.cleanup_collages()
+
+    def cleanup_collages(self, max_files=None, ttl_seconds=None):
+        """
+        Remove old collages from output_dir.
+
+        Files not used (rendered or served from cache) for ttl_seconds are removed,
+        then the least recently used ones beyond max_files.
+
+        Returns:
+            int: number of removed files
+        """
+        max_files = self.max_cached_collages if max_files is None else max_files
+        ttl_seconds = self.collage_ttl_seconds if ttl_seconds is None else ttl_seconds
+
+        entries = []
+        for entry in os.scandir(self.output_dir):
+            if entry.is_file() and entry.name.startswith("collage_") and not entry.name.endswith(".tmp"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
+        entries.sort(reverse=True)  # most recently used first
+
+        now = time.time()
+        to_remove = []
+        keep = []
+        for mtime, path in entries:
+            if ttl_seconds is not None and now - mtime > ttl_seconds:
+                to_remove.append(path)
+            else:
+                keep.append(path)
+        if max_files is not None and len(keep) > max_files:
+            to_remove.extend(keep[max_files:])
+
+        removed = 0
+        for path in to_remove:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _load_decoration(self, path, scale=1.0, color=None):
+        """
+        Return the RGBA decoration at the given scale (read-only, shared via cache).
+
+        SVGs are rasterized by cairosvg directly at the target scale (vector space),
+        bitmaps are resized once; either way each (path, mtime, scale, color) is
+        rendered at most once per process.
+        """
+        scale = round(scale, 3)
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns, scale, color)
+        dimg = self._decoration_cache.get(key)
+        if dimg is None:
+            dimg = self._rasterize_decoration(path, scale)
+            if color:
+                dimg = self._tint(dimg, color)
+            self._decoration_cache.put(key, dimg)
+        return dimg
+
+    @staticmethod
+    def _rasterize_decoration(path, scale):
+        if path.lower().endswith('.svg') and _HAS_CAIROSVG:
+            png_bytes = cairosvg.svg2png(url=path, scale=scale)
+            return Image.open(io.BytesIO(png_bytes)).convert("RGBA")
+        with Image.open(path) as img:
+            dimg = img.convert("RGBA")
+        if scale != 1.0:
+            new_w = int(dimg.width * scale)
+            new_h = int(dimg.height * scale)
+            dimg = dimg.resize((new_w, new_h), Image.LANCZOS)
+        return dimg
+
+    @classmethod
+    def _tint(cls, image, color):
+        """Fill the decoration with a single color, keeping its alpha (shape)"""
+        r, g, b = cls._hex_to_rgb(color)
+        tinted = Image.new("RGBA", image.size, (r, g, b, 255))
+        tinted.putalpha(image.getchannel("A"))
+        return tinted
 
     def _create_background(self, template, colors=None):
-        size = template["size"]
+        """Return a fresh canvas for the template, copied from the background cache"""
+        key = self._background_key(template, colors)
+        background = self._background_cache.get(key)
+        if background is None:
+            background = self._load_cached_background(key)
+            if background is None:
+                background = self._render_background(key)
+                if key[0] == "gradient":
+                    # Solid fills are cheaper to render than to read back from disk
+                    self._store_cached_background(key, background)
+            self._background_cache.put(key, background)
+        return background.copy()
+
+    @staticmethod
+    def _background_key(template, colors=None):
+        """Resolve the template background (with color overrides) to a hashable cache key"""
+        size = tuple(template["size"])
+        # 'under' assets are baked into the cached background
+        asset = None
+        if template.get("asset") and template.get("asset_layer", "under") == "under":
+            asset = (template["asset"], os.stat(template["asset"]).st_mtime_ns)
         bg = template.get("background", "#FFFFFF")
         if isinstance(bg, dict) and bg.get("type") == "gradient":
-            return self._create_gradient(size, bg.get("colors", ["#FFFFFF", "#000000"]))
+            return ("gradient", size, tuple(bg.get("colors", ["#FFFFFF", "#000000"])), asset)
+        # Allow override via colors dict (key 'bg')
+        if colors and colors.get("bg"):
+            bg = colors.get("bg")
+        return ("solid", size, bg, asset)
+
+    def _render_background(self, key):
+        kind, size, spec, asset = key
+        if kind == "gradient":
+            background = self._create_gradient(size, spec)
         else:
-            # Allow override via colors dict (key 'bg')
-            if colors and colors.get("bg"):
-                bg_color = colors.get("bg")
-            else:
-                bg_color = bg
-            return Image.new("RGBA", size, bg_color)
-
-    def _create_gradient(self, size, colors):
-        from PIL import ImageDraw
-        img = Image.new("RGBA", size)
-        draw = ImageDraw.Draw(img)
-        r1, g1, b1 = self._hex_to_rgb(colors[0])
-        r2, g2, b2 = self._hex_to_rgb(colors[1])
-        for y in range(size[1]):
-            ratio = y / max(1, size[1]-1)
-            r = int(r1 + (r2 - r1) * ratio)
-            g = int(g1 + (g2 - g1) * ratio)
-            b = int(b1 + (b2 - b1) * ratio)
-            draw.line([(0, y), (size[0], y)], fill=(r, g, b, 255))
-        return img
+            background = Image.new("RGBA", size, spec)
+        if asset:
+            background = self._composite_layer(background, self._load_asset(asset[0], size))
+        return background
+
+    def _load_asset(self, path, size=None):
+        """
+        Template asset scaled to the canvas size (None = native size), premultiplied (mode "RGBa").
+
+        Decoded and resized once per (path, mtime, size); read-only, shared via cache.
+        """
+        size = tuple(size) if size else None
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns, size)
+        asset = self._asset_cache.get(key)
+        if asset is None:
+            with Image.open(path) as img:
+                asset = img.convert("RGBA")
+            if size and asset.size != size:
+                asset = asset.resize(size, Image.LANCZOS)
+            asset = self._asset_cache.put(key, asset.convert("RGBa"))
+        return asset
+
+    @staticmethod
+    def _composite_layer(canvas, layer):
+        """
+        Draw a premultiplied RGBa layer over an RGBA canvas of the same size.
+
+        With premultiplied source the "over" operator is just
+        out = src + dst * (1 - src_alpha), one integer numpy pass.
+        """
+        src = np.asarray(layer, dtype=np.uint16)
+        dst = np.asarray(canvas.convert("RGBa"), dtype=np.uint16)
+        out = src + (dst * (255 - src[..., 3:4]) + 127) // 255
+        return Image.frombytes("RGBa", canvas.size, out.astype(np.uint8).tobytes()).convert("RGBA")
+
+    def _background_cache_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.background_cache_dir, f"bg_{digest}.png")
+
+    def _load_cached_background(self, key):
+        if not self.background_cache_dir:
+            return None
+        path = self._background_cache_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with Image.open(path) as img:
+                img = img.convert("RGBA")
+            if img.size != key[1]:
+                return None
+            return img
+        except Exception:
+            return None
+
+    def _store_cached_background(self, key, background):
+        if not self.background_cache_dir:
+            return
+        try:
+            os.makedirs(self.background_cache_dir, exist_ok=True)
+            path = self._background_cache_path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            background.save(tmp_path, "PNG")
+            os.replace(tmp_path, path)
+        except OSError:
+            # Disk tier is best effort; the memory tier still has the canvas
+            pass
+
+    def _create_gradient(self, size, colors, top=0, rows=None):
+        """
+        Vertical linear gradient between two hex colors.
+
+        top/rows select a horizontal band of the full-size gradient (print rendering).
+        """
+        width, height = size
+        rows_count = height - top if rows is None else rows
+        start = np.array(self._hex_to_rgb(colors[0]), dtype=np.float64)
+        end = np.array(self._hex_to_rgb(colors[1]), dtype=np.float64)
+        ratio = np.arange(top, top + rows_count, dtype=np.float64)[:, None] / max(1, height - 1)
+        # astype truncates like int() did in the old per-row loop
+        rows = (start + (end - start) * ratio).astype(np.uint8)
+        arr = np.empty((rows_count, width, 4), dtype=np.uint8)
+        arr[:, :, :3] = rows[:, None, :]
+        arr[:, :, 3] = 255
+        return Image.fromarray(arr, mode="RGBA")
+
+    @staticmethod
+    def _source_path(entry):
+        """An image entry is a path or a list [source, derivative, ...]"""
+        if isinstance(entry, (list, tuple)):
+            return entry[0]
+        return entry
+
+    def _pick_derivative(self, entry, slot_size):
+        """
+        Pick the smallest file among [source, derivatives...] that can produce the slot.
+
+        A derivative qualifies if it is at least slot_size in both dimensions and its
+        center crop contains the slot's center crop of the source, i.e. its aspect
+        ratio lies between the source's and the slot's (within
+        DERIVATIVE_ASPECT_TOLERANCE) and it is not older than the source (a
+        source rewritten in place, e.g. by apply-sticker-session, makes its
+        derivatives stale). Otherwise the source itself is used.
+        """
+        if not isinstance(entry, (list, tuple)):
+            return entry
+        source = entry[0]
+        source_mtime = os.stat(source).st_mtime_ns
+        with Image.open(source) as img:
+            source_w, source_h = img.size
+        source_aspect = source_w / source_h
+        slot_aspect = slot_size[0] / slot_size[1]
+        low = min(source_aspect, slot_aspect) * (1 - self.DERIVATIVE_ASPECT_TOLERANCE)
+        high = max(source_aspect, slot_aspect) * (1 + self.DERIVATIVE_ASPECT_TOLERANCE)
+
+        best, best_area = source, source_w * source_h
+        for path in entry[1:]:
+            try:
+                if os.stat(path).st_mtime_ns < source_mtime:
+                    continue
+                with Image.open(path) as img:
+                    w, h = img.size
+            except Exception:
+                continue
+            if w < slot_size[0] or h < slot_size[1]:
+                continue
+            if not low <= w / h <= high:
+                continue
+            if w * h < best_area:
+                best, best_area = path, w * h
+        return best
+
+    def _load_slot_photo(self, entry, slot_size):
+        """
+        Photo resized and center-cropped to slot_size, as RGBA (read-only, cached).
+
+        Uses the smallest suitable derivative and lets the JPEG decoder downscale
+        (Image.draft), so the cost hardly depends on the capture resolution.
+        """
+        path = self._pick_derivative(entry, slot_size)
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size, tuple(slot_size))
+        photo = self._slot_photo_cache.get(key)
+        if photo is not None:
+            return photo
+
+        with Image.open(path) as img:
+            # Smallest decode that still covers the slot after resize
+            scale = max(slot_size[0] / img.width, slot_size[1] / img.height)
+            if scale < 1:
+                img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+            photo = self._resize_and_crop(img.convert("RGBA"), slot_size)
+        return self._slot_photo_cache.put(key, photo)
 
     def _resize_and_crop(self, image, target_size):
         """Resize và crop ảnh để fit vào khung"""
@@ -334,6 +1277,9 @@ class TemplateEngine:
         hex_color = hex_color.lstrip("#")
         return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
+    # Background removal lives in models/background_removal.py (numpy/OpenCV,
+    # shared with scripts/); these wrappers keep the existing call sites working.
+
     @staticmethod
     def _remove_sticker_background(image):
         """
@@ -345,194 +1291,22 @@ class TemplateEngine:
         Returns:
             PIL Image: Ảnh sticker đã được tách nền, hệ màu RGBA với nền trong suốt hoàn toàn
         """
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
-
-        # Đầu tiên, thử xóa checkered background (ô vuông đen xám xen kẽ)
-        result = TemplateEngine._remove_checkered_background(image)
-
-        # Kiểm tra xem đã xóa được nhiều pixel chưa
-        import numpy as np
-        original_arr = np.array(image)
-        result_arr = np.array(result)
-
-        original_opaque = np.sum(original_arr[:, :, 3] > 128)
-        result_opaque = np.sum(result_arr[:, :, 3] > 128)
-
-        # Nếu đã xóa được > 10% pixel, coi như thành công
-        if original_opaque > 0 and (original_opaque - result_opaque) / original_opaque > 0.1:
-            return TemplateEngine._clean_alpha_channel(result)
-
-        # Nếu không, thử dùng rembg
-        try:
-            import rembg
-            from io import BytesIO
-
-            buffer = BytesIO()
-            image.save(buffer, format='PNG')
-            input_bytes = buffer.getvalue()
-
-            output_bytes = rembg.remove(input_bytes)
-            result = Image.open(BytesIO(output_bytes))
-
-            if result.mode != 'RGBA':
-                result = result.convert('RGBA')
-
-            result = TemplateEngine._clean_alpha_channel(result)
-            return result
-
-        except ImportError:
-            return TemplateEngine._remove_background_pillow(image)
-        except Exception:
-            try:
-                return TemplateEngine._remove_background_pillow(image)
-            except Exception:
-                return image
+        return background_removal.remove_sticker_background(image)
 
     @staticmethod
     def _remove_checkered_background(image, tolerance=20):
-        """
-        Xóa checkered background (ô vuông đen xám xen kẽ) khỏi ảnh.
-
-        Checkered background thường có 2 màu xám xen kẽ:
-        - Màu sáng: ~192-210 (RGB)
-        - Màu tối: ~128-150 (RGB)
-
-        Args:
-            image: PIL Image object (RGBA)
-            tolerance: Độ chênh lệch cho phép khi xác định màu xám
-
-        Returns:
-            PIL Image: Ảnh với checkered background đã được xóa
-        """
-        import numpy as np
-
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
-
-        arr = np.array(image)
-        height, width = arr.shape[:2]
-
-        r = arr[:, :, 0].astype(np.int16)
-        g = arr[:, :, 1].astype(np.int16)
-        b = arr[:, :, 2].astype(np.int16)
-        a = arr[:, :, 3]
-
-        # Kiểm tra màu xám (R ≈ G ≈ B)
-        diff_rg = np.abs(r - g)
-        diff_gb = np.abs(g - b)
-        diff_rb = np.abs(r - b)
-        max_diff = np.maximum(np.maximum(diff_rg, diff_gb), diff_rb)
-        is_gray = max_diff < tolerance
-
-        # Tính giá trị trung bình màu
-        avg = (r + g + b) // 3
-
-        # Các dải màu checkered phổ biến
-        # Photoshop/GIMP checkered: ~128 (dark) và ~192-204 (light)
-        checkered_ranges = [
-            (120, 170),  # Dark gray squares
-            (185, 215),  # Light gray squares
-            (100, 135),  # Very dark gray
-            (215, 250),  # Very light gray (near white)
-        ]
-
-        checkered_mask = np.zeros((height, width), dtype=bool)
-        for low, high in checkered_ranges:
-            range_mask = (avg >= low) & (avg <= high)
-            checkered_mask = checkered_mask | range_mask
-
-        # Pixel phải là màu xám VÀ nằm trong dải checkered
-        remove_mask = is_gray & checkered_mask
-
-        # Set alpha = 0 cho các pixel checkered
-        arr[:, :, 3] = np.where(remove_mask, 0, a)
-
-        return Image.fromarray(arr, mode='RGBA')
+        """Xóa checkered background (ô vuông đen xám xen kẽ) khỏi ảnh."""
+        return background_removal.remove_checkered_background(image, tolerance)
 
     @staticmethod
     def _clean_alpha_channel(image, alpha_threshold=10):
-        """
-        Loại bỏ các pixel có alpha thấp (nền mờ còn sót lại).
-
-        Args:
-            image: PIL Image object (RGBA)
-            alpha_threshold: Ngưỡng alpha để xóa (0-255). Pixel có alpha < threshold sẽ thành trong suốt
-
-        Returns:
-            PIL Image: Ảnh đã được làm sạch
-        """
-        if image.mode != 'RGBA':
-            return image
-
-        # Chuyển đổi sang numpy array để xử lý nhanh hơn
-        import numpy as np
-
-        arr = np.array(image)
-        alpha = arr[:, :, 3]
-
-        # Tạo mask cho các pixel có alpha thấp (nền mờ)
-        # Các pixel này sẽ được set thành hoàn toàn trong suốt
-        mask = alpha < alpha_threshold
-
-        # Cập nhật alpha channel: set các pixel nền mờ thành 0
-        arr[:, :, 3] = np.where(mask, 0, alpha)
-
-        # Chuyển đổi lại thành PIL Image
-        return Image.fromarray(arr, mode='RGBA')
+        """Loại bỏ các pixel có alpha thấp (nền mờ còn sót lại)."""
+        return background_removal.clean_alpha_channel(image, alpha_threshold)
 
     @staticmethod
     def _remove_background_pillow(image):
-        """
-        Tách nền bằng Pillow (phương pháp dựa trên màu sắc).
-        Phù hợp cho các sticker có nền đồng nhất.
-
-        Args:
-            image: PIL Image object
-
-        Returns:
-            PIL Image: Ảnh đã được tách nền (RGBA)
-        """
-        # Chuyển đổi sang RGBA nếu chưa phải
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
-
-        # Lấy dữ liệu pixel
-        datas = image.getdata()
-
-        new_data = []
-        for item in datas:
-            r, g, b, a = item
-
-            # Kiểm tra nếu pixel là nền (màu nâu/đỏ/đen mờ hoặc trắng/xám)
-            # Nền pixel art thường có độ bão hòa thấp hoặc độ sáng cao/thấp đặc trưng
-            is_background = False
-
-            # Trường hợp 1: Pixel trong suốt hoặc gần trong suốt
-            if a < 50:
-                is_background = True
-
-            # Trường hợp 2: Pixel màu trắng/xám nhạt (nền sáng)
-            elif r > 230 and g > 230 and b > 230:
-                is_background = True
-
-            # Trường hợp 3: Pixel màu nâu/đỏ đặc trưng của nền sticker pixel art
-            elif (r > 150 and r < 220 and g > 100 and g < 180 and b > 80 and b < 150):
-                # Nền màu nâu đỏ đặc trưng
-                is_background = True
-
-            # Trường hợp 4: Pixel tối (đen/xám đậm)
-            elif r < 30 and g < 30 and b < 30 and a < 200:
-                is_background = True
-
-            if is_background:
-                new_data.append((0, 0, 0, 0))  # Hoàn toàn trong suốt
-            else:
-                new_data.append(item)
-
-        # Tạo ảnh mới với dữ liệu đã xử lý
-        image.putdata(new_data)
-        return image
+        """Tách nền dựa trên màu sắc, phù hợp cho các sticker có nền đồng nhất."""
+        return background_removal.remove_background_pillow(image)
 
     def get_anchor_points_for_template(self, template_name, sticker_indices=None):
         """
@@ -548,10 +1322,7 @@ class TemplateEngine:
         Returns:
             list: Danh sách các tuple (x, y) anchor points
         """
-        if template_name not in self.TEMPLATES:
-            raise ValueError(f"Template '{template_name}' not found")
-
-        template = self.TEMPLATES[template_name]
+        template = self.get_template(template_name)
         layout = template.get("layout", "")
 
         # Xác định option dựa trên sticker_indices
@@ -600,14 +1371,12 @@ class TemplateEngine:
             list: Danh sách các tuple (x, y) anchor points
         """
         # Legacy method - trả về empty list vì bây giờ anchor points được chọn động
-        if template_name not in self.TEMPLATES:
-            raise ValueError(f"Template '{template_name}' not found")
-        return self.TEMPLATES[template_name].get("anchor_points", [])
+        return self.get_template(template_name).get("anchor_points", [])
 
     def place_stickers_with_anchors(self, canvas, sticker_paths, template_name,
                                       sticker_indices=None, num_stickers=2,
                                       rotation_range=(0, 360), scale_range=(3.0, 4.0),
-                                      remove_background=True):
+                                      remove_background=True, rng=None):
         """
         Gắn stickers sử dụng anchor points cố định.
 
@@ -618,7 +1387,8 @@ class TemplateEngine:
         - Chọn ngẫu nhiên N điểm từ anchor_points (tối đa 2 stickers)
         - Mỗi sticker được xoay ngẫu nhiên 0-360 độ
         - Mỗi sticker được phóng to/thu nhỏ ngẫu nhiên 3-4 lần
-        - Nền sticker được loại bỏ bằng rembg (nếu remove_background=True)
+        - Nền sticker được loại bỏ bằng rembg (nếu remove_background=True), kết quả
+          được cache trên disk và trong memory (xem models/sticker_cache.py)
 
         Args:
             canvas: PIL Image object (canvas template)
@@ -629,28 +1399,61 @@ class TemplateEngine:
             rotation_range: tuple (min, max) độ xoay
             scale_range: tuple (min, max) tỷ lệ phóng to/thu nhỏ (mặc định 3-4 lần)
             remove_background: nếu True, loại bỏ nền sticker bằng rembg
+            rng: random.Random dùng cho các lựa chọn ngẫu nhiên (seed cố định ->
+                 bố cục sticker cố định); mặc định dùng module random
 
         Returns:
             PIL Image: Canvas với stickers đã được gắn
         """
-        import random
+        placements = self._sticker_placements(
+            sticker_paths, template_name, sticker_indices=sticker_indices,
+            num_stickers=num_stickers, rotation_range=rotation_range,
+            scale_range=scale_range, remove_background=remove_background, rng=rng)
+        for sticker, scale, (x, y) in placements:
+            new_w = int(sticker.width * scale)
+            new_h = int(sticker.height * scale)
+            sticker = sticker.resize((new_w, new_h), Image.BICUBIC)
+
+            # Paste sticker lên canvas (anchor point là tâm, dùng sticker làm mask)
+            center_x = x - new_w // 2
+            center_y = y - new_h // 2
+            canvas.paste(sticker, (center_x, center_y), sticker)
+
+        return canvas
+
+    def _sticker_placements(self, sticker_paths, template_name, sticker_indices=None,
+                            num_stickers=2, rotation_range=(0, 360), scale_range=(3.0, 4.0),
+                            remove_background=True, rng=None):
+        """
+        Chọn anchor point, sticker, góc xoay và tỷ lệ cho từng sticker.
+
+        Tách khỏi place_stickers_with_anchors để render in (print) dùng đúng cùng
+        bố cục với cùng rng.
+
+        Returns:
+            list of (sticker đã xoay (RGBA), scale, (x, y) anchor point)
+        """
+        from .sticker_cache import get_sticker_cache
+
+        rng = rng or random
 
         # Lấy anchor points dựa trên template và sticker indices
         anchor_points = self.get_anchor_points_for_template(template_name, sticker_indices)
         if not anchor_points:
-            return canvas
+            return []
 
         if not sticker_paths:
-            return canvas
+            return []
 
         # Chọn ngẫu nhiên N điểm từ anchor_points (tối đa 2 stickers)
         num_to_place = min(num_stickers, len(anchor_points))
-        selected_points = random.sample(anchor_points, num_to_place)
+        selected_points = rng.sample(anchor_points, num_to_place)
 
         # Trộm sticker paths đã chọn để không lặp lại
         available_stickers = list(sticker_paths)
-        random.shuffle(available_stickers)
+        rng.shuffle(available_stickers)
 
+        placements = []
         for i, (x, y) in enumerate(selected_points):
             if i >= len(available_stickers):
                 break
@@ -658,31 +1461,21 @@ class TemplateEngine:
             sticker_path = available_stickers[i]
 
             try:
-                # Mở sticker và chuyển sang RGBA
-                sticker = Image.open(sticker_path).convert("RGBA")
-
-                # Tách nền bằng rembg (loại bỏ hoàn toàn nền trắng/đen)
                 if remove_background:
-                    sticker = self._remove_sticker_background(sticker)
+                    # Sticker đã tách nền, lấy từ cache (chỉ xử lý 1 lần cho mỗi phiên bản file)
+                    sticker = get_sticker_cache().get(sticker_path)
+                else:
+                    sticker = Image.open(sticker_path).convert("RGBA")
 
             except Exception:
                 continue
 
             # Biến đổi ngẫu nhiên: Xoay 0-360 độ
-            angle = random.uniform(rotation_range[0], rotation_range[1])
+            angle = rng.uniform(rotation_range[0], rotation_range[1])
             sticker = sticker.rotate(angle, Image.BICUBIC, expand=True)
 
             # Biến đổi ngẫu nhiên: Phóng to/thu nhỏ 3-4 lần
-            scale = random.uniform(scale_range[0], scale_range[1])
-            new_w = int(sticker.width * scale)
-            new_h = int(sticker.height * scale)
-            sticker = sticker.resize((new_w, new_h), Image.BICUBIC)
-
-            # Paste sticker lên canvas (anchor point là tâm, dùng sticker làm mask)
-            center_x = x - new_w // 2
-            center_y = y - new_h // 2
-            canvas.paste(sticker, (center_x, center_y), sticker)
-
-        return canvas
-
+            scale = rng.uniform(scale_range[0], scale_range[1])
+            placements.append((sticker, scale, (x, y)))
 
+        return placements
@@ -2,19 +2,34 @@
 API routes for photobooth application
 """
 from flask import Blueprint, request, jsonify, send_from_directory, current_app, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 from models.image_processor import ImageProcessor
 from models.filter_engine import FilterEngine
 from models.database import db, Session, Photo, FilterApplied, User, FaceEmbedding
 from models.template_engine import TemplateEngine
 from models.model_manager import get_model_manager
+from models.face_analysis import FaceAnalysisPipeline, get_face_analysis_pipeline
+from models.sticker_cache import get_sticker_cache
+from models.collage_jobs import get_collage_job_queue
+from models.capture_pipeline import get_capture_pipeline, InvalidImageError
+from models.image_derivatives import get_derivative_cache
+from models.preview_cache import get_preview_cache
+from models.sticker_assets import get_sticker_assets
+from models.sticker_batch import apply_stickers_batch
+from utils.async_worker import QueueFullError
+from utils.http_cache import file_etag, apply_cache_headers, IMMUTABLE_MAX_AGE
 from models.embedding_index import get_embedding_index
 from models.embeddings import serialize_embedding, deserialize_embedding
 from datetime import datetime
 import os
 import uuid
 import base64
+import json
 import io
+import mimetypes
+import numpy as np
 from PIL import Image
 
 api_bp = Blueprint('api', __name__)
@@ -50,6 +65,14 @@ def upload_photo():
         # Read image data
         image_data = file.read()
         
+        # Generate unique filename
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        unique_id = str(uuid.uuid4())[:8]
+        filename = f'{timestamp}_{unique_id}.jpg'
+        
+        # Validate and save original (JPEG bytes are stored as uploaded)
+        _get_capture_pipeline().persist(image_data, filename)
+        
         # Process image with Python
         processed_image = ImageProcessor.process_uploaded_image(
             image_data, 
@@ -57,24 +80,9 @@ def upload_photo():
             flip_if_front_camera=flip
         )
         
-        # Generate unique filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        filename = f'{timestamp}_{unique_id}.jpg'
-        
         # Get app context for folder paths
         from flask import current_app
         
-        # Save original
-        original_path = os.path.join(
-            current_app.config['ORIGINALS_FOLDER'], 
-            filename
-        )
-        ImageProcessor.save_image(
-            ImageProcessor.process_uploaded_image(image_data, 'none', False),
-            original_path
-        )
-        
         # Save processed
         processed_path = os.path.join(
             current_app.config['PROCESSED_FOLDER'], 
@@ -99,6 +107,8 @@ def upload_photo():
             'thumbnail_url': f'/api/images/thumbnails/{filename}'
         })
         
+    except InvalidImageError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Processing failed: {str(e)}'}), 500
 
@@ -107,15 +117,98 @@ def upload_photo():
 def serve_image(folder, filename):
     """
     Serve images from different folders (originals, processed, thumbnails)
+    
+    Optional query parameters return a resized variant (see
+    models/image_derivatives.py): w, h (allow-listed sizes), fit
+    (contain | cover) and format (jpeg | png | webp | avif).
+    
+    Without format, processed images, thumbnails and collages are sent as
+    AVIF/WebP when the Accept header lists them (Vary: Accept). Originals are
+    always sent as stored unless a variant is requested.
+    
+    Responses carry a content-hash ETag (If-None-Match -> 304). Originals are
+    never rewritten and are cached as immutable; processed files and thumbnails
+    can be rewritten in place, so they are immutable only when requested with
+    ?v=<etag> (see _image_url) and revalidated otherwise.
     """
     from flask import current_app
     
-    valid_folders = ['originals', 'processed', 'thumbnails']
+    valid_folders = ['originals', 'processed', 'thumbnails', 'collages']
     if folder not in valid_folders:
         return jsonify({'error': 'Invalid folder'}), 400
     
-    folder_path = current_app.config[f'{folder.upper()}_FOLDER']
-    return send_from_directory(folder_path, filename)
+    # Capture derivatives are generated in the background: wait for them
+    if folder in ('processed', 'thumbnails'):
+        _wait_for_capture(filename)
+    
+    folder_path = os.path.join(current_app.root_path, current_app.config[f'{folder.upper()}_FOLDER'])
+    path = safe_join(folder_path, filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'Image not found'}), 404
+    
+    etag = file_etag(path)
+    immutable = folder == 'originals' or request.args.get('v') == etag
+    
+    # Resized variant (?w=&h=&fit=&format=), rendered once into the derivative cache
+    derivatives = get_derivative_cache(current_app.config)
+    try:
+        params = derivatives.parse_params(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    negotiable = folder != 'originals' and not (params and params['format'])
+    if negotiable:
+        requested = params
+        params = derivatives.negotiate(request.accept_mimetypes, params)
+        if params and not requested:
+            # Full-size transcode: keep the source if the new format is not smaller
+            variant = derivatives.get(path, params, etag, kind=folder)
+            if os.path.getsize(variant) >= os.path.getsize(path):
+                params = None
+    
+    if params:
+        path = os.path.abspath(derivatives.get(path, params, etag, kind=folder))
+        folder, filename = 'derivatives', os.path.basename(path)
+        folder_path = os.path.dirname(path)
+        etag = filename  # source hash + variant
+    
+    accel_prefix = current_app.config.get('IMAGE_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        # nginx serves the bytes from its internal location
+        response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{folder}/{filename}"
+        response.set_etag(etag)
+        response.make_conditional(request)
+    else:
+        # USE_X_SENDFILE makes send_from_directory emit X-Sendfile instead of the body
+        response = send_from_directory(folder_path, filename, etag=etag)
+    
+    if negotiable:
+        response.vary.add('Accept')
+    return apply_cache_headers(response, immutable,
+                               current_app.config.get('IMAGE_CACHE_MAX_AGE', IMMUTABLE_MAX_AGE))
+
+
+@api_bp.route('/images/stats', methods=['GET'])
+def get_image_stats():
+    """
+    Derivative cache state and per-kind/per-format encode cost.
+    
+    Returns:
+      - derivatives.index: cache entries/bytes/hits/misses
+      - derivatives.encode: {kind: {format: count, avg_encode_ms, source_bytes,
+        bytes, savings_pct, quality}}
+    """
+    return jsonify({'success': True, 'derivatives': get_derivative_cache(current_app.config).stats()})
+
+
+def _image_url(folder, filename):
+    """serve_image URL pinned to the current file content (?v=<etag>) when the file exists"""
+    path = os.path.join(current_app.root_path, current_app.config[f'{folder.upper()}_FOLDER'], filename)
+    try:
+        return url_for('api.serve_image', folder=folder, filename=filename, v=file_etag(path))
+    except OSError:
+        return url_for('api.serve_image', folder=folder, filename=filename)
 
 
 @api_bp.route('/sessions', methods=['POST'])
@@ -175,99 +268,149 @@ def capture_photo():
         file = request.files['image']
         image_data = file.read()
         
-        # Process image (flip for front camera)
-        original_image = ImageProcessor.process_uploaded_image(image_data, 'none', False)
-        processed_image = ImageProcessor.process_uploaded_image(image_data, 'none', True)  # Flip for front camera
+        return _store_capture(session, photo_number,
+                              lambda pipeline, filename, timings: pipeline.persist(image_data, filename, timings))
         
-        # Generate unique filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_id = str(uuid.uuid4())[:8]
-        base_filename = f'{timestamp}_{unique_id}_{photo_number}.jpg'
-        
-        # Save original
-        original_path = os.path.join(
-            current_app.config['ORIGINALS_FOLDER'], 
-            base_filename
-        )
-        ImageProcessor.save_image(original_image, original_path)
-        
-        # Save processed (flipped)
-        processed_path = os.path.join(
-            current_app.config['PROCESSED_FOLDER'], 
-            base_filename
-        )
-        ImageProcessor.save_image(processed_image, processed_path)
-        
-        # Create and save thumbnail
-        thumbnail_image = ImageProcessor.create_thumbnail(processed_image.copy())
-        thumbnail_path = os.path.join(
-            current_app.config['THUMBNAILS_FOLDER'], 
-            base_filename
-        )
-        ImageProcessor.save_image(thumbnail_image, thumbnail_path)
-        
-        # Create a template-slot-sized preview for faster client preview
-        try:
-            templates_json = os.path.join(current_app.static_folder, 'templates', 'templates.json')
-            slot_size = (540, 400)
-            if os.path.exists(templates_json):
-                import json
-                with open(templates_json, 'r', encoding='utf-8') as fh:
-                    tmpl_data = json.load(fh)
-                # find max photo_size among templates
-                max_w, max_h = 0, 0
-                for t in tmpl_data.values():
-                    ps = t.get('photo_size')
-                    if ps and isinstance(ps, list) and len(ps) >= 2:
-                        max_w = max(max_w, int(ps[0]))
-                        max_h = max(max_h, int(ps[1]))
-                if max_w and max_h:
-                    slot_size = (max_w, max_h)
-            # Use TemplateEngine resize_and_crop to preserve crop behavior
-            engine = TemplateEngine()
-            slot_image = engine._resize_and_crop(processed_image.copy(), slot_size)
-            name_root, ext = base_filename.rsplit('.', 1)
-            slot_filename = f"{name_root}_slot.jpg"
-            slot_path = os.path.join(current_app.config['PROCESSED_FOLDER'], slot_filename)
-            ImageProcessor.save_image(slot_image, slot_path)
-            slot_url = f'/api/images/processed/{slot_filename}'
-        except Exception:
-            slot_url = None
-        
-        # Save to database
-        photo = Photo(
-            session_id=session_id,
-            photo_number=photo_number,
-            original_filename=base_filename,
-            processed_filename=base_filename,
-            thumbnail_filename=base_filename
-        )
-        
-        db.session.add(photo)
+    except InvalidImageError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Capture failed: {str(e)}'}), 500
+
+
+@api_bp.route('/sessions/<session_id>/capture/<int:photo_number>', methods=['POST'])
+def capture_photo_raw(session_id, photo_number):
+    """
+    Capture a photo from a raw image/jpeg request body
+    
+    Same result as POST /api/capture, but the body is the JPEG itself
+    (canvas.toBlob) and is streamed to the originals folder instead of
+    being parsed as multipart form data.
+    """
+    try:
+        if request.mimetype != 'image/jpeg':
+            return jsonify({'error': 'Content-Type must be image/jpeg'}), 415
         
-        # Update session status if all photos captured
-        photo_count = Photo.query.filter_by(session_id=session_id).count()
-        if photo_count >= 4:
-            session.status = 'filtering'
+        session = Session.query.get(session_id)
+        if not session:
+            return jsonify({'error': 'Session not found'}), 404
         
-        db.session.commit()
+        if photo_number < 1 or photo_number > 4:
+            return jsonify({'error': 'Photo number must be between 1 and 4'}), 400
         
-        return jsonify({
-            'success': True,
-            'photo_id': photo.id,
-            'file_path': base_filename,
-            'original_url': f'/api/images/originals/{base_filename}',
-            'processed_url': f'/api/images/processed/{base_filename}',
-            'thumbnail_url': f'/api/images/thumbnails/{base_filename}',
-            'slot_url': slot_url,
-            'photo_number': photo_number
-        })
+        return _store_capture(session, photo_number,
+                              lambda pipeline, filename, timings: pipeline.persist_stream(
+                                  request.stream, filename, timings))
         
+    except RequestEntityTooLarge:
+        db.session.rollback()
+        return jsonify({'error': 'Image too large'}), 413
+    except InvalidImageError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Capture failed: {str(e)}'}), 500
 
 
+def _store_capture(session, photo_number, persist):
+    """
+    Persist a capture, record it in the DB and queue its derivatives.
+    
+    Args:
+        session: Session the photo belongs to
+        photo_number: 1-4
+        persist: callable(pipeline, filename, timings) writing the original
+    
+    Returns:
+        JSON response for the capture endpoints
+    """
+    # Generate unique filename
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    unique_id = str(uuid.uuid4())[:8]
+    base_filename = f'{timestamp}_{unique_id}_{photo_number}.jpg'
+    
+    # Persist the upload; processed (flipped for front camera), thumbnail and
+    # slot preview are generated on the capture worker pool
+    pipeline = _get_capture_pipeline()
+    timings = {}
+    persist(pipeline, base_filename, timings)
+    name_root = base_filename.rsplit('.', 1)[0]
+    slot_url = f'/api/images/processed/{name_root}_slot.jpg'
+    
+    # Save to database
+    photo = Photo(
+        session_id=session.id,
+        photo_number=photo_number,
+        original_filename=base_filename,
+        processed_filename=base_filename,
+        thumbnail_filename=base_filename
+    )
+    
+    db.session.add(photo)
+    
+    # Update session status if all photos captured
+    photo_count = Photo.query.filter_by(session_id=session.id).count()
+    if photo_count >= 4:
+        session.status = 'filtering'
+    
+    db.session.commit()
+    
+    # Derivative URLs resolve once the files exist (serve_image waits for them)
+    pipeline.submit(base_filename, flip=True)
+    
+    return jsonify({
+        'success': True,
+        'photo_id': photo.id,
+        'file_path': base_filename,
+        'original_url': f'/api/images/originals/{base_filename}',
+        'processed_url': f'/api/images/processed/{base_filename}',
+        'thumbnail_url': f'/api/images/thumbnails/{base_filename}',
+        'slot_url': slot_url,
+        'photo_number': photo_number,
+        'derivatives': (pipeline.status(base_filename) or {}).get('status'),
+        'status_url': url_for('api.get_capture_status', filename=base_filename),
+        'timings': timings
+    })
+
+
+def _get_capture_pipeline():
+    """Shared CapturePipeline, using the app folders and the shared template_engine"""
+    return get_capture_pipeline(
+        current_app.config,
+        catalog_path=os.path.join(current_app.static_folder, 'templates', 'templates.json'),
+        template_engine=template_engine)
+
+
+def _wait_for_capture(filename):
+    """Wait (up to CAPTURE_WAIT_SECONDS) for pending derivatives of a captured photo"""
+    if filename:
+        _get_capture_pipeline().wait(filename, timeout=current_app.config.get('CAPTURE_WAIT_SECONDS', 10))
+
+
+@api_bp.route('/capture/<filename>/status', methods=['GET'])
+def get_capture_status(filename):
+    """
+    Derivative generation state of a capture.
+
+    Returns:
+      - status: pending | done | failed
+      - timings and faces (if CAPTURE_DETECT_FACES) when done, error when failed
+    """
+    status = _get_capture_pipeline().status(secure_filename(filename))
+    if status is None:
+        return jsonify({'error': 'Capture not found'}), 404
+    response = {'success': True, 'status': status['status']}
+    if status['status'] == 'done':
+        # Not known when the job ran in another worker process
+        response['timings'] = status.get('timings')
+        response['faces'] = status.get('faces')
+    elif status['status'] == 'failed':
+        response['error'] = status['error']
+    return jsonify(response)
+
+
 @api_bp.route('/sessions/<session_id>/photos', methods=['GET'])
 def get_session_photos(session_id):
     """Get all photos for a session"""
@@ -280,6 +423,7 @@ def get_session_photos(session_id):
         
         result_photos = []
         for photo in photos:
+            _wait_for_capture(photo.original_filename)
             name_root, ext = photo.original_filename.rsplit('.', 1)
             slot_filename = f"{name_root}_{photo.photo_number}_slot.jpg"
             # older slot naming may be name_root_slot.jpg, so check both
@@ -288,15 +432,16 @@ def get_session_photos(session_id):
             slot_url = None
             for fname in (possible_slot2, possible_slot1):
                 if os.path.exists(os.path.join(current_app.config['PROCESSED_FOLDER'], fname)):
-                    slot_url = url_for('api.serve_image', folder='processed', filename=fname)
+                    slot_url = _image_url('processed', fname)
                     break
 
+            # Content-pinned URLs: browsers cache them without revalidating
             result_photos.append({
                 'id': photo.id,
                 'photo_number': photo.photo_number,
                 'original_url': f'/api/images/originals/{photo.original_filename}',
-                'processed_url': f'/api/images/processed/{photo.processed_filename}',
-                'thumbnail_url': f'/api/images/thumbnails/{photo.thumbnail_filename}',
+                'processed_url': _image_url('processed', photo.processed_filename),
+                'thumbnail_url': _image_url('thumbnails', photo.thumbnail_filename),
                 'slot_url': slot_url
             })
 
@@ -338,6 +483,7 @@ def get_filters():
 def get_templates():
     """Return available template metadata and preview URLs"""
     try:
+        template_engine.catalog_path = os.path.join(current_app.static_folder, 'templates', 'templates.json')
         templates = template_engine.get_available_templates()
         enriched = {}
         for name, meta in templates.items():
@@ -351,6 +497,189 @@ def get_templates():
         return jsonify({'error': str(e)}), 500
 
 
+def _collage_photo_source(photo, use_processed=True):
+    """
+    Collage input for a photo: [source path, pre-cropped derivatives...], or None.
+
+    The capture's '<name>_slot.jpg' (already cropped to the largest template slot)
+    is offered as a derivative so TemplateEngine can skip decoding the full image.
+    """
+    _wait_for_capture(photo.original_filename)
+    # Ưu tiên sử dụng ảnh đã xử lý filter nếu có
+    if use_processed and photo.processed_filename:
+        abspath = os.path.join(current_app.config['PROCESSED_FOLDER'], photo.processed_filename)
+        if os.path.exists(abspath):
+            name_root = os.path.splitext(photo.processed_filename)[0]
+            slot_path = os.path.join(current_app.config['PROCESSED_FOLDER'], f"{name_root}_slot.jpg")
+            if os.path.exists(slot_path):
+                return [abspath, slot_path]
+            return abspath
+    # Fallback về ảnh gốc
+    abspath = os.path.join(current_app.config['ORIGINALS_FOLDER'], photo.original_filename)
+    if os.path.exists(abspath):
+        return abspath
+    return None
+
+
+def _prepare_collage(data):
+    """
+    Validate a collage request and resolve it to TemplateEngine.build_collage() arguments.
+
+    Also points the shared template_engine at the app's collage folder and
+    encoding/cache settings.
+
+    Returns:
+        (kwargs, None) on success, (None, (response, status)) on invalid input
+    """
+    template_name = data.get('template', 'classic_strip')
+    fill_mode = data.get('fill_mode', 'duplicate')
+    colors = data.get('colors') or {}
+    decorations = data.get('decorations') or []
+    use_processed = data.get('use_processed', True)  # Default: sử dụng ảnh đã xử lý
+    sticker_paths = data.get('sticker_paths', [])
+    anchor_mode = data.get('anchor_mode', False)
+    sticker_indices = data.get('sticker_indices', [])  # Danh sách chỉ số sticker (1-31)
+
+    image_paths = []
+    if 'session_id' in data:
+        session_id = data['session_id']
+        photos = Photo.query.filter_by(session_id=session_id).order_by(Photo.photo_number).all()
+        for p in photos:
+            source = _collage_photo_source(p, use_processed)
+            if source:
+                image_paths.append(source)
+    elif 'image_ids' in data:
+        ids = data['image_ids']
+        photos = Photo.query.filter(Photo.id.in_(ids)).order_by(Photo.photo_number).all()
+        for p in photos:
+            source = _collage_photo_source(p, use_processed)
+            if source:
+                image_paths.append(source)
+    else:
+        return None, (jsonify({'error': 'Provide session_id or image_ids'}), 400)
+
+    # Ensure template engine uses app collage folder and encoding defaults
+    template_engine.output_dir = current_app.config.get('COLLAGES_FOLDER', template_engine.output_dir)
+    template_engine.output_options = _collage_output_defaults(current_app.config)
+    template_engine.max_cached_collages = current_app.config.get('COLLAGE_CACHE_MAX_FILES')
+    template_engine.collage_ttl_seconds = current_app.config.get('COLLAGE_CACHE_TTL_SECONDS')
+    template_engine.background_cache_dir = current_app.config.get('TEMPLATE_BACKGROUND_CACHE_DIR') or None
+    template_engine.catalog_path = os.path.join(current_app.static_folder, 'templates', 'templates.json')
+    template_engine.print_band_height = current_app.config.get('COLLAGE_PRINT_BAND_HEIGHT', TemplateEngine.PRINT_BAND_HEIGHT)
+    template_engine.max_print_pixels = current_app.config.get('COLLAGE_PRINT_MAX_PIXELS', TemplateEngine.MAX_PRINT_PIXELS)
+    get_sticker_cache(os.path.join(current_app.static_folder, 'templates', 'processed'))
+    try:
+        template_engine.get_template(template_name)
+    except ValueError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    try:
+        output_options = TemplateEngine.normalize_output_options(
+            data.get('output') or {}, template_engine.output_options)
+    except (TypeError, ValueError) as e:
+        return None, (jsonify({'error': f'Invalid output options: {str(e)}'}), 400)
+
+    # Process sticker paths for anchor mode
+    processed_stickers = []
+    if anchor_mode and sticker_paths:
+        for path in sticker_paths:
+            if not path:
+                continue
+            # Normalize path
+            norm = path.replace('\\', '/').lstrip('/')
+            allowed_prefixes = ('templates/stickers/', 'static/templates/stickers/')
+            if not any(norm.startswith(pref) for pref in allowed_prefixes):
+                continue
+            rel = norm[len('static/'):] if norm.startswith('static/') else norm
+            abs_path = os.path.join(current_app.static_folder, rel)
+            if os.path.exists(abs_path):
+                processed_stickers.append(abs_path)
+
+    # Decorations: if the client provides decoration name, convert to static path
+    processed_decorations = []
+    for deco in decorations:
+        path = deco.get('path')
+        # Only allow decorations from our static templates/decorations directory
+        if not path:
+            continue
+        if not os.path.isabs(path):
+            # normalize path; allow decorations from templates/decorations or templates/stickers
+            norm = path.replace('\\', '/').lstrip('/')
+            allowed_prefixes = ('templates/decorations/', 'templates/stickers/', 'static/templates/decorations/', 'static/templates/stickers/')
+            if not any(norm.startswith(pref) for pref in allowed_prefixes):
+                return None, (jsonify({'error': 'Invalid decoration path'}), 400)
+            # if path already starts with 'static/', strip it to produce path relative to static folder
+            if norm.startswith('static/'):
+                rel = norm[len('static/'):]
+            else:
+                rel = norm
+            abs_path = os.path.join(current_app.static_folder, rel)
+        else:
+            abs_path = path
+
+        # Verify file exists and is under static folder
+        try:
+            abs_path = os.path.abspath(abs_path)
+            if not abs_path.startswith(os.path.abspath(current_app.static_folder)):
+                return None, (jsonify({'error': 'Decoration path not allowed'}), 400)
+            if not os.path.exists(abs_path):
+                return None, (jsonify({'error': f'Decoration file not found: {path}'}), 400)
+        except Exception:
+            return None, (jsonify({'error': 'Invalid decoration path'}), 400)
+
+        # sanitize numeric values
+        try:
+            x = int(float(deco.get('x', 0)))
+            y = int(float(deco.get('y', 0)))
+            scale = float(deco.get('scale', 1.0))
+        except Exception:
+            return None, (jsonify({'error': 'Invalid decoration coordinates/scale'}), 400)
+
+        processed_decorations.append({
+            'path': abs_path,
+            'x': x,
+            'y': y,
+            'scale': scale,
+            'color': deco.get('color')
+        })
+
+    return {
+        'image_paths': image_paths,
+        'template_name': template_name,
+        'colors': colors,
+        'decorations': processed_decorations,
+        'fill_mode': fill_mode,
+        'sticker_paths': processed_stickers,
+        'anchor_mode': anchor_mode,
+        'sticker_indices': sticker_indices,
+        'output_options': output_options
+    }, None
+
+
+def _collage_url(output_path):
+    """Make the collage URL relative to the static folder if possible"""
+    try:
+        relative = os.path.relpath(output_path, current_app.static_folder)
+        return url_for('static', filename=relative.replace("\\", "/"))
+    except Exception:
+        return output_path
+
+
+def _collage_preview_url(output_path):
+    """
+    /api/images/collages URL of a collage (format negotiated for display),
+    or None if it was not written to COLLAGES_FOLDER. collage_url keeps the
+    exact requested output file for downloads.
+    """
+    collages_dir = os.path.abspath(os.path.join(current_app.root_path, current_app.config['COLLAGES_FOLDER']))
+    if os.path.dirname(os.path.abspath(output_path)) != collages_dir:
+        return None
+    return _image_url('collages', os.path.basename(output_path))
+
+
+def _collage_stats(result):
+    return {k: v for k, v in result.items() if k not in ('path', 'render_key')}
+
+
 @api_bp.route('/collage', methods=['POST'])
 def create_collage():
     """
@@ -367,138 +696,105 @@ def create_collage():
       - sticker_indices: list of sticker indices (starting from 1) for anchor point selection
                         - Indices 1-15: use Option 1 anchor points
                         - Indices 16-31: use Option 2 anchor points
+      - output: dict (optional) overriding the configured encoding:
+                format (png|jpeg|webp), quality, progressive, lossless, compress_level;
+                dpi or scale renders a print-resolution PNG in bands
+    Response includes 'stats' with format, bytes, render_ms and encode_ms.
     """
     try:
         data = request.get_json() or {}
-        template_name = data.get('template', 'classic_strip')
-        fill_mode = data.get('fill_mode', 'duplicate')
-        colors = data.get('colors') or {}
-        decorations = data.get('decorations') or []
-        use_processed = data.get('use_processed', True)  # Default: sử dụng ảnh đã xử lý
-        sticker_paths = data.get('sticker_paths', [])
-        anchor_mode = data.get('anchor_mode', False)
-        sticker_indices = data.get('sticker_indices', [])  # Danh sách chỉ số sticker (1-31)
-
-        image_paths = []
-        if 'session_id' in data:
-            session_id = data['session_id']
-            photos = Photo.query.filter_by(session_id=session_id).order_by(Photo.photo_number).all()
-            for p in photos:
-                # Ưu tiên sử dụng ảnh đã xử lý filter nếu có
-                if use_processed and p.processed_filename:
-                    abspath = os.path.join(current_app.config['PROCESSED_FOLDER'], p.processed_filename)
-                    if os.path.exists(abspath):
-                        image_paths.append(abspath)
-                        continue
-                # Fallback về ảnh gốc
-                abspath = os.path.join(current_app.config['ORIGINALS_FOLDER'], p.original_filename)
-                if os.path.exists(abspath):
-                    image_paths.append(abspath)
-        elif 'image_ids' in data:
-            ids = data['image_ids']
-            photos = Photo.query.filter(Photo.id.in_(ids)).order_by(Photo.photo_number).all()
-            for p in photos:
-                # Ưu tiên sử dụng ảnh đã xử lý filter nếu có
-                if use_processed and p.processed_filename:
-                    abspath = os.path.join(current_app.config['PROCESSED_FOLDER'], p.processed_filename)
-                    if os.path.exists(abspath):
-                        image_paths.append(abspath)
-                        continue
-                # Fallback về ảnh gốc
-                abspath = os.path.join(current_app.config['ORIGINALS_FOLDER'], p.original_filename)
-                if os.path.exists(abspath):
-                    image_paths.append(abspath)
-        else:
-            return jsonify({'error': 'Provide session_id or image_ids'}), 400
-
-        # Ensure template engine uses app collage folder
-        template_engine.output_dir = current_app.config.get('COLLAGES_FOLDER', template_engine.output_dir)
-
-        # Process sticker paths for anchor mode
-        processed_stickers = []
-        if anchor_mode and sticker_paths:
-            for path in sticker_paths:
-                if not path:
-                    continue
-                # Normalize path
-                norm = path.replace('\\', '/').lstrip('/')
-                allowed_prefixes = ('templates/stickers/', 'static/templates/stickers/')
-                if not any(norm.startswith(pref) for pref in allowed_prefixes):
-                    continue
-                rel = norm[len('static/'):] if norm.startswith('static/') else norm
-                abs_path = os.path.join(current_app.static_folder, rel)
-                if os.path.exists(abs_path):
-                    processed_stickers.append(abs_path)
-
-        # Decorations: if the client provides decoration name, convert to static path
-        processed_decorations = []
-        for deco in decorations:
-            path = deco.get('path')
-            # Only allow decorations from our static templates/decorations directory
-            if not path:
-                continue
-            if not os.path.isabs(path):
-                # normalize path; allow decorations from templates/decorations or templates/stickers
-                norm = path.replace('\\', '/').lstrip('/')
-                allowed_prefixes = ('templates/decorations/', 'templates/stickers/', 'static/templates/decorations/', 'static/templates/stickers/')
-                if not any(norm.startswith(pref) for pref in allowed_prefixes):
-                    return jsonify({'error': 'Invalid decoration path'}), 400
-                # if path already starts with 'static/', strip it to produce path relative to static folder
-                if norm.startswith('static/'):
-                    rel = norm[len('static/'):]
-                else:
-                    rel = norm
-                abs_path = os.path.join(current_app.static_folder, rel)
-            else:
-                abs_path = path
+        params, error = _prepare_collage(data)
+        if error:
+            return error
 
-            # Verify file exists and is under static folder
-            try:
-                abs_path = os.path.abspath(abs_path)
-                if not abs_path.startswith(os.path.abspath(current_app.static_folder)):
-                    return jsonify({'error': 'Decoration path not allowed'}), 400
-                if not os.path.exists(abs_path):
-                    return jsonify({'error': f'Decoration file not found: {path}'}), 400
-            except Exception:
-                return jsonify({'error': 'Invalid decoration path'}), 400
-
-            # sanitize numeric values
-            try:
-                x = int(float(deco.get('x', 0)))
-                y = int(float(deco.get('y', 0)))
-                scale = float(deco.get('scale', 1.0))
-            except Exception:
-                return jsonify({'error': 'Invalid decoration coordinates/scale'}), 400
-
-            processed_decorations.append({
-                'path': abs_path,
-                'x': x,
-                'y': y,
-                'scale': scale,
-                'color': deco.get('color')
-            })
+        result = template_engine.build_collage(**params)
 
-        output_path = template_engine.create_collage(
-            image_paths, template_name,
-            colors=colors,
-            decorations=processed_decorations,
-            fill_mode=fill_mode,
-            sticker_paths=processed_stickers,
-            anchor_mode=anchor_mode,
-            sticker_indices=sticker_indices
-        )
-        # make url relative to static folder if possible
+        return jsonify({
+            'success': True,
+            'collage_url': _collage_url(result['path']),
+            'preview_url': _collage_preview_url(result['path']),
+            'stats': _collage_stats(result)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@api_bp.route('/collage/jobs', methods=['POST'])
+def submit_collage_job():
+    """
+    Queue a collage render and return immediately.
+    Accepts the same JSON as POST /api/collage.
+
+    Returns (202):
+      - job_id, status ('queued' | 'running' | 'done' | 'failed'), status_url
+      - deduplicated: True if an identical render was already in flight
+    Returns 429 with Retry-After when the render queue is full.
+    """
+    try:
+        data = request.get_json() or {}
+        params, error = _prepare_collage(data)
+        if error:
+            return error
+
+        render_key = template_engine.render_key(**params)
+        job_queue = get_collage_job_queue(current_app.config)
         try:
-            relative = os.path.relpath(output_path, current_app.static_folder)
-            collage_url = url_for('static', filename=relative.replace("\\", "/"))
-        except Exception:
-            collage_url = output_path
+            job, deduplicated = job_queue.submit(
+                render_key, lambda: template_engine.build_collage(**params))
+        except QueueFullError as e:
+            response = jsonify({'error': f'Collage queue is full, retry later ({str(e)})'})
+            response.headers['Retry-After'] = str(current_app.config.get('COLLAGE_RETRY_AFTER', 2))
+            return response, 429
 
-        return jsonify({'success': True, 'collage_url': collage_url})
+        return jsonify({
+            'success': True,
+            'job_id': job['id'],
+            'status': job['status'],
+            'deduplicated': deduplicated,
+            'status_url': url_for('api.get_collage_job', job_id=job['id'])
+        }), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@api_bp.route('/collage/jobs/<job_id>', methods=['GET'])
+def get_collage_job(job_id):
+    """
+    Status of a collage job.
+
+    Returns:
+      - status: queued | running | done | failed
+      - collage_url and stats when done, error when failed
+    """
+    job = get_collage_job_queue(current_app.config).get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response = {
+        'success': True,
+        'job_id': job['id'],
+        'status': job['status']
+    }
+    if job['status'] == 'done':
+        response['collage_url'] = _collage_url(job['result']['path'])
+        response['preview_url'] = _collage_preview_url(job['result']['path'])
+        response['stats'] = _collage_stats(job['result'])
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
+
+
+def _collage_output_defaults(config):
+    """Collage encoding defaults from app config"""
+    return TemplateEngine.normalize_output_options({
+        'format': config.get('COLLAGE_FORMAT'),
+        'quality': config.get('COLLAGE_QUALITY'),
+        'progressive': config.get('COLLAGE_JPEG_PROGRESSIVE'),
+        'lossless': config.get('COLLAGE_WEBP_LOSSLESS'),
+        'compress_level': config.get('COLLAGE_PNG_COMPRESS_LEVEL'),
+    })
+
+
 @api_bp.route('/apply-filter', methods=['POST'])
 def apply_filter():
     """
@@ -577,8 +873,8 @@ def apply_filter():
             )
             ImageProcessor.save_image(thumbnail_image, thumbnail_path)
             
-            processed_url = url_for('api.serve_image', folder='processed', filename=processed_filename)
-            thumbnail_url = url_for('api.serve_image', folder='thumbnails', filename=thumbnail_filename)
+            processed_url = _image_url('processed', processed_filename)
+            thumbnail_url = _image_url('thumbnails', thumbnail_filename)
             original_url = url_for('api.serve_image', folder='originals', filename=photo.original_filename)
             
             processed_images.append({
@@ -665,6 +961,7 @@ def detect_faces_api():
 
             if filename:
                 # Look in processed folder
+                _wait_for_capture(filename)
                 filepath = os.path.join(
                     current_app.config['PROCESSED_FOLDER'],
                     filename
@@ -679,6 +976,7 @@ def detect_faces_api():
                     fname = parts[-1]
                     folder_key = f'{folder.upper()}_FOLDER'
                     if folder_key in current_app.config:
+                        _wait_for_capture(fname)
                         filepath = os.path.join(
                             current_app.config[folder_key],
                             fname
@@ -754,6 +1052,7 @@ def auto_crop_portrait():
             data = request.get_json()
             filename = data.get('filename')
             if filename:
+                _wait_for_capture(filename)
                 filepath = os.path.join(
                     current_app.config['PROCESSED_FOLDER'],
                     filename
@@ -833,6 +1132,7 @@ def get_sticker_positions():
             data = request.get_json()
             filename = data.get('filename')
             if filename:
+                _wait_for_capture(filename)
                 filepath = os.path.join(
                     current_app.config['PROCESSED_FOLDER'],
                     filename
@@ -881,7 +1181,9 @@ def get_processed_sticker():
     Return processed sticker PNG with transparent background.
     Query params:
       - name: filename under static/templates (e.g., hat.png)
-    Saves processed file under static/templates/processed/<name> and returns URL.
+    Processed files are shared with collage rendering through the processed sticker
+    cache (static/templates/processed/<stem>_<content hash>.png); the URL changes
+    whenever the source sticker changes.
     """
     try:
         name = request.args.get('name')
@@ -903,21 +1205,11 @@ def get_processed_sticker():
         if not os.path.exists(src_path):
             return jsonify({'error': f'Sticker not found: {name}'}), 404
 
-        processed_dir = os.path.join(templates_dir, 'processed')
-        os.makedirs(processed_dir, exist_ok=True)
-        processed_path = os.path.join(processed_dir, name)
-
-        # If already processed, return URL
-        if os.path.exists(processed_path):
-            rel = os.path.relpath(processed_path, current_app.static_folder)
-            return jsonify({'processed_url': url_for('static', filename=rel.replace("\\", "/"))})
+        sticker_cache = get_sticker_cache(os.path.join(templates_dir, 'processed'))
 
-        # Process sticker: remove background using TemplateEngine helper
+        # Process sticker once (or reuse the cached result)
         try:
-            img = Image.open(src_path).convert('RGBA')
-            processed_img = TemplateEngine._remove_sticker_background(img)
-            # Save processed PNG
-            processed_img.save(processed_path, 'PNG')
+            processed_path = sticker_cache.ensure_processed(src_path)
             rel = os.path.relpath(processed_path, current_app.static_folder)
             return jsonify({'processed_url': url_for('static', filename=rel.replace("\\", "/"))})
         except Exception as e:
@@ -929,6 +1221,65 @@ def get_processed_sticker():
         return jsonify({'error': f'Failed to process sticker: {str(e)}'}), 500
 
 
+def _preview_response(image, payload, url_key, base64_key, data_uri=False):
+    """
+    Deliver a preview image according to the request's 'response' option
+    (query string, JSON body or form field):
+      - url (default): JPEG written to the preview cache, URL in url_key
+      - image: the JPEG itself as the response body, payload in X-Preview-Info
+        (also chosen when Accept prefers image/jpeg over JSON)
+      - base64: legacy JSON with the base64 JPEG in base64_key
+    """
+    body = request.get_json(silent=True) if request.is_json else None
+    mode = (request.args.get('response') or (body or {}).get('response') or
+            request.form.get('response'))
+    if not mode:
+        best = request.accept_mimetypes.best_match(['application/json', 'image/jpeg'])
+        mode = 'image' if best == 'image/jpeg' else 'url'
+    
+    if mode == 'image':
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, format='JPEG', quality=90)
+        response = current_app.response_class(buffer.getvalue(), mimetype='image/jpeg')
+        response.headers['X-Preview-Info'] = json.dumps(payload)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    if mode == 'base64':
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, format='JPEG', quality=90)
+        encoded = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        return jsonify({'success': True,
+                        base64_key: f'data:image/jpeg;base64,{encoded}' if data_uri else encoded,
+                        **payload})
+    
+    previews = get_preview_cache(current_app.config)
+    name = previews.put(image)
+    return jsonify({'success': True,
+                    url_key: url_for('api.serve_preview', name=name),
+                    'expires_in': previews.ttl_seconds,
+                    **payload})
+
+
+@api_bp.route('/previews/<name>', methods=['GET'])
+def serve_preview(name):
+    """Serve a preview written by _preview_response (404 once expired)"""
+    previews = get_preview_cache(current_app.config)
+    path = previews.path(name)
+    if path is None:
+        return jsonify({'error': 'Preview not found or expired'}), 404
+    response = send_from_directory(os.path.abspath(previews.cache_dir), name)
+    response.cache_control.no_cache = None
+    response.cache_control.private = True
+    response.cache_control.max_age = previews.ttl_seconds
+    return response
+
+
+def _get_sticker_assets():
+    """Shared StickerAssets reading accessories from static/templates"""
+    return get_sticker_assets(os.path.join(current_app.static_folder, 'templates'))
+
+
 @api_bp.route('/apply-sticker', methods=['POST'])
 def apply_sticker_to_photo():
     """
@@ -938,10 +1289,11 @@ def apply_sticker_to_photo():
     - filename: image filename in processed folder
     - sticker_type: 'hat', 'glasses', 'ears', 'mustache'
     - save: if True, save the result (default: False for preview)
+    - response: preview delivery when not saving: url (default) | image | base64
 
     Returns:
     - success: bool
-    - result_url: URL of the processed image (base64 if preview, file URL if saved)
+    - result_url: URL of the processed image (short-lived preview URL if not saved)
     - positions: list of face positions where stickers were applied
     """
     try:
@@ -957,31 +1309,18 @@ def apply_sticker_to_photo():
             return jsonify({'error': 'Missing filename'}), 400
 
         # Load the photo
+        _wait_for_capture(filename)
         filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
         if not os.path.exists(filepath):
             return jsonify({'error': f'Image not found: {filename}'}), 404
 
-        image = Image.open(filepath).convert('RGBA')
+        # Accessory stickers are decoded once and pre-scaled (models/sticker_assets.py)
+        assets = _get_sticker_assets()
+        if not assets.exists(sticker_type):
+            return jsonify({'error': f'Sticker not found: {os.path.basename(assets.sticker_path(sticker_type))}'}), 404
 
-        # Get sticker file - mapping các loại phụ kiện
-        sticker_map = {
-            'hat': 'hat-2.png',
-            'glasses': 'glasses.png',
-            'ears': 'rabbit_ears.png',
-            'mustache': 'mustache.png',
-            'noel_hat': 'noel-hat.png',
-            'bow': 'No.png'
-        }
-        sticker_name = sticker_map.get(sticker_type, 'hat-2.png')
-
-        # Try to find sticker in templates folder
-        templates_dir = os.path.join(current_app.static_folder, 'templates')
-        sticker_path = os.path.join(templates_dir, sticker_name)
-
-        if not os.path.exists(sticker_path):
-            return jsonify({'error': f'Sticker not found: {sticker_name}'}), 404
-
-        sticker = Image.open(sticker_path).convert('RGBA')
+        with Image.open(filepath) as img:
+            image = img.convert('RGB')
 
         # Detect faces and get positions
         positions = detector.get_face_positions_for_stickers(image, sticker_type)
@@ -993,60 +1332,23 @@ def apply_sticker_to_photo():
                 'positions': []
             })
 
-        # Apply sticker to each detected face
-        result_image = image.copy()
+        # Apply sticker to each detected face (composited in place, only inside the sticker box)
+        canvas = np.array(image)
         applied_positions = []
 
         for pos in positions:
-            # Calculate sticker size based on face
-            face_width = pos['face_bbox'][2]
-
-            # Size multiplier based on sticker type
-            size_multipliers = {
-                'hat': 1.4,       # Mũ rộng hơn mặt
-                'glasses': 1.1,   # Kính vừa với mặt
-                'ears': 1.6,      # Tai thỏ rộng
-                'mustache': 0.5,  # Râu nhỏ hơn
-                'noel_hat': 1.5,  # Nón Noel rộng
-                'bow': 0.6        # Nơ nhỏ gọn
-            }
-            multiplier = size_multipliers.get(sticker_type, 1.0)
-            target_width = int(face_width * multiplier)
-
-            # Maintain aspect ratio
-            sticker_ratio = sticker.height / sticker.width
-            target_height = int(target_width * sticker_ratio)
-
-            # Resize sticker
-            resized_sticker = sticker.resize((target_width, target_height), Image.LANCZOS)
-
-            # Calculate paste position (centered on anchor point)
-            paste_x = pos['x'] - target_width // 2
-            paste_y = pos['y'] - target_height // 2
-
-            # Adjust for anchor type
-            anchor = pos.get('anchor', 'center')
-            if anchor == 'bottom-center':
-                paste_y = pos['y'] - target_height
-
-            # Ensure position is within bounds
-            paste_x = max(0, min(paste_x, result_image.width - target_width))
-            paste_y = max(0, min(paste_y, result_image.height - target_height))
-
-            # Paste sticker with transparency
-            result_image.paste(resized_sticker, (paste_x, paste_y), resized_sticker)
+            sticker, paste_xy = assets.place(sticker_type, pos, image.size)
+            assets.composite(canvas, sticker, paste_xy)
 
             applied_positions.append({
                 'x': pos['x'],
                 'y': pos['y'],
-                'width': target_width,
-                'height': target_height,
+                'width': sticker.width,
+                'height': sticker.height,
                 'confidence': pos['confidence']
             })
 
-        # Convert result to RGB for saving/preview
-        result_rgb = Image.new('RGB', result_image.size, (255, 255, 255))
-        result_rgb.paste(result_image, mask=result_image.split()[3] if result_image.mode == 'RGBA' else None)
+        result_rgb = Image.fromarray(canvas)
 
         if save_result:
             # Save to processed folder with sticker suffix
@@ -1062,16 +1364,9 @@ def apply_sticker_to_photo():
                 'positions': applied_positions
             })
         else:
-            # Return as base64 for preview
-            buffer = io.BytesIO()
-            result_rgb.save(buffer, format='JPEG', quality=90)
-            base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-
-            return jsonify({
-                'success': True,
-                'result_base64': f'data:image/jpeg;base64,{base64_image}',
-                'positions': applied_positions
-            })
+            # Preview: URL, raw image/jpeg or legacy base64 (see _preview_response)
+            return _preview_response(result_rgb, {'positions': applied_positions},
+                                     url_key='result_url', base64_key='result_base64', data_uri=True)
 
     except Exception as e:
         return jsonify({'error': f'Apply sticker failed: {str(e)}'}), 500
@@ -1089,7 +1384,8 @@ def apply_sticker_to_session():
 
     Returns:
     - success: bool
-    - results: list of results for each photo
+    - results: list of results for each photo (with per-stage timings in ms)
+    - timings: detect_batch (one forward pass for all photos) and total_ms
     """
     try:
         from models.face_detector import get_detector
@@ -1112,29 +1408,18 @@ def apply_sticker_to_session():
         if not photos:
             return jsonify({'error': 'No photos in session'}), 404
 
-        # Get sticker - mapping các loại phụ kiện
-        sticker_map = {
-            'hat': 'hat-2.png',
-            'glasses': 'glasses.png',
-            'ears': 'rabbit_ears.png',
-            'mustache': 'mustache.png',
-            'noel_hat': 'noel-hat.png',
-            'bow': 'No.png'
-        }
-        sticker_name = sticker_map.get(sticker_type, 'hat-2.png')
-
-        templates_dir = os.path.join(current_app.static_folder, 'templates')
-        sticker_path = os.path.join(templates_dir, sticker_name)
-
-        if not os.path.exists(sticker_path):
-            return jsonify({'error': f'Sticker not found: {sticker_name}'}), 404
-
-        sticker = Image.open(sticker_path).convert('RGBA')
+        assets = _get_sticker_assets()
+        if not assets.exists(sticker_type):
+            return jsonify({'error': f'Sticker not found: {os.path.basename(assets.sticker_path(sticker_type))}'}), 404
 
+        # Faces found at capture time (CAPTURE_DETECT_FACES) are reused;
+        # the remaining photos are detected in one batched forward pass
+        pipeline = _get_capture_pipeline()
         results = []
-
+        items = []
         for photo in photos:
             filename = photo.processed_filename or photo.original_filename
+            _wait_for_capture(filename)
             filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
 
             if not os.path.exists(filepath):
@@ -1145,74 +1430,34 @@ def apply_sticker_to_session():
                 })
                 continue
 
-            try:
-                image = Image.open(filepath).convert('RGBA')
-                positions = detector.get_face_positions_for_stickers(image, sticker_type)
-
-                if not positions:
-                    results.append({
-                        'photo_id': photo.id,
-                        'success': True,
-                        'warning': 'No faces detected',
-                        'faces': 0
-                    })
-                    continue
-
-                # Apply sticker to each face
-                result_image = image.copy()
-
-                for pos in positions:
-                    face_width = pos['face_bbox'][2]
-                    size_multipliers = {
-                        'hat': 1.4, 'glasses': 1.1, 'ears': 1.6,
-                        'mustache': 0.5, 'noel_hat': 1.5, 'bow': 0.6
-                    }
-                    target_width = int(face_width * size_multipliers.get(sticker_type, 1.0))
-                    sticker_ratio = sticker.height / sticker.width
-                    target_height = int(target_width * sticker_ratio)
-
-                    resized_sticker = sticker.resize((target_width, target_height), Image.LANCZOS)
-
-                    paste_x = pos['x'] - target_width // 2
-                    paste_y = pos['y'] - target_height // 2
-
-                    if pos.get('anchor') == 'bottom-center':
-                        paste_y = pos['y'] - target_height
-
-                    paste_x = max(0, min(paste_x, result_image.width - target_width))
-                    paste_y = max(0, min(paste_y, result_image.height - target_height))
-
-                    result_image.paste(resized_sticker, (paste_x, paste_y), resized_sticker)
-
-                # Save result
-                if save_result:
-                    result_rgb = Image.new('RGB', result_image.size, (255, 255, 255))
-                    if result_image.mode == 'RGBA':
-                        result_rgb.paste(result_image, mask=result_image.split()[3])
-                    else:
-                        result_rgb.paste(result_image)
-                    result_rgb.save(filepath, 'JPEG', quality=95)
-
-                results.append({
-                    'photo_id': photo.id,
-                    'success': True,
-                    'faces': len(positions),
-                    'filename': filename
-                })
+            status = pipeline.status(filename) or {}
+            cached = status.get('status') == 'done' and status.get('faces') is not None
+            results.append(None)  # filled from the batch, keeps photo order
+            items.append({
+                'key': (len(results) - 1, photo.id, filename),
+                'path': filepath,
+                'faces': status['faces'] if cached else None,
+                'size': status.get('size') if cached else None
+            })
 
-            except Exception as e:
-                results.append({
-                    'photo_id': photo.id,
-                    'success': False,
-                    'error': str(e)
-                })
+        batch = apply_stickers_batch(
+            items, sticker_type, assets, detector,
+            save=save_result,
+            max_workers=current_app.config.get('STICKER_BATCH_WORKERS', 4)
+        )
+        for result in batch['results']:
+            index, photo_id, filename = result.pop('key')
+            results[index] = {'photo_id': photo_id, **result}
+            if result.get('success'):
+                results[index]['filename'] = filename
 
         return jsonify({
             'success': True,
             'sticker_type': sticker_type,
             'results': results,
             'total_photos': len(photos),
-            'photos_with_faces': sum(1 for r in results if r.get('faces', 0) > 0)
+            'photos_with_faces': sum(1 for r in results if r.get('faces', 0) > 0),
+            'timings': batch['timings']
         })
 
     except Exception as e:
@@ -1224,8 +1469,8 @@ def face_debug():
     """
     Debug endpoint: Draw face detection boxes on image
 
-    Accepts: Form data with 'image' file
-    Returns: Image with face boxes drawn as base64
+    Accepts: Form data with 'image' file (and optional 'response', see _preview_response)
+    Returns: Image with face boxes drawn (preview URL by default)
     """
     try:
         from models.face_detector import get_detector
@@ -1239,19 +1484,10 @@ def face_debug():
 
         # Detect and draw
         result = detector.draw_faces(image)
-
-        # Return as base64
-        buffer = io.BytesIO()
-        result.save(buffer, format='JPEG', quality=90)
-        base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-
         faces = detector.detect_faces(image)
 
-        return jsonify({
-            'success': True,
-            'image_base64': base64_image,
-            'faces_detected': len(faces)
-        })
+        return _preview_response(result, {'faces_detected': len(faces)},
+                                 url_key='image_url', base64_key='image_base64')
 
     except Exception as e:
         return jsonify({'error': f'Face debug failed: {str(e)}'}), 500
@@ -1283,35 +1519,20 @@ def create_face_embedding():
         if not consent:
             return jsonify({'error': 'User consent required for face recognition'}), 400
 
-        model_manager = get_model_manager()
-
-        # Get image
-        image = None
-        if 'image' in request.files:
-            file = request.files['image']
-            image = Image.open(io.BytesIO(file.read()))
-        elif request.is_json:
-            data = request.get_json()
-            filename = data.get('filename')
-            if filename:
-                filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
-                if os.path.exists(filepath):
-                    image = Image.open(filepath)
+        model_manager = get_model_manager(current_app.config)
 
+        image = _load_request_image()
         if image is None:
             return jsonify({'error': 'No valid image provided'}), 400
 
-        # Detect face
-        faces = model_manager.detect_faces(image)
-        if not faces:
+        # Detect, crop and embed the largest face in one pass
+        analysis = get_face_analysis_pipeline(model_manager).analyze(image, ['embedding'], raise_errors=True)
+        if analysis['face'] is None:
             return jsonify({'error': 'No face detected in image'}), 400
 
-        # Use largest face
-        largest_face = max(faces, key=lambda f: f['bbox'][2] * f['bbox'][3])
-        face_region = model_manager.detector.get_face_region(image, largest_face)
-
-        # Extract embedding
-        embedding = model_manager.extract_embedding(face_region)
+        largest_face = analysis['face']
+        face_region = analysis['face_region']
+        embedding = analysis['results']['embedding']
 
         # Get or create user
         user_label = None
@@ -1356,6 +1577,10 @@ def create_face_embedding():
                 'embedding_id': existing.id
             })
 
+        # Load the index before the new row exists in the session: a cold start
+        # builds it from the database, and the new row is appended below
+        index = _get_loaded_embedding_index()
+
         embedding_record = FaceEmbedding(
             user_id=user.id,
             embedding_vector=serialized_embedding,
@@ -1366,8 +1591,7 @@ def create_face_embedding():
         db.session.add(embedding_record)
         db.session.commit()
 
-        # Add to Annoy index
-        index = get_embedding_index()
+        # Append to the embedding index (also updates the user's centroid)
         index.add_embedding(user.id, embedding)
 
         return jsonify({
@@ -1384,6 +1608,22 @@ def create_face_embedding():
         return jsonify({'error': f'Failed to create embedding: {str(e)}'}), 500
 
 
+def _get_loaded_embedding_index():
+    """Return the embedding index, loading it from disk or the database on first use"""
+    index = get_embedding_index()
+    if not index.loaded:
+        # Load embeddings from DB
+        embeddings_data = []
+        embedding_records = FaceEmbedding.query.all()
+        for record in embedding_records:
+            embeddings_data.append({
+                'user_id': record.user_id,
+                'embedding_vector': deserialize_embedding(record.embedding_vector)
+            })
+        index.load_or_create_index(embeddings_data)
+    return index
+
+
 @api_bp.route('/recognize', methods=['POST'])
 def recognize_face():
     """
@@ -1401,54 +1641,23 @@ def recognize_face():
     - matches: list of matched users with similarity scores
     """
     try:
-        model_manager = get_model_manager()
-
-        # Get image
-        image = None
-        if 'image' in request.files:
-            file = request.files['image']
-            image = Image.open(io.BytesIO(file.read()))
-        elif request.is_json:
-            data = request.get_json()
-            filename = data.get('filename')
-            if filename:
-                filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
-                if os.path.exists(filepath):
-                    image = Image.open(filepath)
-
+        image = _load_request_image()
         if image is None:
             return jsonify({'error': 'No valid image provided'}), 400
 
-        # Detect face
-        faces = model_manager.detect_faces(image)
-        if not faces:
+        # Detect, crop and embed the largest face in one pass
+        analysis = _analyze_request_image(image, ['embedding'])
+        if analysis['face'] is None:
             return jsonify({'error': 'No face detected in image'}), 400
 
-        # Use largest face
-        largest_face = max(faces, key=lambda f: f['bbox'][2] * f['bbox'][3])
-        face_region = model_manager.detector.get_face_region(image, largest_face)
-
-        # Extract embedding
-        embedding = model_manager.extract_embedding(face_region)
+        embedding = analysis['results']['embedding']
 
         # Search in index
-        index = get_embedding_index()
+        index = _get_loaded_embedding_index()
         threshold = float(request.args.get('threshold', 0.6))
         top_k = int(request.args.get('top_k', 1))
 
-        # Load index if not loaded
-        if index.index is None:
-            # Load embeddings from DB
-            embeddings_data = []
-            embedding_records = FaceEmbedding.query.all()
-            for record in embedding_records:
-                embeddings_data.append({
-                    'user_id': record.user_id,
-                    'embedding_vector': deserialize_embedding(record.embedding_vector)
-                })
-            index.load_or_create_index(embeddings_data)
-
-        # Search
+        # Search (centroid prefilter, then exact re-rank; one entry per user)
         search_results = index.search(embedding, top_k=top_k)
 
         # Filter by threshold and get user info
@@ -1510,7 +1719,7 @@ def delete_user(user_id):
             return jsonify({'error': 'User not found'}), 404
 
         # Delete from index
-        index = get_embedding_index()
+        index = _get_loaded_embedding_index()
         index.remove_user(user_id)
 
         # Delete from DB (cascade will handle embeddings)
@@ -1527,6 +1736,92 @@ def delete_user(user_id):
         return jsonify({'error': f'Failed to delete user: {str(e)}'}), 500
 
 
+def _load_request_image(data=None):
+    """
+    Load the image of a face analysis request.
+
+    Accepts form data with an 'image' file or JSON with a 'filename' in the
+    processed folder. Returns None if no valid image was provided.
+    """
+    if 'image' in request.files:
+        file = request.files['image']
+        return Image.open(io.BytesIO(file.read()))
+
+    if data is None:
+        data = request.get_json(silent=True) or {}
+    filename = data.get('filename')
+    if filename:
+        _wait_for_capture(secure_filename(filename))
+        filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], secure_filename(filename))
+        if os.path.exists(filepath):
+            return Image.open(filepath)
+    return None
+
+
+def _analyze_request_image(image, analyzers):
+    """Run the single-pass face analysis pipeline for one of the face endpoints"""
+    model_manager = get_model_manager(current_app.config)
+    return get_face_analysis_pipeline(model_manager).analyze(image, analyzers, raise_errors=True)
+
+
+@api_bp.route('/analyze', methods=['POST'])
+def analyze_face():
+    """
+    Run several face analyzers in one request (one decode, one detection, one crop).
+
+    Accepts:
+    - Form data with 'image' file
+    - OR JSON with 'filename'
+    - Query param or JSON 'analyzers': comma separated list / list of
+      embedding, emotion, age_gender, landmarks, key_landmarks
+      (default: emotion,age_gender)
+
+    Returns:
+    - face: bbox and confidence of the analyzed (largest) face
+    - results: analyzer name -> result
+    - errors: analyzer name -> error message for analyzers that failed
+    - timings_ms: per-stage latency
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            analyzers = FaceAnalysisPipeline.parse_analyzers(
+                request.args.get('analyzers', data.get('analyzers')))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        image = _load_request_image(data)
+        if image is None:
+            return jsonify({'error': 'No valid image provided'}), 400
+
+        model_manager = get_model_manager(current_app.config)
+        analysis = get_face_analysis_pipeline(model_manager).analyze(image, analyzers)
+        if analysis['face'] is None:
+            return jsonify({'error': 'No face detected in image'}), 400
+
+        results = dict(analysis['results'])
+        if 'embedding' in results:
+            results['embedding'] = [float(v) for v in results['embedding']]
+
+        face = analysis['face']
+        return jsonify({
+            'success': True,
+            'face_detected': True,
+            'face_count': len(analysis['faces']),
+            'face': {
+                'bbox': [int(v) for v in face['bbox']],
+                'confidence': float(face['confidence'])
+            },
+            'analyzers': analyzers,
+            'results': results,
+            'errors': analysis['errors'],
+            'timings_ms': analysis['timings']
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'Face analysis failed: {str(e)}'}), 500
+
+
 @api_bp.route('/detect-emotion', methods=['POST'])
 def detect_emotion():
     """
@@ -1542,44 +1837,15 @@ def detect_emotion():
     - confidence: confidence score
     """
     try:
-        model_manager = get_model_manager()
-
-        # Get image
-        image = None
-        if 'image' in request.files:
-            file = request.files['image']
-            image = Image.open(io.BytesIO(file.read()))
-        elif request.is_json:
-            data = request.get_json()
-            filename = data.get('filename')
-            if filename:
-                filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
-                if os.path.exists(filepath):
-                    image = Image.open(filepath)
-
+        image = _load_request_image()
         if image is None:
             return jsonify({'error': 'No valid image provided'}), 400
 
-        # Detect face
-        faces = model_manager.detect_faces(image)
-        if not faces:
+        analysis = _analyze_request_image(image, ['emotion'])
+        if analysis['face'] is None:
             return jsonify({'error': 'No face detected in image'}), 400
 
-        # Use largest face
-        largest_face = max(faces, key=lambda f: f['bbox'][2] * f['bbox'][3])
-        face_region = model_manager.detector.get_face_region(image, largest_face)
-
-        # Convert to RGB if needed (remove alpha channel)
-        if face_region.mode == 'RGBA':
-            # Create white background
-            background = Image.new('RGB', face_region.size, (255, 255, 255))
-            background.paste(face_region, mask=face_region.split()[-1])  # Use alpha as mask
-            face_region = background
-        elif face_region.mode != 'RGB':
-            face_region = face_region.convert('RGB')
-
-        # Detect emotion
-        emotion_result = model_manager.detect_emotion(face_region)
+        emotion_result = analysis['results']['emotion']
 
         return jsonify({
             'success': True,
@@ -1608,44 +1874,15 @@ def estimate_age_gender():
     - confidence scores for both estimates
     """
     try:
-        model_manager = get_model_manager()
-
-        # Get image
-        image = None
-        if 'image' in request.files:
-            file = request.files['image']
-            image = Image.open(io.BytesIO(file.read()))
-        elif request.is_json:
-            data = request.get_json()
-            filename = data.get('filename')
-            if filename:
-                filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
-                if os.path.exists(filepath):
-                    image = Image.open(filepath)
-
+        image = _load_request_image()
         if image is None:
             return jsonify({'error': 'No valid image provided'}), 400
 
-        # Detect face
-        faces = model_manager.detect_faces(image)
-        if not faces:
+        analysis = _analyze_request_image(image, ['age_gender'])
+        if analysis['face'] is None:
             return jsonify({'error': 'No face detected in image'}), 400
 
-        # Use largest face
-        largest_face = max(faces, key=lambda f: f['bbox'][2] * f['bbox'][3])
-        face_region = model_manager.detector.get_face_region(image, largest_face)
-
-        # Convert to RGB if needed (remove alpha channel)
-        if face_region.mode == 'RGBA':
-            # Create white background
-            background = Image.new('RGB', face_region.size, (255, 255, 255))
-            background.paste(face_region, mask=face_region.split()[-1])  # Use alpha as mask
-            face_region = background
-        elif face_region.mode != 'RGB':
-            face_region = face_region.convert('RGB')
-
-        # Estimate age and gender
-        age_gender_result = model_manager.estimate_age_gender(face_region)
+        age_gender_result = analysis['results']['age_gender']
 
         return jsonify({
             'success': True,
@@ -1676,49 +1913,26 @@ def detect_landmarks():
     - key_landmarks: dict of key facial features (optional)
     """
     try:
-        model_manager = get_model_manager()
-
-        # Get image
-        image = None
-        if 'image' in request.files:
-            file = request.files['image']
-            image = Image.open(io.BytesIO(file.read()))
-        elif request.is_json:
-            data = request.get_json()
-            filename = data.get('filename')
-            if filename:
-                filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
-                if os.path.exists(filepath):
-                    image = Image.open(filepath)
-
+        image = _load_request_image()
         if image is None:
             return jsonify({'error': 'No valid image provided'}), 400
 
-        # Detect face
-        faces = model_manager.detect_faces(image)
-        if not faces:
-            return jsonify({'error': 'No face detected in image'}), 400
-
-        # Use largest face
-        largest_face = max(faces, key=lambda f: f['bbox'][2] * f['bbox'][3])
-        face_region = model_manager.detector.get_face_region(image, largest_face)
-
         # Detect landmarks
         key_only = request.args.get('key_only', 'false').lower() == 'true'
+        analyzer = 'key_landmarks' if key_only else 'landmarks'
+
+        analysis = _analyze_request_image(image, [analyzer])
+        if analysis['face'] is None:
+            return jsonify({'error': 'No face detected in image'}), 400
 
         response = {
             'success': True,
             'face_detected': True
         }
 
-        if key_only:
-            key_landmarks = model_manager.get_key_landmarks(face_region)
-            response['key_landmarks'] = key_landmarks
-            response['landmark_count'] = len(key_landmarks)
-        else:
-            landmarks = model_manager.detect_landmarks(face_region)
-            response['landmarks'] = landmarks
-            response['landmark_count'] = len(landmarks)
+        landmarks = analysis['results'][analyzer]
+        response[analyzer] = landmarks
+        response['landmark_count'] = len(landmarks)
 
         return jsonify(response)
 
@@ -1744,42 +1958,26 @@ def get_sticker_fit():
     - confidence: placement confidence score
     """
     try:
-        model_manager = get_model_manager()
-
         # Get request data
-        data = request.get_json() or {}
+        data = request.get_json(silent=True) or {}
         sticker_type = data.get('sticker_type', 'hat')
         custom_position = data.get('custom_position')
 
-        # Get image
-        image = None
-        if 'image' in request.files:
-            file = request.files['image']
-            image = Image.open(io.BytesIO(file.read()))
-        elif 'filename' in data:
-            filename = data['filename']
-            filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
-            if os.path.exists(filepath):
-                image = Image.open(filepath)
-
+        image = _load_request_image(data)
         if image is None:
             return jsonify({'error': 'No valid image provided'}), 400
 
-        # Detect face
-        faces = model_manager.detect_faces(image)
-        if not faces:
+        # Detect face and facial landmarks in one pass
+        analysis = _analyze_request_image(image, ['key_landmarks'])
+        if analysis['face'] is None:
             return jsonify({'error': 'No face detected in image'}), 400
 
-        # Use largest face
-        largest_face = max(faces, key=lambda f: f['bbox'][2] * f['bbox'][3])
-        face_region = model_manager.detector.get_face_region(image, largest_face)
-
-        # Get facial landmarks
-        key_landmarks = model_manager.get_key_landmarks(face_region)
+        largest_face = analysis['face']
+        key_landmarks = analysis['results']['key_landmarks']
 
         if not key_landmarks:
             # Fallback to bbox-based positioning if landmarks fail
-            return _calculate_fallback_position(image, largest_face, sticker_type)
+            return _calculate_fallback_position(analysis['image'], largest_face, sticker_type)
 
         # Calculate position based on sticker type and landmarks
         position = _calculate_sticker_position(key_landmarks, sticker_type, largest_face, custom_position)
@@ -1813,30 +2011,18 @@ def get_personalized_suggestions():
     try:
         from models.suggestion_engine import get_suggestion_engine
 
-        model_manager = get_model_manager()
         suggestion_engine = get_suggestion_engine()
 
-        # Get image
-        image = None
-        if 'image' in request.files:
-            file = request.files['image']
-            image = Image.open(io.BytesIO(file.read()))
-        elif request.is_json:
-            data = request.get_json()
-            filename = data.get('filename')
-            if filename:
-                filepath = os.path.join(current_app.config['PROCESSED_FOLDER'], filename)
-                if os.path.exists(filepath):
-                    image = Image.open(filepath)
-
+        image = _load_request_image()
         if image is None:
             return jsonify({'error': 'No valid image provided'}), 400
 
-        # Get comprehensive analysis
-        analysis = suggestion_engine.get_personalized_suggestions(image)
+        # Detect faces and emotion once, then reuse them for the suggestions
+        face_analysis = _analyze_request_image(image, ['emotion'])
+        analysis = suggestion_engine.get_personalized_suggestions(face_analysis['image'], face_analysis)
 
         # Add face detection info
-        faces = model_manager.detect_faces(image)
+        faces = face_analysis['faces']
         analysis['face_count'] = len(faces)
 
         if faces:
@@ -1853,9 +2039,15 @@ def get_personalized_suggestions():
 
 @api_bp.route('/model-status', methods=['GET'])
 def get_model_status():
-    """Get status of loaded models and system health"""
+    """
+    Get status of loaded models and system health
+
+    Query params:
+    - benchmark: 'true' to time the TensorFlow and ONNX embedding backends
+    - runs: timed inferences per backend for the benchmark (default 20)
+    """
     try:
-        model_manager = get_model_manager()
+        model_manager = get_model_manager(current_app.config)
         status = {
             'face_detector': 'loaded',
             'embedding_model': 'not_loaded',  # Will be loaded lazily
@@ -1885,7 +2077,7 @@ def get_model_status():
         try:
             from models.embedding_index import get_embedding_index
             index = get_embedding_index()
-            if index.index:
+            if index.loaded:
                 status['embedding_index'] = {
                     'users': index.get_user_count(),
                     'embeddings': index.get_embedding_count(),
@@ -1896,6 +2088,20 @@ def get_model_status():
         except Exception:
             status['embedding_index'] = {'loaded': False, 'error': 'Index not available'}
 
+        # Embedding backend and latency (p50/p95 per face, TF vs ONNX)
+        try:
+            if model_manager._embedding_model is not None:
+                status['embedding_backend'] = model_manager.select_embedding_backend()
+            latency = {'live': model_manager.embedding_latency.summary()}
+            if request.args.get('benchmark', 'false').lower() == 'true':
+                runs = request.args.get('runs', 20, type=int)
+                latency['benchmark'] = model_manager.benchmark_embedding_backends(runs=min(max(runs, 1), 200))
+            elif model_manager.last_benchmark is not None:
+                latency['benchmark'] = model_manager.last_benchmark
+            status['embedding_latency'] = latency
+        except Exception as e:
+            status['embedding_latency'] = {'error': str(e)}
+
         return jsonify({
             'success': True,
             'status': status,
@@ -2028,11 +2234,11 @@ def _calculate_fallback_position(image, face_bbox, sticker_type):
     """
     x, y, w, h = face_bbox['bbox']
 
-    # Use existing logic from face_detector
+    # Use existing logic from face_detector, on the face we already detected
     from models.face_detector import get_detector
     detector = get_detector()
 
-    positions = detector.get_face_positions_for_stickers(image, sticker_type)
+    positions = detector.get_face_positions_for_stickers(image, sticker_type, faces=[face_bbox])
 
     if positions:
         pos = positions[0]  # Use first face
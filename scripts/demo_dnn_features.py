@@ -105,7 +105,7 @@ def demo_face_analysis(image_path):
 
         # Test recognition (if index exists)
         index = get_embedding_index()
-        if index.index is not None:
+        if index.loaded:
             search_results = index.search(embedding, top_k=3)
             print(f"   Recognition search returned {len(search_results)} candidates")
             for user_id, distance in search_results[:2]:
@@ -7,11 +7,13 @@ Usage:
     python manage_embeddings.py export-onnx
     python manage_embeddings.py stats
     python manage_embeddings.py cleanup
+    python manage_embeddings.py reembed --crops-dir <dir> [--batch-size 64] [--replace]
 """
 
 import sys
 import os
 import argparse
+from PIL import Image
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -19,11 +21,12 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.model_manager import get_model_manager
 from models.embedding_index import get_embedding_index
 from models.database import db, User, FaceEmbedding
+from models.embeddings import serialize_embedding, deserialize_embedding
 from app import create_app
 
 
 def rebuild_index():
-    """Rebuild the Annoy index from database embeddings"""
+    """Rebuild the embedding index from database embeddings"""
     print("Rebuilding embedding index...")
 
     app = create_app()
@@ -37,12 +40,12 @@ def rebuild_index():
         for record in embedding_records:
             embeddings_data.append({
                 'user_id': record.user_id,
-                'embedding_vector': record.embedding_vector
+                'embedding_vector': deserialize_embedding(record.embedding_vector)
             })
 
-        # Rebuild index
+        # Rebuild index (replaces the files shared by all workers)
         index = get_embedding_index()
-        index.load_or_create_index(embeddings_data)
+        index.rebuild(embeddings_data)
 
         print(f"Index rebuilt with {len(embeddings_data)} embeddings")
 
@@ -60,6 +63,7 @@ def export_onnx():
         print("Testing ONNX model...")
         model_manager.embedding_model.load_onnx_model(onnx_path)
         print("ONNX model loaded successfully")
+        print("The app will now use the ONNX backend automatically (EMBEDDING_BACKEND=auto)")
 
     except Exception as e:
         print(f"Failed to export ONNX model: {e}")
@@ -76,7 +80,7 @@ def show_stats():
 
         # Load index to get stats
         try:
-            if index.index is None:
+            if not index.loaded:
                 print("Index not loaded - run rebuild-index first")
                 return
 
@@ -119,10 +123,108 @@ def cleanup():
         rebuild_index()
 
 
+CROP_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def _iter_crop_files(crops_dir):
+    """Yield (user_label, path) for every crop under <crops_dir>/<user_label>/"""
+    for user_label in sorted(os.listdir(crops_dir)):
+        user_dir = os.path.join(crops_dir, user_label)
+        if not os.path.isdir(user_dir):
+            continue
+        for fname in sorted(os.listdir(user_dir)):
+            if fname.lower().endswith(CROP_EXTENSIONS):
+                yield user_label, os.path.join(user_dir, fname)
+
+
+def reembed(crops_dir, batch_size=None, replace=False):
+    """
+    Bulk (re-)embed stored face crops with batched FaceNet inference.
+
+    Crops are read from <crops_dir>/<user_label>/*.jpg. They are decoded one
+    chunk at a time so memory stays bounded, each chunk is embedded with a
+    single batched call, and the index is rebuilt once at the end.
+    """
+    if not os.path.isdir(crops_dir):
+        print(f"Crops directory not found: {crops_dir}")
+        sys.exit(1)
+
+    app = create_app()
+    with app.app_context():
+        model_manager = get_model_manager(app.config)
+        batch_size = batch_size or model_manager.embedding_batch_size
+        # Decode a few batches at a time: enough to keep the model busy
+        chunk_size = batch_size * 4
+
+        crop_files = list(_iter_crop_files(crops_dir))
+        print(f"Found {len(crop_files)} crops in {crops_dir} (batch size {batch_size})")
+
+        users = {}
+        if replace:
+            labels = {label for label, _ in crop_files}
+            for user in User.query.filter(User.label.in_(labels)).all():
+                FaceEmbedding.query.filter_by(user_id=user.id).delete()
+            db.session.commit()
+
+        created = skipped = failed = 0
+        for start in range(0, len(crop_files), chunk_size):
+            chunk = crop_files[start:start + chunk_size]
+
+            faces, labels = [], []
+            for user_label, path in chunk:
+                try:
+                    with Image.open(path) as img:
+                        faces.append(img.convert('RGB'))
+                    labels.append(user_label)
+                except Exception as e:
+                    print(f"  Skipping unreadable crop {path}: {e}")
+                    failed += 1
+
+            if not faces:
+                continue
+
+            embeddings = model_manager.extract_embeddings(faces, batch_size=batch_size)
+
+            for user_label, face, embedding in zip(labels, faces, embeddings):
+                user = users.get(user_label)
+                if user is None:
+                    user = User.query.filter_by(label=user_label).first()
+                    if user is None:
+                        user = User(label=user_label)
+                        db.session.add(user)
+                        db.session.flush()  # Get user.id
+                    users[user_label] = user
+
+                image_hash = model_manager.compute_image_hash(face)
+                if FaceEmbedding.query.filter_by(user_id=user.id, image_hash=image_hash).first():
+                    skipped += 1
+                    continue
+
+                db.session.add(FaceEmbedding(
+                    user_id=user.id,
+                    embedding_vector=serialize_embedding(embedding),
+                    image_hash=image_hash
+                ))
+                created += 1
+
+            db.session.commit()
+            print(f"  Embedded {min(start + chunk_size, len(crop_files))}/{len(crop_files)} crops")
+
+        print(f"Created {created} embeddings, skipped {skipped} duplicates, {failed} failed")
+
+    # Rebuild once instead of once per embedding
+    rebuild_index()
+
+
 def main():
     parser = argparse.ArgumentParser(description='Manage face embeddings and models')
-    parser.add_argument('command', choices=['rebuild-index', 'export-onnx', 'stats', 'cleanup'],
+    parser.add_argument('command', choices=['rebuild-index', 'export-onnx', 'stats', 'cleanup', 'reembed'],
                        help='Command to execute')
+    parser.add_argument('--crops-dir', help='reembed: directory of <user_label>/<crop> face images')
+    parser.add_argument('--batch-size', type=int, default=None,
+                       help='reembed: faces per inference call (default: EMBEDDING_BATCH_SIZE)')
+    parser.add_argument('--replace', action='store_true',
+                       help="reembed: drop the users' existing embeddings first")
 
     args = parser.parse_args()
 
@@ -134,6 +236,10 @@ def main():
         show_stats()
     elif args.command == 'cleanup':
         cleanup()
+    elif args.command == 'reembed':
+        if not args.crops_dir:
+            parser.error('reembed requires --crops-dir')
+        reembed(args.crops_dir, batch_size=args.batch_size, replace=args.replace)
 
 
 if __name__ == '__main__':
@@ -3,43 +3,21 @@ Script xoa nen translucence khoi tat ca sticker PNG.
 Su dung rembg va Pillow de xu ly.
 """
 from PIL import Image
-import rembg
-import io
 from pathlib import Path
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.background_removal import remove_background_rembg
 
 # Duong dan thu muc stickers
 STICKERS_DIR = Path("static/templates/stickers")
 
 def remove_background(image):
-    """Xoa nen su dung rembg voi post-processing."""
-    buffer = io.BytesIO()
-    image.save(buffer, format='PNG')
-    input_bytes = buffer.getvalue()
-    
-    # Su dung rembg
-    output_bytes = rembg.remove(input_bytes)
-    result = Image.open(io.BytesIO(output_bytes))
-    
-    # Dam bao RGBA
-    if result.mode != 'RGBA':
-        result = result.convert('RGBA')
-    
-    # Post-processing: loai bo nen mo con sot lai
-    result = clean_alpha_channel(result, alpha_threshold=10)
-    
-    return result
-
-def clean_alpha_channel(image, alpha_threshold=10):
-    """Loai bo pixel co alpha thap."""
-    import numpy as np
-    if image.mode != 'RGBA':
-        return image
-    
-    arr = np.array(image)
-    alpha = arr[:, :, 3]
-    mask = alpha < alpha_threshold
-    arr[:, :, 3] = np.where(mask, 0, alpha)
-    return Image.fromarray(arr, mode='RGBA')
+    """Xoa nen su dung rembg voi post-processing (loai bo nen mo con sot lai)."""
+    return remove_background_rembg(image, alpha_threshold=10)
 
 def process_all_stickers():
     """Xu ly tat ca 31 stickers."""
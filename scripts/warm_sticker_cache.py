@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Preprocess (background-remove) the numbered stickers ahead of time so the first
+anchor-mode collage requests do not pay for it.
+
+Usage:
+    python scripts/warm_sticker_cache.py
+    python scripts/warm_sticker_cache.py --stickers-dir static/templates/stickers --count 31
+"""
+import argparse
+import os
+import sys
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.sticker_cache import get_sticker_cache, DEFAULT_CACHE_DIR
+
+
+def warm_stickers(stickers_dir, count, cache_dir):
+    """Process stickers 1..count into the processed sticker cache"""
+    cache = get_sticker_cache(cache_dir)
+    print(f"Stickers: {stickers_dir}")
+    print(f"Cache:    {cache.cache_dir}")
+    print("-" * 50)
+
+    processed = cached = failed = 0
+    for i in range(1, count + 1):
+        src_path = os.path.join(stickers_dir, f"{i}.png")
+        if not os.path.exists(src_path):
+            print(f"Skip {i}.png (not found)")
+            continue
+
+        try:
+            already = os.path.exists(cache.processed_path(src_path))
+            start = time.perf_counter()
+            path = cache.ensure_processed(src_path)
+            elapsed = (time.perf_counter() - start) * 1000
+            if already:
+                cached += 1
+                print(f"OK   {i}.png (cached) -> {os.path.basename(path)}")
+            else:
+                processed += 1
+                print(f"OK   {i}.png ({elapsed:.0f} ms) -> {os.path.basename(path)}")
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {i}.png: {e}")
+
+    print("-" * 50)
+    print(f"Processed: {processed}, already cached: {cached}, failed: {failed}")
+    return failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm the processed sticker cache')
+    parser.add_argument('--stickers-dir', default=os.path.join('static', 'templates', 'stickers'),
+                        help='directory with the numbered stickers (1.png ... N.png)')
+    parser.add_argument('--count', type=int, default=31, help='number of stickers (default 31)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='processed sticker directory')
+    args = parser.parse_args()
+
+    ok = warm_stickers(args.stickers_dir, args.count, args.cache_dir)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -317,33 +317,26 @@ class PhotoCapture {
             this.flashEffect.style.display = 'none';
         }, 300);
 
-        // Convert to base64 and send to backend
-        const imageData = this.canvas.toDataURL('image/jpeg', 0.9);
-        this.sendPhotoToBackend(imageData);
+        // Encode as JPEG and send the binary blob to the backend
+        this.canvas.toBlob((blob) => {
+            if (!blob) {
+                this.showError('Failed to encode photo');
+                return;
+            }
+            this.sendPhotoToBackend(blob);
+        }, 'image/jpeg', 0.9);
     }
 
-    async sendPhotoToBackend(imageData) {
+    async sendPhotoToBackend(blob) {
         this.showLoading('Saving photo...');
 
         try {
-            // Convert base64 to blob
-            const base64Data = imageData.split(',')[1];
-            const byteCharacters = atob(base64Data);
-            const byteNumbers = new Array(byteCharacters.length);
-            for (let i = 0; i < byteCharacters.length; i++) {
-                byteNumbers[i] = byteCharacters.charCodeAt(i);
-            }
-            const byteArray = new Uint8Array(byteNumbers);
-            const blob = new Blob([byteArray], { type: 'image/jpeg' });
-
-            const formData = new FormData();
-            formData.append('image', blob, 'photo.jpg');
-            formData.append('session_id', this.sessionId);
-            formData.append('photo_number', this.currentPhoto);
-
-            const response = await fetch('/api/capture', {
+            // Raw JPEG body: streamed to disk by the server, no base64 or multipart
+            const url = `/api/sessions/${encodeURIComponent(this.sessionId)}/capture/${this.currentPhoto}`;
+            const response = await fetch(url, {
                 method: 'POST',
-                body: formData
+                headers: { 'Content-Type': 'image/jpeg' },
+                body: blob
             });
 
             if (!response.ok) {
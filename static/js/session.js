@@ -1,3 +1,14 @@
+// Width of photo card images (must be one of IMAGE_DERIVATIVE_SIZES on the server)
+const CARD_IMAGE_WIDTH = 640;
+
+/**
+ * Add a resize width (?w=) to an /api/images URL
+ */
+function sizedImageUrl(url, width) {
+    if (!url || !url.startsWith('/api/images/')) return url;
+    return url + (url.includes('?') ? '&' : '?') + 'w=' + width;
+}
+
 class FilterSelectionPage {
     constructor() {
         this.sessionId = typeof SESSION_ID !== 'undefined' ? SESSION_ID : null;
@@ -147,11 +158,13 @@ class FilterSelectionPage {
             }
             card.style.setProperty('--comparison-percent', `${this.comparePercent}%`);
 
-            const filteredUrl = photo.processed_url || photo.original_url;
+            // Cards are small: request a resized variant instead of the full JPEG
+            const originalUrl = sizedImageUrl(photo.original_url, CARD_IMAGE_WIDTH);
+            const filteredUrl = sizedImageUrl(photo.processed_url || photo.original_url, CARD_IMAGE_WIDTH);
 
             card.innerHTML = `
                 <div class="photo-layer photo-original">
-                    <img src="${photo.original_url}" alt="Original photo ${photo.photo_number}">
+                    <img src="${originalUrl}" alt="Original photo ${photo.photo_number}">
                 </div>
                 <div class="photo-filtered">
                     <img src="${filteredUrl}" alt="Filtered photo ${photo.photo_number}">
@@ -919,13 +932,13 @@ function updateEffectThumbnails(processedImages) {
         // Try to update any thumbnail elements
         const thumbElements = document.querySelectorAll(`[data-photo-number="${img.photo_number}"] img`);
         thumbElements.forEach(el => {
-            el.src = img.thumbnail_url + '?t=' + Date.now(); // Cache bust
+            el.src = img.thumbnail_url; // URL is pinned to the new content (?v=)
         });
 
         // Also update processed URL elements
         const processedElements = document.querySelectorAll(`[data-photo-id="${img.photo_id}"] img`);
         processedElements.forEach(el => {
-            el.src = img.processed_url + '?t=' + Date.now();
+            el.src = img.processed_url;
         });
     });
 }
@@ -596,7 +596,8 @@ async function initCollageUI(sessionId) {
                     const now = new Date();
                     const dateStr = now.toISOString().slice(0, 10).replace(/-/g, '');
                     const timeStr = now.toTimeString().slice(0, 8).replace(/:/g, '');
-                    const fname = `photobooth_${selectedTemplate}_${dateStr}_${timeStr}.png`;
+                    const ext = (data.stats && data.stats.extension) || 'png';
+                    const fname = `photobooth_${selectedTemplate}_${dateStr}_${timeStr}.${ext}`;
                     a.download = fname;
 
                     document.body.appendChild(a);
@@ -0,0 +1,49 @@
+import numpy as np
+from PIL import Image
+
+from models import background_removal as br
+
+
+def _checkered(size=64, square=8):
+    arr = np.full((size, size, 4), 255, dtype=np.uint8)
+    yy, xx = np.mgrid[0:size, 0:size]
+    gray = np.where(((xx // square) + (yy // square)) % 2 == 0, 200, 140).astype(np.uint8)
+    arr[..., :3] = gray[..., None]
+    return arr
+
+
+def test_flood_fill_removes_only_regions_connected_to_corners():
+    arr = _checkered()
+    # Red object with a gray "hole" inside that is not connected to the border
+    arr[16:48, 16:48, :3] = (220, 30, 30)
+    arr[28:36, 28:36, :3] = 200
+    result = np.array(br.flood_fill_background(Image.fromarray(arr)))
+
+    assert result[0, 0, 3] == 0
+    assert result[63, 63, 3] == 0
+    assert result[20, 20, 3] == 255
+    assert result[30, 30, 3] == 255
+
+
+def test_remove_background_pillow_rules():
+    arr = np.array([[
+        [255, 255, 255, 255],  # white -> background
+        [180, 140, 100, 255],  # brown -> background
+        [10, 10, 10, 150],     # dark, semi transparent -> background
+        [10, 10, 10, 255],     # dark, opaque -> kept
+        [30, 90, 200, 255],    # blue -> kept
+    ]], dtype=np.uint8)
+    result = np.array(br.remove_background_pillow(Image.fromarray(arr, mode='RGBA')))
+
+    assert result[0, :3].tolist() == [[0, 0, 0, 0]] * 3
+    assert result[0, 3].tolist() == [10, 10, 10, 255]
+    assert result[0, 4].tolist() == [30, 90, 200, 255]
+
+
+def test_detect_and_remove_checkered_background():
+    image = Image.fromarray(_checkered())
+    assert br.detect_checkered_pattern(image)
+    assert not br.detect_checkered_pattern(Image.new('RGBA', (64, 64), (30, 90, 200, 255)))
+
+    result = np.array(br.remove_sticker_background(image))
+    assert (result[..., 3] == 0).all()
@@ -0,0 +1,153 @@
+import io
+import json
+import os
+
+from PIL import Image
+
+from models.capture_pipeline import CapturePipeline, DEFAULT_SLOT_SIZE
+
+
+def _jpeg_bytes(size=(640, 480)):
+    image = Image.new("RGB", size, (0, 0, 0))
+    image.paste((255, 0, 0), (0, 0, size[0] // 2, size[1]))  # red left half
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def _pipeline(tmp_path, catalog=None):
+    catalog_path = tmp_path / "templates.json"
+    if catalog is not None:
+        catalog_path.write_text(json.dumps(catalog))
+    return CapturePipeline(str(tmp_path / "originals"), str(tmp_path / "processed"),
+                           str(tmp_path / "thumbnails"), catalog_path=str(catalog_path))
+
+
+def test_capture_writes_all_derivatives_with_timings(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    result = pipeline.process(_jpeg_bytes(), "shot_1.jpg", flip=True)
+
+    assert result["size"] == (640, 480)
+    with Image.open(result["original_path"]) as original:
+        assert original.getpixel((10, 240))[0] > 200      # red stays left
+    with Image.open(result["processed_path"]) as processed:
+        assert processed.getpixel((630, 240))[0] > 200    # mirrored
+    with Image.open(result["thumbnail_path"]) as thumb:
+        assert max(thumb.size) == 200
+    with Image.open(os.path.join(tmp_path, "processed", result["slot_filename"])) as slot:
+        assert slot.size == DEFAULT_SLOT_SIZE
+
+    for stage in ("persist", "decode", "flip", "save_processed", "thumbnail", "slot", "total_ms"):
+        assert stage in result["timings"]
+
+
+def test_slot_size_follows_catalog_changes(tmp_path):
+    entry = {"size": [640, 1850], "photo_size": [300, 200], "positions": [[0, 0]]}
+    pipeline = _pipeline(tmp_path, {"a": entry})
+    assert pipeline.slot_size() == (300, 200)
+    assert pipeline.slot_size() == (300, 200)
+
+    catalog_path = tmp_path / "templates.json"
+    catalog_path.write_text(json.dumps({"a": entry, "b": dict(entry, photo_size=[400, 100])}))
+    os.utime(catalog_path, ns=(0, os.stat(catalog_path).st_mtime_ns + 1_000_000))
+    assert pipeline.slot_size() == (400, 200)
+
+
+def test_upload_persisted_verbatim_and_derivatives_generated_in_background(tmp_path):
+    import threading
+
+    pipeline = _pipeline(tmp_path)
+    data = _jpeg_bytes()
+    pipeline.persist(data, "shot_2.jpg")
+    with open(tmp_path / "originals" / "shot_2.jpg", "rb") as f:
+        assert f.read() == data
+
+    # Hold the worker so the job is observably pending
+    gate = threading.Event()
+    generate = pipeline._generate
+    pipeline._generate = lambda *args: (gate.wait(5), generate(*args))[1]
+    future = pipeline.submit("shot_2.jpg")
+    assert pipeline.status("shot_2_slot.jpg") == {"status": "pending"}
+    assert pipeline.wait("shot_2.jpg", timeout=0.01) is False
+
+    gate.set()
+    assert pipeline.wait("shot_2_slot.jpg", timeout=5) is True
+    future.result(timeout=5)
+    assert os.path.exists(tmp_path / "processed" / "shot_2_slot.jpg")
+    assert os.path.exists(tmp_path / "thumbnails" / "shot_2.jpg")
+    status = pipeline.status("shot_2.jpg")
+    assert status["status"] == "done" and "decode" in status["timings"]
+    assert pipeline.status("unknown.jpg") is None
+
+
+def test_validate_rejects_bad_uploads_from_header(tmp_path):
+    import pytest
+    from models.capture_pipeline import InvalidImageError
+
+    pipeline = _pipeline(tmp_path)
+    pipeline.max_pixels = 100_000
+    assert pipeline.validate(_jpeg_bytes((320, 240))) == ("JPEG", (320, 240))
+    with pytest.raises(InvalidImageError):
+        pipeline.validate(b"not an image")
+    with pytest.raises(InvalidImageError):
+        pipeline.persist(_jpeg_bytes((640, 480)), "big.jpg")  # 307200 pixels
+    assert not os.path.exists(tmp_path / "originals" / "big.jpg")
+
+
+def test_flip_falls_back_to_reencode_without_jpegtran(tmp_path):
+    pipeline = _pipeline(tmp_path)
+    pipeline.jpegtran = None
+    result = pipeline.process(_jpeg_bytes(), "shot_3.jpg", flip=True)
+    assert result["lossless_flip"] is False
+    assert "save_processed" in result["timings"]
+
+    # A failing transform also falls back
+    pipeline.jpegtran = str(tmp_path / "missing-jpegtran")
+    result = pipeline.process(_jpeg_bytes(), "shot_4.jpg", flip=True)
+    assert result["lossless_flip"] is False
+    with Image.open(result["processed_path"]) as processed:
+        assert processed.getpixel((630, 240))[0] > 200
+
+
+def test_persist_stream_copies_body_in_chunks(tmp_path):
+    import pytest
+    from models.capture_pipeline import InvalidImageError
+
+    pipeline = _pipeline(tmp_path)
+    data = _jpeg_bytes()
+    timings = {}
+    path = pipeline.persist_stream(io.BytesIO(data), "raw_1.jpg", timings, chunk_size=1024)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert "persist" in timings
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(buffer, "PNG")
+    with pytest.raises(InvalidImageError):
+        pipeline.persist_stream(io.BytesIO(buffer.getvalue()), "raw_2.jpg")
+    with pytest.raises(InvalidImageError):
+        pipeline.persist_stream(io.BytesIO(data[:200]), "raw_3.jpg")  # truncated header
+    assert sorted(os.listdir(tmp_path / "originals")) == ["raw_1.jpg"]
+
+
+def test_wait_and_status_for_capture_submitted_by_another_worker(tmp_path):
+    import threading
+
+    worker_a = _pipeline(tmp_path)
+    worker_b = _pipeline(tmp_path)   # same folders, no shared futures
+    worker_a.persist(_jpeg_bytes(), "shot_3.jpg")
+
+    # Original persisted, derivatives not written yet
+    assert worker_b.status("shot_3.jpg") == {"status": "pending"}
+    assert worker_b.wait("shot_3_slot.jpg", timeout=0.05, poll_interval=0.01) is False
+
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(worker_b.wait("shot_3.jpg", timeout=5)))
+    waiter.start()
+    worker_a.submit("shot_3.jpg").result(timeout=5)
+    waiter.join(5)
+
+    assert waited == [True]
+    assert worker_b.status("shot_3.jpg") == {"status": "done"}
+    assert worker_b.wait("unknown.jpg", timeout=0) is True
+    assert worker_b.status("unknown.jpg") is None
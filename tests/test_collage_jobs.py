@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from models.collage_jobs import CollageJobQueue, DONE, FAILED
+from utils.async_worker import QueueFullError
+
+
+def _wait(queue, job_id, timeout=5):
+    import time
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in (DONE, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('job did not finish')
+
+
+def test_identical_in_flight_jobs_are_deduplicated():
+    queue = CollageJobQueue(max_workers=1, max_queue=2)
+    release = threading.Event()
+    calls = []
+
+    def render():
+        calls.append(1)
+        release.wait(5)
+        return {'path': '/tmp/collage.png'}
+
+    first, deduped_first = queue.submit('key-a', render)
+    second, deduped_second = queue.submit('key-a', render)
+    assert not deduped_first and deduped_second
+    assert second['id'] == first['id']
+
+    release.set()
+    job = _wait(queue, first['id'])
+    assert job['status'] == DONE and job['result']['path'] == '/tmp/collage.png'
+    assert len(calls) == 1
+
+    # Once finished, the same key renders again (the engine reuses the file)
+    third, deduped_third = queue.submit('key-a', lambda: {'path': '/tmp/collage.png'})
+    assert not deduped_third and third['id'] != first['id']
+
+
+def test_full_queue_applies_backpressure():
+    queue = CollageJobQueue(max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    queue.submit('running', lambda: release.wait(5))
+    queue.submit('queued', lambda: None)
+    with pytest.raises(QueueFullError):
+        queue.submit('rejected', lambda: None)
+
+    release.set()
+
+
+def test_failed_job_reports_error():
+    queue = CollageJobQueue(max_workers=1, max_queue=1)
+
+    def render():
+        raise ValueError("Template 'x' not found")
+
+    job, _ = queue.submit('bad', render)
+    job = _wait(queue, job['id'])
+    assert job['status'] == FAILED
+    assert 'not found' in job['error']
+
+
+def test_job_records_shared_between_workers(tmp_path):
+    """A status request served by another worker process reads the shared record"""
+    import os
+    import time
+
+    records = str(tmp_path / "jobs")
+    worker_a = CollageJobQueue(max_workers=1, max_queue=1, records_dir=records)
+    worker_b = CollageJobQueue(max_workers=1, max_queue=1, records_dir=records)
+
+    job, _ = worker_a.submit('key', lambda: {'path': '/tmp/collage.png', 'bytes': 10})
+    _wait(worker_a, job['id'])
+
+    seen = worker_b.get(job['id'])
+    assert seen['status'] == DONE and seen['result']['path'] == '/tmp/collage.png'
+    assert worker_b.get('unknown') is None and worker_b.get('../etc') is None
+
+    # Expired records are hidden, then removed by the next prune
+    worker_b.job_ttl_seconds = 0
+    time.sleep(0.01)
+    assert worker_b.get(job['id']) is None
+    worker_b.submit('other', lambda: None)
+    assert f"{job['id']}.json" not in os.listdir(records)
@@ -0,0 +1,174 @@
+import os
+import numpy as np
+import pytest
+
+from models.embedding_index import EmbeddingIndex
+
+
+def _unit(vec):
+    vec = np.asarray(vec, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def _make_index(tmp_path, dim=8):
+    index = EmbeddingIndex(embedding_dim=dim, index_path=str(tmp_path / "test.ann"))
+    index.load_or_create_index()
+    return index
+
+
+def test_search_deduplicates_users(tmp_path):
+    """A user with many embeddings should not crowd others out of top-k"""
+    rng = np.random.RandomState(0)
+    index = _make_index(tmp_path)
+
+    base_a = _unit(rng.randn(8))
+    base_b = _unit(base_a + 0.3 * rng.randn(8))
+    for _ in range(6):
+        index.add_embedding(1, _unit(base_a + 0.01 * rng.randn(8)))
+    index.add_embedding(2, base_b)
+
+    results = index.search(base_a, top_k=2)
+    user_ids = [user_id for user_id, _ in results]
+
+    assert user_ids == [1, 2]
+    assert results[0][1] < results[1][1]
+
+
+def test_search_returns_angular_distance(tmp_path):
+    index = _make_index(tmp_path)
+    vec = _unit(np.arange(1, 9))
+    index.add_embedding(7, vec)
+
+    (user_id, distance), = index.search(vec, top_k=1)
+    assert user_id == 7
+    assert distance == pytest.approx(0.0, abs=1e-3)
+
+    (_, opposite), = index.search(-vec, top_k=1)
+    assert opposite == pytest.approx(2.0, abs=1e-3)
+
+
+def test_remove_user_updates_centroids(tmp_path):
+    index = _make_index(tmp_path)
+    index.add_embedding(1, _unit([1, 0, 0, 0, 0, 0, 0, 0]))
+    index.add_embedding(2, _unit([0, 1, 0, 0, 0, 0, 0, 0]))
+
+    index.remove_user(1)
+
+    assert len(index.centroids) == 1
+    results = index.search(_unit([1, 0, 0, 0, 0, 0, 0, 0]), top_k=5)
+    assert [user_id for user_id, _ in results] == [2]
+
+
+def test_index_reload_restores_centroids(tmp_path):
+    index = _make_index(tmp_path)
+    index.add_embedding(3, _unit([1, 1, 0, 0, 0, 0, 0, 0]))
+    index.add_embedding(4, _unit([0, 0, 1, 1, 0, 0, 0, 0]))
+    assert os.path.exists(index.vectors_path)
+
+    reloaded = EmbeddingIndex(embedding_dim=8, index_path=index.index_path)
+    reloaded.load_or_create_index()
+
+    assert reloaded.get_user_count() == 2
+    assert reloaded.get_embedding_count() == 2
+    assert reloaded.search(_unit([0, 0, 1, 1, 0, 0, 0, 0]), top_k=1)[0][0] == 4
+
+
+def test_workers_share_index_files(tmp_path):
+    """An enrollment in one worker is visible to another after a generation bump"""
+    writer = _make_index(tmp_path)
+    reader = EmbeddingIndex(embedding_dim=8, index_path=writer.index_path)
+
+    writer.add_embedding(1, _unit([1, 0, 0, 0, 0, 0, 0, 0]))
+    reader.load_or_create_index()
+    assert isinstance(reader.vectors, np.memmap)
+    generation = reader.generation
+
+    writer.add_embedding(2, _unit([0, 1, 0, 0, 0, 0, 0, 0]))
+
+    results = reader.search(_unit([0, 1, 0, 0, 0, 0, 0, 0]), top_k=1)
+    assert reader.generation > generation
+    assert results[0][0] == 2
+
+    # Writes from the second worker are merged with the first worker's
+    reader.add_embedding(3, _unit([0, 0, 1, 0, 0, 0, 0, 0]))
+    assert writer.get_user_count() == 3
+
+
+def test_enrollment_writes_no_ann_file(tmp_path):
+    index = _make_index(tmp_path)
+    index.add_embedding(1, _unit([1, 0, 0, 0, 0, 0, 0, 0]))
+
+    assert index.loaded
+    assert not os.path.exists(index.index_path)
+    assert os.path.exists(index.vectors_path) and os.path.exists(index.mapping_path)
+
+
+def test_rebuild_compacts_removed_rows(tmp_path):
+    index = _make_index(tmp_path)
+    for user_id in (1, 2, 1, 3):
+        index.add_embedding(user_id, _unit(np.eye(8)[user_id]))
+    index.remove_user(1)
+    assert len(index.vectors) == 4 and index.get_embedding_count() == 2
+
+    index.rebuild()
+
+    assert len(index.vectors) == 2
+    assert sorted(index.id_to_user_id) == [0, 1]
+    assert np.load(index.vectors_path).shape == (2, 8)
+    assert index.search(_unit(np.eye(8)[3]), top_k=1)[0][0] == 3
+    assert index.search(_unit(np.eye(8)[1]), top_k=5)[0][0] != 1
+
+
+def test_legacy_annoy_index_recovered(tmp_path):
+    annoy = pytest.importorskip("annoy")
+    import json
+
+    path = str(tmp_path / "legacy.ann")
+    legacy = annoy.AnnoyIndex(8, "angular")
+    legacy.add_item(0, np.eye(8)[2] * 3)
+    legacy.build(2)
+    legacy.save(path)
+    with open(path + ".mapping", "w") as f:
+        json.dump({"id_to_user_id": {"0": 9}, "user_id_to_ids": {"9": [0]}}, f)
+
+    index = EmbeddingIndex(embedding_dim=8, index_path=path)
+    index.load_or_create_index()
+    assert index.search(_unit(np.eye(8)[2]), top_k=1)[0][0] == 9
+
+
+def test_search_is_consistent_during_concurrent_writes(tmp_path):
+    """Searches racing refreshes and enrollments always see one whole generation"""
+    import threading
+
+    rng = np.random.RandomState(1)
+    writer = _make_index(tmp_path)
+    reader = EmbeddingIndex(embedding_dim=8, index_path=writer.index_path)
+    writer.add_embedding(0, _unit(rng.randn(8)))
+    reader.load_or_create_index()
+
+    errors = []
+    done = threading.Event()
+
+    def search_loop():
+        while not done.is_set():
+            try:
+                for user_id, distance in reader.search(_unit(rng.randn(8)), top_k=3):
+                    assert 0 <= user_id < 100 and 0.0 <= distance <= 2.0 + 1e-6
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=search_loop) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for user_id in range(1, 40):
+        (writer if user_id % 2 else reader).add_embedding(user_id % 7, _unit(rng.randn(8)))
+        if user_id % 10 == 0:
+            writer.remove_user(3)
+    done.set()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    state = reader._state
+    assert all(row_id < len(state.vectors) for row_id in state.id_to_user_id)
@@ -0,0 +1,105 @@
+"""
+Test FaceAnalysisPipeline
+Kiểm tra pipeline chỉ detect/crop một lần cho nhiều analyzer
+"""
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.face_analysis import FaceAnalysisPipeline
+
+
+class _FakeDetector:
+    def get_face_region(self, image, face):
+        x, y, w, h = face['bbox']
+        return image.crop((x, y, x + w, y + h))
+
+
+class _FakeModelManager:
+    """Counts model calls instead of running real models"""
+
+    def __init__(self, faces):
+        self.faces = faces
+        self.detector = _FakeDetector()
+        self.calls = []
+
+    def detect_faces(self, image, confidence_threshold=0.5):
+        self.calls.append(('detect', image.mode))
+        return self.faces
+
+    def detect_emotion(self, face_region):
+        self.calls.append(('emotion', face_region.size))
+        return {'emotions': {'happy': 1.0}, 'dominant': 'happy', 'confidence': 1.0}
+
+    def estimate_age_gender(self, face_region):
+        raise RuntimeError('model not loaded')
+
+    def detect_landmarks(self, face_region):
+        self.calls.append(('landmarks', face_region.size))
+        return [(float(i), float(i)) for i in range(468)]
+
+    def extract_embedding(self, face_region):
+        self.calls.append(('embedding', face_region.size))
+        return [0.0] * 128
+
+
+FACES = [
+    {'bbox': (0, 0, 10, 10), 'confidence': 0.9},
+    {'bbox': (20, 20, 40, 30), 'confidence': 0.8},
+]
+
+
+def test_analyze_detects_once_and_uses_largest_face():
+    manager = _FakeModelManager(FACES)
+    image = Image.new('RGBA', (100, 100), (0, 0, 0, 0))
+
+    analysis = FaceAnalysisPipeline(manager).analyze(image, ['emotion', 'embedding', 'key_landmarks'])
+
+    assert [name for name, _ in manager.calls].count('detect') == 1
+    assert ('detect', 'RGB') in manager.calls
+    assert analysis['face'] == FACES[1]
+    assert analysis['face_region'].size == (40, 30)
+    assert set(analysis['results']) == {'emotion', 'embedding', 'key_landmarks'}
+    assert {'decode', 'detect', 'crop', 'emotion', 'embedding', 'landmarks'} <= set(analysis['timings'])
+
+
+def test_analyze_collects_analyzer_errors():
+    manager = _FakeModelManager(FACES)
+    analysis = FaceAnalysisPipeline(manager).analyze(Image.new('RGB', (100, 100)), ['age_gender', 'emotion'])
+
+    assert 'model not loaded' in analysis['errors']['age_gender']
+    assert analysis['results']['emotion']['dominant'] == 'happy'
+
+    with pytest.raises(RuntimeError):
+        FaceAnalysisPipeline(manager).analyze(Image.new('RGB', (100, 100)), ['age_gender'], raise_errors=True)
+
+
+def test_analyze_without_face_skips_analyzers():
+    manager = _FakeModelManager([])
+    analysis = FaceAnalysisPipeline(manager).analyze(Image.new('RGB', (50, 50)), ['emotion'])
+
+    assert analysis['face'] is None
+    assert analysis['results'] == {}
+    assert manager.calls == [('detect', 'RGB')]
+
+
+def test_parse_analyzers():
+    assert FaceAnalysisPipeline.parse_analyzers(None) == ['emotion', 'age_gender']
+    assert FaceAnalysisPipeline.parse_analyzers('emotion, landmarks,emotion') == ['emotion', 'landmarks']
+    with pytest.raises(ValueError):
+        FaceAnalysisPipeline.parse_analyzers(['smile'])
+
+
+def test_pipeline_singleton_shared_between_requests(monkeypatch):
+    import models.face_analysis as face_analysis
+    monkeypatch.setattr(face_analysis, '_pipeline', None)
+    manager = _FakeModelManager(FACES)
+
+    pipeline = face_analysis.get_face_analysis_pipeline(manager)
+
+    assert face_analysis.get_face_analysis_pipeline(manager) is pipeline
+    assert pipeline.model_manager is manager
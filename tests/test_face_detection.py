@@ -228,3 +228,39 @@ class TestSmartBeautyFilters:
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
 
+
+
+class _SlowNet:
+    """cv2.dnn.Net stand-in that records overlapping setInput/forward calls"""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+
+    def setInput(self, blob):
+        import time
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        time.sleep(0.005)
+
+    def forward(self):
+        self.active -= 1
+        return np.zeros((1, 1, 1, 7), dtype=np.float32)
+
+
+def test_forward_pass_serialized_across_threads():
+    """Request threads and capture workers share one net: forward passes must not interleave"""
+    from concurrent.futures import ThreadPoolExecutor
+    from models.face_detector import FaceDetector
+
+    detector = object.__new__(FaceDetector)   # no model files needed
+    detector._net = _SlowNet()
+    image = Image.new('RGB', (64, 48))
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        jobs = [pool.submit(detector.detect_faces, image) for _ in range(16)]
+        jobs += [pool.submit(detector.detect_faces_batch, [image, image]) for _ in range(8)]
+        results = [job.result() for job in jobs]
+
+    assert detector._net.max_active == 1
+    assert results[:16] == [[]] * 16 and results[16:] == [[[], []]] * 8
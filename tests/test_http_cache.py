@@ -0,0 +1,14 @@
+import os
+
+from utils.http_cache import file_etag
+
+
+def test_file_etag_follows_content_changes(tmp_path):
+    path = tmp_path / "a.jpg"
+    path.write_bytes(b"first")
+    etag = file_etag(str(path))
+    assert etag == file_etag(str(path))
+
+    path.write_bytes(b"second")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+    assert file_etag(str(path)) != etag
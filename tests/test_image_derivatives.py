@@ -0,0 +1,75 @@
+import os
+
+import pytest
+from PIL import Image
+
+from models.image_derivatives import DerivativeCache
+
+
+def _source(tmp_path, size=(1600, 1200)):
+    path = tmp_path / "photo.jpg"
+    Image.new("RGB", size, (0, 128, 255)).save(path, "JPEG", quality=90)
+    return str(path)
+
+
+def test_parse_params_enforces_allow_list(tmp_path):
+    cache = DerivativeCache(str(tmp_path / "derivatives"))
+    assert cache.parse_params({}) is None
+    assert cache.parse_params({"w": "320"}) == {"w": 320, "h": None, "fit": "contain", "format": None}
+    for args in ({"w": "321"}, {"w": "abc"}, {"fit": "stretch", "w": "320"},
+                 {"format": "gif", "w": "320"}, {"fit": "cover", "w": "320"}):
+        with pytest.raises(ValueError):
+            cache.parse_params(args)
+
+
+def test_variants_are_rendered_once_and_never_upscaled(tmp_path):
+    src = _source(tmp_path)
+    cache = DerivativeCache(str(tmp_path / "derivatives"))
+
+    path = cache.get(src, cache.parse_params({"w": "320"}))
+    assert cache.get(src, cache.parse_params({"w": "320"})) == path
+    assert cache.generated == 1
+    with Image.open(path) as img:
+        assert img.size == (320, 240)
+
+    with Image.open(cache.get(src, cache.parse_params({"w": "200", "h": "200", "fit": "cover",
+                                                       "format": "webp"}))) as img:
+        assert (img.format, img.size) == ("WEBP", (200, 200))
+
+    small = tmp_path / "small.jpg"
+    Image.new("RGB", (100, 50)).save(small, "JPEG")
+    with Image.open(cache.get(str(small), cache.parse_params({"w": "640"}))) as img:
+        assert img.size == (100, 50)
+
+
+def test_cache_directory_stays_within_byte_budget(tmp_path):
+    src = _source(tmp_path)
+    cache_dir = tmp_path / "derivatives"
+    cache = DerivativeCache(str(cache_dir))
+    first = cache.get(src, cache.parse_params({"w": "1280"}))
+    budget = os.path.getsize(first) + 1
+
+    # A restarted cache indexes existing files; adding another evicts the oldest
+    cache = DerivativeCache(str(cache_dir), max_bytes=budget)
+    second = cache.get(src, cache.parse_params({"w": "1280", "format": "png"}))
+    assert os.path.exists(second)
+    assert not os.path.exists(first)
+
+
+def test_negotiation_prefers_listed_modern_formats(tmp_path):
+    src = _source(tmp_path)
+    cache = DerivativeCache(str(tmp_path / "derivatives"), negotiated_formats=("webp",),
+                            quality={"webp": 75, "thumbnails.webp": 60})
+    browser = [("image/avif", 1), ("image/webp", 1), ("*/*", 0.8)]
+
+    assert cache.negotiate([("*/*", 1)]) is None
+    assert cache.negotiate(browser) == {"w": None, "h": None, "fit": "contain", "format": "webp"}
+    explicit = cache.parse_params({"w": "320", "format": "png"})
+    assert cache.negotiate(browser, explicit) == explicit
+
+    params = cache.negotiate(browser)
+    assert cache.get(src, params, kind="thumbnails").endswith("_q60.webp")
+    assert cache.get(src, params, kind="processed").endswith("_q75.webp")
+    stats = cache.stats()["encode"]
+    assert stats["thumbnails"]["webp"]["count"] == 1
+    assert stats["processed"]["webp"]["quality"] == 75
@@ -0,0 +1,215 @@
+"""
+Test ModelManager / FaceNetEmbedder without TensorFlow or ONNX Runtime
+Các model thật được thay bằng stub: kiểm tra batching, thứ tự và chọn backend
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models.model_manager as mm
+
+
+class _StubModel:
+    """
+    Records batch sizes; each face maps to a one-hot embedding whose index is
+    the face's (uniform) gray level / 10, so outputs can be traced to inputs.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_on_batch(self, batch):
+        self.batches.append(batch.shape[0])
+        levels = np.rint((batch[:, 0, 0, 0] * 127.5 + 127.5) / 10).astype(int)
+        out = np.zeros((batch.shape[0], 128), dtype=np.float32)
+        out[np.arange(batch.shape[0]), levels] = 3.0  # not unit length: rows get normalized
+        return out
+
+
+def _embedder(monkeypatch):
+    monkeypatch.setattr(mm, "_HAS_TENSORFLOW", True)
+    embedder = mm.FaceNetEmbedder()
+    embedder.model = _StubModel()
+    return embedder
+
+
+def _faces(count):
+    # Gray level 10 * (i % 25): distinct one-hot index per face within 25
+    return [np.full((90 + i, 70, 3), 10 * (i % 25), dtype=np.uint8) for i in range(count)]
+
+
+@pytest.mark.parametrize("count, expected", [
+    (70, [32, 32, 6]),
+    (32, [32]),
+    (33, [32, 1]),
+])
+def test_extract_embeddings_chunks_at_batch_size(monkeypatch, count, expected):
+    embedder = _embedder(monkeypatch)
+
+    embeddings = embedder.extract_embeddings(_faces(count), batch_size=32)
+
+    assert embedder.model.batches == expected
+    assert embeddings.shape == (count, 128)
+    # Order preserved across chunks, rows L2-normalized
+    assert list(embeddings.argmax(axis=1)) == [i % 25 for i in range(count)]
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0)
+
+
+def test_extract_embeddings_empty_and_single(monkeypatch):
+    embedder = _embedder(monkeypatch)
+
+    empty = embedder.extract_embeddings([])
+    assert empty.shape == (0, 128) and empty.dtype == np.float32
+    assert embedder.model.batches == []
+
+    single = embedder.extract_embedding(_faces(4)[3])
+    assert single.shape == (128,) and single.argmax() == 3
+    assert embedder.extract_embeddings(_faces(1)).shape == (1, 128)
+
+
+def test_preprocess_faces_mixed_inputs(monkeypatch):
+    embedder = _embedder(monkeypatch)
+    faces = [
+        Image.new("RGBA", (200, 120), (255, 0, 0, 128)),
+        np.zeros((50, 40), dtype=np.uint8),                 # grayscale
+        np.full((160, 160, 4), 255, dtype=np.uint8),        # RGBA array
+    ]
+
+    batch = embedder.preprocess_faces(faces)
+
+    assert batch.shape == (3, 160, 160, 3) and batch.dtype == np.float32
+    assert batch.min() >= -1.0 and batch.max() <= 1.0
+    assert np.allclose(batch[0, 0, 0], [1.0, -1.0, -1.0])
+    assert np.allclose(batch[1], -1.0) and np.allclose(batch[2], 1.0)
+    assert embedder.preprocess_faces([]).shape == (0, 160, 160, 3)
+    assert embedder.preprocess_face(faces[2]).shape == (1, 160, 160, 3)
+
+
+class _StubEmbedder:
+    """FaceNetEmbedder stand-in for backend selection"""
+
+    def __init__(self, tmp_path, onnx_file=False, tf_file=True, onnx_fails=False):
+        self.model_path = str(tmp_path / "facenet_model.h5")
+        self.onnx_path = str(tmp_path / "facenet_model.onnx")
+        for path, present in ((self.model_path, tf_file), (self.onnx_path, onnx_file)):
+            if present:
+                open(path, "wb").close()
+        self.onnx_fails = onnx_fails
+        self.use_onnx = False
+        self.onnx_session = None
+        self.load_calls = []
+        self.extract_calls = {"tensorflow": 0, "onnx": 0}
+
+    def load_onnx_model(self, **kwargs):
+        self.load_calls.append(kwargs)
+        if not os.path.exists(self.onnx_path):
+            raise ImportError("tf2onnx missing, cannot export")
+        self.onnx_session = object()
+        self.use_onnx = True
+
+    def extract_embeddings(self, faces, batch_size=32):
+        self.extract_calls["tensorflow"] += 1
+        return np.ones((len(faces), 128), dtype=np.float32)
+
+    def extract_embeddings_onnx(self, faces, batch_size=32):
+        self.extract_calls["onnx"] += 1
+        if self.onnx_fails:
+            raise RuntimeError("onnx run failed")
+        return np.zeros((len(faces), 128), dtype=np.float32)
+
+
+def _manager(monkeypatch, embedder, backend="auto", has_onnxruntime=True, **settings):
+    monkeypatch.setattr(mm, "get_detector", lambda: None)
+    monkeypatch.setattr(mm, "_HAS_ONNXRUNTIME", has_onnxruntime)
+    manager = mm.ModelManager({"EMBEDDING_BACKEND": backend, **settings})
+    manager._embedding_model = embedder
+    return manager
+
+
+def test_auto_backend_uses_exported_onnx_model(monkeypatch, tmp_path):
+    embedder = _StubEmbedder(tmp_path, onnx_file=True)
+    manager = _manager(monkeypatch, embedder, ONNX_INTRA_OP_THREADS=2)
+
+    assert manager.select_embedding_backend() == "onnx"
+    assert manager.select_embedding_backend() == "onnx"
+    assert len(embedder.load_calls) == 1            # session created once
+    assert embedder.load_calls[0]["intra_op_threads"] == 2
+
+    manager.extract_embeddings(_faces(3))
+    assert embedder.extract_calls == {"tensorflow": 0, "onnx": 1}
+    assert manager.embedding_latency.summary()["onnx"]["samples"] == 1
+
+
+@pytest.mark.parametrize("backend, onnx_file, has_onnxruntime", [
+    ("tensorflow", True, True),    # forced
+    ("auto", False, True),         # no exported model
+    ("auto", True, False),         # onnxruntime not installed
+    ("onnx", False, True),         # forced, but the export/load fails
+])
+def test_backend_falls_back_to_tensorflow(monkeypatch, tmp_path, backend, onnx_file, has_onnxruntime):
+    embedder = _StubEmbedder(tmp_path, onnx_file=onnx_file)
+    manager = _manager(monkeypatch, embedder, backend=backend, has_onnxruntime=has_onnxruntime)
+
+    assert manager.select_embedding_backend() == "tensorflow"
+    expected_loads = 1 if backend == "onnx" else 0
+    assert len(embedder.load_calls) == expected_loads
+    manager.extract_embeddings(_faces(2))
+    assert embedder.extract_calls == {"tensorflow": 1, "onnx": 0}
+
+
+def test_onnx_inference_error_falls_back_to_tensorflow(monkeypatch, tmp_path):
+    embedder = _StubEmbedder(tmp_path, onnx_file=True, onnx_fails=True)
+    manager = _manager(monkeypatch, embedder)
+
+    embeddings = manager.extract_embeddings(_faces(2))
+
+    assert embeddings.shape == (2, 128) and embeddings[0, 0] == 1.0   # TensorFlow result
+    assert embedder.extract_calls == {"tensorflow": 1, "onnx": 1}
+    assert set(manager.embedding_latency.summary()) == {"tensorflow"}
+
+
+def test_latency_stats_percentiles_and_window():
+    stats = mm.LatencyStats(window=100)
+    for ms in range(1, 101):
+        stats.record("tensorflow", ms * 4.0, count=4)   # per-face: 1..100 ms
+    stats.record("onnx", 10.0)
+
+    summary = stats.summary()
+    assert summary["tensorflow"] == {"samples": 100, "p50_ms": 50.5, "p95_ms": 95.05}
+    assert summary["onnx"] == {"samples": 1, "p50_ms": 10.0, "p95_ms": 10.0}
+
+    # Only the last `window` samples are kept
+    stats.record("tensorflow", 1000.0)
+    assert stats.summary()["tensorflow"]["samples"] == 100
+    assert stats.summary()["tensorflow"]["p50_ms"] == 51.5
+    assert mm.LatencyStats().summary() == {}
+
+
+def test_benchmark_reports_each_backend(monkeypatch, tmp_path):
+    embedder = _StubEmbedder(tmp_path, onnx_file=True)
+    manager = _manager(monkeypatch, embedder, has_onnxruntime=False)
+    monkeypatch.setattr(mm, "_HAS_TENSORFLOW", True)
+
+    results = manager.benchmark_embedding_backends(runs=5)
+
+    assert results["onnx"] == {"error": "not available"}
+    assert results["tensorflow"]["samples"] == 5
+    assert results["tensorflow"]["p95_ms"] >= results["tensorflow"]["p50_ms"] >= 0
+    assert embedder.extract_calls["tensorflow"] == 6     # warm-up + runs
+    assert manager.last_benchmark is results
+
+
+def test_benchmark_loads_onnx_session_on_demand(monkeypatch, tmp_path):
+    embedder = _StubEmbedder(tmp_path, onnx_file=True, tf_file=False)
+    manager = _manager(monkeypatch, embedder)
+
+    results = manager.benchmark_embedding_backends(runs=3)
+
+    assert results["tensorflow"] == {"error": "not available"}
+    assert results["onnx"]["samples"] == 3
+    assert len(embedder.load_calls) == 1 and embedder.extract_calls["onnx"] == 4
@@ -0,0 +1,44 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.png_writer import PNGStreamWriter
+
+
+def test_streamed_png_matches_source_rows():
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, size=(37, 19, 3), dtype=np.uint8)
+
+    buffer = io.BytesIO()
+    with PNGStreamWriter(buffer, 19, 37, mode="RGB", dpi=300, chunk_size=64) as png:
+        for top in range(0, 37, 8):
+            png.write_rows(pixels[top:top + 8])
+
+    buffer.seek(0)
+    with Image.open(buffer) as img:
+        assert img.mode == "RGB"
+        assert round(img.info["dpi"][0]) == 300
+        assert np.array_equal(np.asarray(img), pixels)
+
+
+def test_rgba_rows_from_pil_images():
+    band = Image.new("RGBA", (5, 2), (10, 20, 30, 40))
+    buffer = io.BytesIO()
+    with PNGStreamWriter(buffer, 5, 4, mode="RGBA") as png:
+        png.write_rows(band)
+        png.write_rows(band)
+
+    buffer.seek(0)
+    with Image.open(buffer) as img:
+        assert img.getpixel((4, 3)) == (10, 20, 30, 40)
+
+
+def test_row_count_is_checked():
+    png = PNGStreamWriter(io.BytesIO(), 4, 2)
+    with pytest.raises(ValueError):
+        png.write_rows(np.zeros((1, 3, 3), dtype=np.uint8))  # wrong width
+    png.write_rows(np.zeros((1, 4, 3), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        png.close()  # one row missing
@@ -0,0 +1,35 @@
+import os
+import time
+
+from PIL import Image
+
+from models.preview_cache import PreviewCache
+
+
+def test_previews_expire_and_are_garbage_collected(tmp_path):
+    cache = PreviewCache(str(tmp_path / "previews"), ttl_seconds=60)
+    fresh = cache.put(Image.new("RGB", (32, 32), "red"))
+    stale = cache.put(Image.new("RGB", (32, 32), "blue"))
+    old = time.time() - 120
+    os.utime(os.path.join(cache.cache_dir, stale), (old, old))
+
+    assert cache.path(fresh) is not None
+    assert cache.path(stale) is None
+    assert cache.path("../" + fresh) is None
+
+    assert cache.gc() == 1
+    assert os.listdir(cache.cache_dir) == [fresh]
+
+
+def test_gc_thread_runs_on_schedule(tmp_path):
+    cache = PreviewCache(str(tmp_path / "previews"), ttl_seconds=0, gc_interval=0.05)
+    cache.put(Image.new("RGB", (8, 8)))
+    time.sleep(0.01)
+    cache.start_gc()
+    try:
+        deadline = time.time() + 2
+        while os.listdir(cache.cache_dir) and time.time() < deadline:
+            time.sleep(0.02)
+        assert os.listdir(cache.cache_dir) == []
+    finally:
+        cache.stop_gc()
@@ -0,0 +1,87 @@
+import numpy as np
+from PIL import Image
+
+from models.sticker_assets import StickerAssets, STICKER_MAP
+
+
+def _assets(tmp_path, size=(300, 150)):
+    sticker = Image.new("RGBA", size, (0, 0, 0, 0))
+    sticker.paste((255, 0, 0, 255), (0, 0, size[0] // 2, size[1]))     # opaque red half
+    sticker.paste((0, 0, 255, 128), (size[0] // 2, 0, size[0], size[1]))  # half-transparent blue half
+    sticker.save(tmp_path / STICKER_MAP["hat"])
+    return StickerAssets(str(tmp_path))
+
+
+def test_ladder_and_exact_size_cache(tmp_path):
+    assets = _assets(tmp_path)
+    assert assets.target_size("hat", 100) == (140, 70)   # SIZE_MULTIPLIERS['hat'] = 1.4
+
+    sticker = assets.get("hat", 140)
+    assert sticker.mode == "RGBa" and sticker.size == (140, 70)
+    assert assets.get("hat", 140) is sticker
+    assert sorted(assets.stats()["ladders"]["hat-2.png"]) == [32, 64, 128, 256, 300]
+    assert assets.get("unknown_type", 140) is sticker    # falls back to the hat
+
+
+def test_composite_matches_alpha_compositing_and_clips(tmp_path):
+    assets = _assets(tmp_path, size=(64, 32))
+    sticker = assets.get("hat", 64)
+    photo = Image.new("RGB", (80, 40), (0, 200, 0))
+
+    canvas = np.array(photo)
+    assets.composite(canvas, sticker, (30, 20))  # partly outside the photo
+
+    expected = photo.convert("RGBA")
+    expected.alpha_composite(sticker.convert("RGBA").crop((0, 0, 50, 20)), (30, 20))
+    diff = np.abs(canvas.astype(int) - np.array(expected.convert("RGB")).astype(int))
+    assert diff.max() <= 2
+    assert (canvas[:20] == (0, 200, 0)).all()    # outside the sticker box untouched
+
+
+class _FakeDetector:
+    """Batched detection stub: one face in the middle of every image"""
+
+    def __init__(self):
+        self.batches = []
+
+    def detect_faces_batch(self, images):
+        self.batches.append(len(images))
+        return [[{"bbox": [im.width // 4, im.height // 4, im.width // 2, im.height // 2], "confidence": 0.9}] for im in images]
+
+    def get_face_positions_for_stickers(self, image, sticker_type="hat", faces=None):
+        from models.face_detector import FaceDetector
+        return FaceDetector.get_face_positions_for_stickers(self, image, sticker_type, faces=faces)
+
+
+def test_batch_detects_once_composites_and_writes(tmp_path):
+    from models.sticker_batch import apply_stickers_batch
+
+    assets = _assets(tmp_path)
+    items = []
+    for i in range(3):
+        path = tmp_path / f"photo{i}.jpg"
+        Image.new("RGB", (200, 160), (0, 200, 0)).save(path)
+        items.append({"key": i, "path": str(path)})
+    items.append({"key": 3, "path": str(tmp_path / "missing.jpg")})
+    Image.new("RGB", (100, 80)).save(tmp_path / "photo0_slot.jpg")
+    # Cached faces for a different image size are ignored
+    items[1].update(faces=[{"bbox": [0, 0, 10, 10], "confidence": 0.9}], size=(100, 100))
+    items[2].update(faces=[{"bbox": [50, 40, 100, 80], "confidence": 0.9}], size=(200, 160))
+
+    detector = _FakeDetector()
+    batch = apply_stickers_batch(items, "hat", assets, detector, max_workers=2)
+    results = batch["results"]
+
+    assert detector.batches == [2]
+    assert [r["key"] for r in results] == [0, 1, 2, 3]
+    assert [r.get("detect_source") for r in results] == ["batch", "batch", "cache", None]
+    assert results[3]["success"] is False
+    for result in results[:3]:
+        assert result["success"] and result["faces"] == 1
+        assert {"decode", "composite", "write"} <= set(result["timings"])
+    assert "total_ms" in batch["timings"]
+
+    with Image.open(items[0]["path"]) as img:
+        assert img.size == (200, 160) and img.getpixel((60, 10))[0] > 200   # red half of the sticker over the head
+    assert not list(tmp_path.glob("*.tmp"))
+    assert not (tmp_path / "photo0_slot.jpg").exists()   # stale collage slot dropped
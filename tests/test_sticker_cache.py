@@ -0,0 +1,48 @@
+import os
+
+from PIL import Image
+
+from models.sticker_cache import ProcessedStickerCache
+
+
+def _checkered_sticker(path):
+    img = Image.new("RGBA", (32, 32), (200, 200, 200, 255))
+    for x in range(32):
+        for y in range(32):
+            if (x // 8 + y // 8) % 2:
+                img.putpixel((x, y), (140, 140, 140, 255))
+    for x in range(12, 20):
+        for y in range(12, 20):
+            img.putpixel((x, y), (220, 30, 30, 255))
+    img.save(path)
+
+
+def test_processed_sticker_cached_on_disk_and_memory(tmp_path):
+    src = tmp_path / "1.png"
+    _checkered_sticker(src)
+    cache = ProcessedStickerCache(cache_dir=str(tmp_path / "processed"))
+
+    first = cache.get(str(src))
+    path = cache.processed_path(str(src))
+    assert os.path.exists(path)
+    assert first.getpixel((0, 0))[3] == 0
+    assert first.getpixel((15, 15)) == (220, 30, 30, 255)
+    assert cache.get(str(src)) is first
+
+    # A new process reuses the disk tier
+    other = ProcessedStickerCache(cache_dir=str(tmp_path / "processed"))
+    assert other.ensure_processed(str(src)) == path
+
+
+def test_changed_sticker_is_reprocessed(tmp_path):
+    src = tmp_path / "2.png"
+    _checkered_sticker(src)
+    cache = ProcessedStickerCache(cache_dir=str(tmp_path / "processed"))
+    old_path = cache.ensure_processed(str(src))
+
+    Image.new("RGBA", (16, 16), (10, 200, 10, 255)).save(src)
+    os.utime(src, ns=(os.stat(src).st_atime_ns, os.stat(src).st_mtime_ns + 1_000_000))
+
+    new_path = cache.ensure_processed(str(src))
+    assert new_path != old_path
+    assert cache.get(str(src)).size == (16, 16)
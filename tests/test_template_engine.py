@@ -1,4 +1,5 @@
 import os
+import numpy as np
 from PIL import Image
 from models.template_engine import TemplateEngine
 
@@ -232,3 +233,377 @@ def test_anchor_points_distribution():
 
     # At least some points should be at corners
     assert len(corner_points) >= 4, "Not enough anchor points at corners"
+
+
+def test_gradient_matches_per_row_reference():
+    te = TemplateEngine(output_dir="static/uploads/collages_test")
+    img = te._create_gradient((7, 50), ["#FF0000", "#0000FF"])
+    assert img.mode == "RGBA"
+    for y in (0, 17, 49):
+        ratio = y / 49
+        expected = (int(255 - 255 * ratio), 0, int(255 * ratio), 255)
+        assert img.getpixel((3, y)) == expected
+
+
+def test_background_cache_returns_copies(tmp_path):
+    te = TemplateEngine(output_dir="static/uploads/collages_test", background_cache_dir=str(tmp_path))
+    template = {"size": (40, 30), "background": {"type": "gradient", "colors": ["#000000", "#FFFFFF"]}}
+    TemplateEngine._background_cache.clear()
+
+    first = te._create_background(template)
+    first.putpixel((0, 0), (1, 2, 3, 255))
+    second = te._create_background(template)
+
+    assert second.getpixel((0, 0)) == (0, 0, 0, 255)
+    assert len(list(tmp_path.glob("bg_*.png"))) == 1
+
+    # A fresh memory tier is filled from the PNG disk tier
+    TemplateEngine._background_cache.clear()
+    assert te._create_background(template).tobytes() == second.tobytes()
+
+    # Color overrides get their own cache entry
+    solid = {"size": (40, 30), "background": "#FFFFFF"}
+    assert te._create_background(solid, {"bg": "#FF0000"}).getpixel((5, 5)) == (255, 0, 0, 255)
+    assert te._create_background(solid).getpixel((5, 5)) == (255, 255, 255, 255)
+
+
+def test_decorations_rasterized_once_per_scale_and_color(tmp_path):
+    path = tmp_path / "deco.png"
+    Image.new("RGBA", (20, 10), (10, 20, 30, 200)).save(path)
+    te = TemplateEngine(output_dir="static/uploads/collages_test")
+    TemplateEngine._decoration_cache.clear()
+
+    first = te._load_decoration(str(path), 1.5)
+    assert first.size == (30, 15)
+    assert te._load_decoration(str(path), 1.5) is first
+
+    tinted = te._load_decoration(str(path), 1.5, "#FF0000")
+    assert tinted is not first
+    assert tinted.getpixel((5, 5)) == (255, 0, 0, 200)
+
+
+def test_svg_decoration_scaled_in_vector_space(tmp_path, monkeypatch):
+    import io
+    import models.template_engine as te_module
+
+    calls = []
+
+    class FakeCairo:
+        @staticmethod
+        def svg2png(url, scale=1.0):
+            calls.append(scale)
+            buf = io.BytesIO()
+            Image.new("RGBA", (int(10 * scale), int(10 * scale)), (0, 0, 0, 255)).save(buf, "PNG")
+            return buf.getvalue()
+
+    monkeypatch.setattr(te_module, "cairosvg", FakeCairo, raising=False)
+    monkeypatch.setattr(te_module, "_HAS_CAIROSVG", True)
+    path = tmp_path / "star.svg"
+    path.write_text("<svg/>")
+    te = TemplateEngine(output_dir="static/uploads/collages_test")
+    TemplateEngine._decoration_cache.clear()
+
+    assert te._load_decoration(str(path), 2.0).size == (20, 20)
+    te._load_decoration(str(path), 2.0)
+    assert calls == [2.0]
+
+
+def _photo_paths(tmp_path, count=2):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"photo_{i}.jpg"
+        Image.new("RGB", (400, 300), (40 * i, 120, 200)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_build_collage_output_formats(tmp_path):
+    te = TemplateEngine(output_dir=str(tmp_path / "out"))
+    photos = _photo_paths(tmp_path)
+
+    png = te.build_collage(photos, "2x2", output_options={"compress_level": 1})
+    jpeg = te.build_collage(photos, "2x2", output_options={"format": "jpg", "quality": 80})
+    webp = te.build_collage(photos, "2x2", output_options={"format": "webp", "lossless": True})
+
+    assert png["path"].endswith(".png") and png["format"] == "png"
+    assert jpeg["path"].endswith(".jpg") and Image.open(jpeg["path"]).format == "JPEG"
+    assert webp["extension"] == "webp" and Image.open(webp["path"]).format == "WEBP"
+    for result in (png, jpeg, webp):
+        assert result["bytes"] == os.path.getsize(result["path"])
+        assert result["encode_ms"] >= 0 and result["render_ms"] >= 0
+        assert (result["width"], result["height"]) == (900, 940)
+
+    # create_collage still returns just the path
+    assert te.create_collage(photos, "2x2").endswith(".png")
+
+
+def test_output_options_validation():
+    import pytest
+
+    with pytest.raises(ValueError):
+        TemplateEngine.normalize_output_options({"format": "gif"})
+    with pytest.raises(ValueError):
+        TemplateEngine.normalize_output_options({"quality": 0})
+
+    defaults = TemplateEngine.normalize_output_options({"format": "webp", "quality": 70})
+    merged = TemplateEngine.normalize_output_options({"lossless": "true"}, defaults)
+    assert merged["format"] == "webp" and merged["quality"] == 70 and merged["lossless"] is True
+
+
+def test_identical_collage_requests_reuse_output(tmp_path):
+    te = TemplateEngine(output_dir=str(tmp_path / "out"))
+    photos = _photo_paths(tmp_path)
+
+    first = te.build_collage(photos, "2x2", colors={"bg": "#FFE4EC"})
+    second = te.build_collage(photos, "2x2", colors={"bg": "#ffe4ec"})
+    assert second["cached"] and not first["cached"]
+    assert second["path"] == first["path"]
+
+    other = te.build_collage(photos, "2x2", colors={"bg": "#000000"})
+    assert other["path"] != first["path"]
+
+    # Changing a photo's content changes the key
+    Image.new("RGB", (400, 300), (0, 0, 0)).save(photos[0])
+    os.utime(photos[0], ns=(0, os.stat(photos[0]).st_mtime_ns + 1_000_000))
+    assert te.build_collage(photos, "2x2", colors={"bg": "#FFE4EC"})["path"] != first["path"]
+    assert len(os.listdir(tmp_path / "out")) == 3
+
+
+def test_cleanup_collages_ttl_and_lru(tmp_path):
+    import time
+
+    out = tmp_path / "out"
+    te = TemplateEngine(output_dir=str(out))
+    now = time.time()
+    for i, age in enumerate([10, 20, 30, 10_000]):
+        path = out / f"collage_2x2_{i}.png"
+        path.write_bytes(b"x")
+        os.utime(path, (now - age, now - age))
+    (out / "keep_me.png").write_bytes(b"x")
+
+    assert te.cleanup_collages(max_files=2, ttl_seconds=3600) == 2
+    assert sorted(os.listdir(out)) == ["collage_2x2_0.png", "collage_2x2_1.png", "keep_me.png"]
+
+
+def test_slot_derivative_used_when_it_covers_the_slot(tmp_path):
+    te = TemplateEngine(output_dir=str(tmp_path / "out"))
+    source = tmp_path / "capture.jpg"
+    Image.new("RGB", (1280, 960), (10, 20, 30)).save(source)
+    slot = tmp_path / "capture_slot.jpg"
+    Image.new("RGB", (540, 400), (10, 20, 30)).save(slot)
+    small = tmp_path / "capture_small.jpg"
+    Image.new("RGB", (200, 150), (10, 20, 30)).save(small)
+    entry = [str(source), str(slot), str(small)]
+
+    # 540x400 covers a 360x260 strip slot; the 200x150 one is too small
+    assert te._pick_derivative(entry, (360, 260)) == str(slot)
+    # ... and (within tolerance) a square slot of a 4:3 capture
+    assert te._pick_derivative(entry, (360, 360)) == str(slot)
+    # Larger than the derivative: fall back to the source
+    assert te._pick_derivative(entry, (560, 560)) == str(source)
+
+
+def test_stale_slot_derivative_ignored_after_source_rewrite(tmp_path):
+    te = TemplateEngine(output_dir=str(tmp_path / "out"))
+    source = tmp_path / "capture.jpg"
+    Image.new("RGB", (1280, 960), (0, 0, 255)).save(source)
+    slot = tmp_path / "capture_slot.jpg"
+    Image.new("RGB", (540, 400), (0, 0, 255)).save(slot)
+    entry = [str(source), str(slot)]
+
+    first = te.build_collage([entry], "classic_strip")
+    with Image.open(first["path"]) as img:
+        assert img.convert("RGB").getpixel((320, 240))[2] > 200
+
+    # Rewritten in place (e.g. stickers applied); the slot file is now older
+    Image.new("RGB", (1280, 960), (255, 0, 0)).save(source)
+    mtime = os.stat(slot).st_mtime
+    os.utime(source, (mtime + 5, mtime + 5))
+    assert te._pick_derivative(entry, (540, 400)) == str(source)
+
+    second = te.build_collage([entry], "classic_strip")
+    assert second["path"] != first["path"]
+    with Image.open(second["path"]) as img:
+        assert img.convert("RGB").getpixel((320, 240))[0] > 200
+
+
+def test_slot_photos_cached_per_size(tmp_path):
+    te = TemplateEngine(output_dir=str(tmp_path / "out"))
+    source = tmp_path / "photo.jpg"
+    Image.new("RGB", (1600, 1200), (200, 100, 50)).save(source)
+
+    first = te._load_slot_photo(str(source), (360, 260))
+    assert first.size == (360, 260) and first.mode == "RGBA"
+    assert te._load_slot_photo(str(source), (360, 260)) is first
+    assert te._load_slot_photo(str(source), (560, 560)).size == (560, 560)
+
+
+def _write_catalog(tmp_path, layer="under", first_slot=(50, 100)):
+    import json
+
+    assets = tmp_path / "static" / "templates" / "assets"
+    assets.mkdir(parents=True)
+    frame = Image.new("RGBA", (100, 200), (0, 0, 0, 0))
+    frame.paste((255, 0, 0, 255), (0, 0, 100, 10))  # opaque red bar on top
+    frame.save(assets / "Frame_1x4.png")
+    catalog = tmp_path / "static" / "templates" / "templates.json"
+    catalog.write_text(json.dumps({
+        "frame": {
+            "name": "Frame",
+            "asset": "templates/assets/Frame.png",  # resolved to Frame_1x4.png
+            "asset_layer": layer,
+            "layout": "4x1",
+            "size": [200, 400],
+            "photo_size": [100, 80],
+            "positions": [list(first_slot), [50, 200]]
+        },
+        "broken": {"name": "No size"}
+    }))
+    return catalog
+
+
+def test_catalog_templates_loaded_and_assets_resolved(tmp_path):
+    catalog = _write_catalog(tmp_path)
+    te = TemplateEngine(output_dir=str(tmp_path / "out"), catalog_path=str(catalog))
+
+    templates = te.get_available_templates()
+    assert "frame" in templates and "broken" not in templates
+    assert "classic_strip" in templates
+    assert templates["frame"]["has_asset"]
+    assert te.get_template("frame")["asset"].endswith("Frame_1x4.png")
+    assert te.get_template("frame")["positions"] == [(50, 100), (50, 200)]
+
+
+def test_real_catalog_assets_match_layout_and_aspect():
+    import json
+    import pytest
+
+    catalog = os.path.join("static", "templates", "templates.json")
+    with open(catalog, encoding="utf-8") as f:
+        entries = json.load(f)
+    templates = TemplateEngine.load_template_catalog(catalog)
+    te = TemplateEngine(output_dir="static/uploads/collages_test", catalog_path=catalog)
+    available = te.get_available_templates()
+
+    for name, entry in entries.items():
+        template = templates[name]
+        if not entry.get("asset"):
+            continue
+        if template.get("asset_error"):
+            # Unusable asset: an error, not a bare render, and not offered
+            assert name not in available
+            with pytest.raises(ValueError):
+                te.get_template(name)
+            continue
+        with Image.open(template["asset"]) as img:
+            width, height = img.size
+        canvas_w, canvas_h = template["size"]
+        assert abs((width / height) / (canvas_w / canvas_h) - 1) <= TemplateEngine.ASSET_ASPECT_TOLERANCE, name
+        assert not template["asset"].endswith("_2x2.png"), name
+        assert available[name]["has_asset"]
+
+
+def test_catalog_asset_rejected_on_layout_or_aspect_mismatch(tmp_path):
+    import json
+    import pytest
+
+    assets = tmp_path / "static" / "templates" / "assets"
+    assets.mkdir(parents=True)
+    Image.new("RGBA", (400, 400)).save(assets / "Square_2x2.png")
+    Image.new("RGBA", (100, 300)).save(assets / "Narrow_1x4.png")
+    catalog = tmp_path / "static" / "templates" / "templates.json"
+    strip = {"layout": "4x1", "size": [200, 400], "photo_size": [100, 80], "positions": [[50, 100]]}
+    catalog.write_text(json.dumps({
+        "square": {**strip, "asset": "templates/assets/Square.png"},   # 2x2 file for a 4x1 strip
+        "narrow": {**strip, "asset": "templates/assets/Narrow.png"},   # 1:3 file for a 1:2 canvas
+    }))
+    te = TemplateEngine(output_dir=str(tmp_path / "out"), catalog_path=str(catalog))
+
+    assert "square" not in te.get_available_templates()
+    for name in ("square", "narrow"):
+        with pytest.raises(ValueError):
+            te.build_collage([str(assets / "Square_2x2.png")], name)
+
+
+def test_catalog_template_rendered_with_cached_asset(tmp_path):
+    catalog = _write_catalog(tmp_path)
+    te = TemplateEngine(output_dir=str(tmp_path / "out"), catalog_path=str(catalog))
+    photo = tmp_path / "photo.jpg"
+    Image.new("RGB", (400, 300), (0, 0, 255)).save(photo)
+
+    result = te.build_collage([str(photo)], "frame", colors={"bg": "#00FF00"})
+    with Image.open(result["path"]) as img:
+        img = img.convert("RGB")
+        assert img.size == (200, 400)
+        assert img.getpixel((100, 5)) == (255, 0, 0)     # asset (scaled to the canvas)
+        assert img.getpixel((10, 300)) == (0, 255, 0)    # background shows through
+        assert img.getpixel((100, 140))[2] > 200         # photo above the asset
+
+    asset = te._load_asset(te.get_template("frame")["asset"], (200, 400))
+    assert asset.mode == "RGBa"
+    assert te._load_asset(te.get_template("frame")["asset"], (200, 400)) is asset
+
+
+def test_catalog_asset_over_photos(tmp_path):
+    # First photo slot placed under the red bar (y 0-20 on the canvas)
+    catalog = _write_catalog(tmp_path, layer="over", first_slot=(50, 0))
+    te = TemplateEngine(output_dir=str(tmp_path / "out"), catalog_path=str(catalog))
+    photo = tmp_path / "photo.jpg"
+    Image.new("RGB", (400, 300), (0, 0, 255)).save(photo)
+
+    path = te.create_collage([str(photo)], "frame")
+    with Image.open(path) as img:
+        assert img.convert("RGB").getpixel((100, 5)) == (255, 0, 0)
+
+
+def test_print_render_scales_template_in_bands(tmp_path):
+    te = TemplateEngine(output_dir=str(tmp_path / "out"))
+    te.print_band_height = 100
+    photos = _photo_paths(tmp_path)
+
+    screen = te.build_collage(photos, "classic_strip")
+    printed = te.build_collage(photos, "classic_strip", output_options={"dpi": 192})
+    assert printed["scale"] == 2.0 and printed["bands"] == 37
+    assert (printed["width"], printed["height"]) == (1280, 3700)
+    assert printed["path"] != screen["path"]
+
+    with Image.open(printed["path"]) as img, Image.open(screen["path"]) as ref:
+        assert img.size == (1280, 3700)
+        assert round(img.info["dpi"][0]) == 192
+        # Downscaled print ~ screen render (same positions, borders, photos)
+        small = np.asarray(img.convert("RGB").resize(ref.size, Image.BOX), dtype=float)
+        assert np.abs(small - np.asarray(ref.convert("RGB"), dtype=float)).mean() < 2
+
+    cached = te.build_collage(photos, "classic_strip", output_options={"scale": 2})
+    assert cached["cached"]
+    assert {k: cached[k] for k in ("width", "height", "scale", "dpi", "bands")} == \
+        {k: printed[k] for k in ("width", "height", "scale", "dpi", "bands")}
+
+
+def test_failed_encode_leaves_no_temp_file(tmp_path):
+    import pytest
+
+    te = TemplateEngine(output_dir=str(tmp_path / "out"))
+
+    def fail(canvas, path, options):
+        with open(path, "wb") as f:
+            f.write(b"partial")
+        raise OSError("disk full")
+
+    te._encode_canvas = fail
+    with pytest.raises(OSError):
+        te.build_collage(_photo_paths(tmp_path), "classic_strip")
+    assert os.listdir(tmp_path / "out") == []
+
+
+def test_print_options_validation(tmp_path):
+    import pytest
+
+    with pytest.raises(ValueError):
+        TemplateEngine.normalize_output_options({"dpi": 300, "format": "jpeg"})
+    assert TemplateEngine.normalize_output_options({"dpi": 288})["scale"] == 3.0
+
+    te = TemplateEngine(output_dir=str(tmp_path / "out"))
+    te.max_print_pixels = 1000
+    with pytest.raises(ValueError):
+        te.build_collage(_photo_paths(tmp_path), "2x2", output_options={"scale": 2})
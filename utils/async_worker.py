@@ -1,17 +1,67 @@
-\"\"\"Simple ThreadPool-based async worker for Phase 0 background tasks.\"\"\"
+"""Simple ThreadPool-based async worker for Phase 0 background tasks."""
+import threading
 from concurrent.futures import ThreadPoolExecutor, Future
 from typing import Callable, Any
 
+
+class QueueFullError(Exception):
+    """Raised when a bounded pool cannot accept more work"""
+
+
+class BoundedWorkerPool:
+    """
+    Thread pool with a bounded queue.
+
+    At most max_workers tasks run at once and at most max_queue more wait;
+    submit() raises QueueFullError instead of queueing without limit.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, thread_name_prefix: str = 'worker'):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Submit a callable; raises QueueFullError if the queue is full."""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f'Queue full ({self.max_workers} running, {self.max_queue} queued)')
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    @property
+    def pending(self) -> int:
+        """Number of running + queued tasks"""
+        with self._lock:
+            return self._pending
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
 # Small pool for background tasks (embeddings, heavy IO)
 _executor = ThreadPoolExecutor(max_workers=2)
 
 
 def submit_task(func: Callable, *args, **kwargs) -> Future:
-    \"\"\"Submit a callable to the thread pool and return a Future.\"\"\"
+    """Submit a callable to the thread pool and return a Future."""
     return _executor.submit(func, *args, **kwargs)
 
 
 def shutdown(wait: bool = True) -> None:
-    \"\"\"Shutdown the thread pool executor.\"\"\"
+    """Shutdown the thread pool executor."""
     _executor.shutdown(wait=wait)
-
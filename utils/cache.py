@@ -0,0 +1,111 @@
+"""
+Small thread-safe LRU cache used for rendered images and other derived assets.
+"""
+import threading
+from collections import OrderedDict
+
+
+def image_nbytes(image):
+    """Approximate in-memory size of a PIL image (bytes)"""
+    bands = len(image.getbands())
+    return image.width * image.height * bands
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache.
+
+    Entries are evicted when either max_entries or max_bytes is exceeded.
+    The size of an entry is computed with size_of(value) (default: 1 per entry,
+    so max_bytes is only meaningful together with a size_of function).
+    on_evict(key, value), if given, is called (outside the lock) for every
+    entry dropped to stay within the limits.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=None, size_of=None, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_of = size_of or (lambda value: 1)
+        self.on_evict = on_evict
+        self._data = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.size_of(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            # Một entry lớn hơn cả ngân sách thì không cache
+            if self.max_bytes is not None and size > self.max_bytes:
+                evicted = [(key, value)]
+            else:
+                self._data[key] = (value, size)
+                self._bytes += size
+                evicted = self._evict()
+        if self.on_evict:
+            for evicted_key, evicted_value in evicted:
+                self.on_evict(evicted_key, evicted_value)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self._bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _evict(self):
+        """Drop least recently used entries until within limits; returns [(key, value)]"""
+        evicted = []
+        while self._data and (
+            (self.max_entries is not None and len(self._data) > self.max_entries) or
+            (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key, (value, size) = self._data.popitem(last=False)
+            self._bytes -= size
+            evicted.append((key, value))
+        return evicted
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def stats(self):
+        """Return cache statistics for status endpoints"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
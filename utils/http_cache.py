@@ -0,0 +1,71 @@
+"""
+HTTP caching helpers for served image files.
+
+ETags are content hashes, memoized by (mtime_ns, size) so a file is only
+hashed again after it changes - some processed files are rewritten in place
+(e.g. apply-sticker-session), so the name alone does not identify the content.
+"""
+import hashlib
+import os
+
+from utils.cache import LRUCache
+
+# One year: max-age for responses whose URL pins the content
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# abs path -> (mtime_ns, size, digest)
+_etags = LRUCache(max_entries=4096)
+
+
+def file_etag(path):
+    """
+    Strong ETag (hex digest) of a file's content.
+
+    Args:
+        path: file path
+
+    Returns:
+        str: 16 hex chars, changes whenever the content changes
+
+    Raises:
+        OSError: if the file does not exist
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    memo = _etags.get(path)
+    if memo and memo[0] == st.st_mtime_ns and memo[1] == st.st_size:
+        return memo[2]
+
+    hasher = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(256 * 1024), b''):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()[:16]
+    _etags.put(path, (st.st_mtime_ns, st.st_size, digest))
+    return digest
+
+
+def apply_cache_headers(response, immutable, max_age=IMMUTABLE_MAX_AGE):
+    """
+    Set Cache-Control on an image response.
+
+    Args:
+        response: Flask response (already carrying an ETag)
+        immutable: True if the URL always maps to the same bytes
+        max_age: seconds to cache immutable responses
+
+    Returns:
+        the response
+    """
+    cache_control = response.cache_control
+    cache_control.public = True
+    if immutable:
+        cache_control.no_cache = None
+        cache_control.max_age = max_age
+        cache_control.immutable = True
+        response.expires = None
+    else:
+        # Cached copies must be revalidated (If-None-Match -> 304)
+        cache_control.no_cache = True
+        cache_control.max_age = 0
+    return response
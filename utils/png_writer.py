@@ -0,0 +1,115 @@
+"""
+Streaming PNG encoder.
+
+Pillow can only encode a complete image, so very large renders (print-resolution
+collages) are written band by band with this writer instead: rows go through
+zlib as they arrive and compressed data is flushed to the file in IDAT chunks,
+so memory use does not depend on the image height.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# mode -> (PNG color type, channels)
+COLOR_TYPES = {
+    "L": (0, 1),
+    "RGB": (2, 3),
+    "RGBA": (6, 4),
+}
+
+
+class PNGStreamWriter:
+    """
+    Write an 8-bit PNG to a binary file object, a band of rows at a time.
+
+    Usage:
+        with PNGStreamWriter(f, width, height, mode="RGB", dpi=300) as png:
+            for band in bands:
+                png.write_rows(band)  # HxWx3 uint8 array or PIL image
+    """
+
+    def __init__(self, fileobj, width, height, mode="RGB", dpi=None,
+                 compress_level=6, chunk_size=256 * 1024):
+        if mode not in COLOR_TYPES:
+            raise ValueError(f"Unsupported PNG mode '{mode}'")
+        if width <= 0 or height <= 0:
+            raise ValueError("PNG size must be positive")
+        self.fileobj = fileobj
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_bytes = 0
+
+        color_type, self._channels = COLOR_TYPES[mode]
+        self.fileobj.write(PNG_SIGNATURE)
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+        if dpi:
+            # pHYs: pixels per meter, unit 1 = meter
+            ppm = int(round(dpi / 0.0254))
+            self._write_chunk(b"pHYs", struct.pack(">IIB", ppm, ppm, 1))
+
+    def write_rows(self, rows):
+        """
+        Append rows to the image.
+
+        Args:
+            rows: PIL image in self.mode or HxWxC uint8 numpy array, W == self.width
+        """
+        arr = np.asarray(rows, dtype=np.uint8)
+        if arr.ndim == 2:
+            arr = arr[..., None]
+        if arr.shape[1] != self.width or arr.shape[2] != self._channels:
+            raise ValueError(f"Expected rows of shape (n, {self.width}, {self._channels}), got {arr.shape}")
+        if self.rows_written + arr.shape[0] > self.height:
+            raise ValueError("More rows than the image height")
+
+        # Filter type 0 (None) in front of every scanline
+        scanlines = np.zeros((arr.shape[0], self.width * self._channels + 1), dtype=np.uint8)
+        scanlines[:, 1:] = arr.reshape(arr.shape[0], -1)
+        self._add(self._compressor.compress(scanlines.tobytes()))
+        self.rows_written += arr.shape[0]
+
+    def close(self):
+        """Flush the compressor and write IEND; raises ValueError if rows are missing"""
+        if self._compressor is None:
+            return
+        if self.rows_written != self.height:
+            raise ValueError(f"Wrote {self.rows_written} of {self.height} rows")
+        self._add(self._compressor.flush())
+        self._compressor = None
+        self._flush_idat()
+        self._write_chunk(b"IEND", b"")
+
+    def _add(self, data):
+        if data:
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+        if self._pending_bytes >= self.chunk_size:
+            self._flush_idat()
+
+    def _flush_idat(self):
+        if self._pending:
+            self._write_chunk(b"IDAT", b"".join(self._pending))
+            self._pending = []
+            self._pending_bytes = 0
+
+    def _write_chunk(self, chunk_type, data):
+        self.fileobj.write(struct.pack(">I", len(data)))
+        self.fileobj.write(chunk_type)
+        self.fileobj.write(data)
+        self.fileobj.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        return False